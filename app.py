@@ -1,9 +1,17 @@
 from flask import Flask, request, render_template, make_response, redirect, jsonify
 from datetime import date
+import secrets
+import arranque
+import cache
+import monitoreo
+import perfil
 import recomendar
 
 app = Flask(__name__)
 app.debug = True
+perfil.instalar(app)
+monitoreo.instalar(app, recomendar.ESCRITOR)
+arranque.instalar(app) # migraciones, snapshot de modelos, templates y /ready
 
 LAST_UPDATE = "09/11/2025"
 ALGORITHMS = {
@@ -44,8 +52,7 @@ def get_recomendaciones():
         recomendar.insertar_review(id_recipe, name, 0)
 
     recipes_recomendados = recomendar.datos_recipes(id_recipes)
-    cant_valorados = len(recomendar.items_valorados(name))
-    cant_vistos = len(recomendar.items_vistos(name))
+    cant_valorados, cant_vistos = recomendar.contadores_usuario(name)
 
     return render_template("recomendaciones.html", recipes_recomendados=recipes_recomendados, name=name, cant_valorados=cant_valorados, cant_vistos=cant_vistos, LAST_UPDATE=LAST_UPDATE)
 
@@ -68,8 +75,7 @@ def get_recomendaciones_recipes(receipe_id):
         recomendar.insertar_review(id_recipe, name, 0)
 
     recipes_recomendados = recomendar.datos_recipes(id_recipes)
-    cant_valorados = len(recomendar.items_valorados(name))
-    cant_vistos = len(recomendar.items_vistos(name))
+    cant_valorados, cant_vistos = recomendar.contadores_usuario(name)
 
     recipe = recomendar.obtener_receta(receipe_id)
 
@@ -108,6 +114,61 @@ def api_buscar_recetas():
         for r in results[:10]
     ])
 
+### API de recomendaciones paginada (scroll infinito) ###
+# el ranking se calcula una vez por sesión y se guarda en memoria; el cursor es "<id de ranking>:<offset>"
+RANKINGS = cache.CacheLRU("rankings", maximo=10000)
+CAMPOS_API = ["recipe_id", "title", "description", "image_url", "category", "rating", "num_ratings",
+              "total_time", "author_id", "author_name"]
+
+@app.get('/api/recomendaciones')
+def api_recomendaciones():
+    name = request.cookies.get('name')
+    if not name:
+        return jsonify({"error": "sin usuario"}), 401
+
+    n = max(1, min(request.args.get('n', 16, type=int), 50))
+    ranking_id, _, offset = request.args.get('cursor', '').partition(':')
+    offset = int(offset) if offset.isdigit() else 0
+
+    guardado, _ = RANKINGS.obtener_muchos([ranking_id]) if ranking_id else ({}, None)
+    if ranking_id in guardado and guardado[ranking_id][0] == name:
+        id_recipes = guardado[ranking_id][1]
+    else:
+        # sin cursor, o el ranking expiró: calculo uno nuevo (ya excluye lo que se entregó antes)
+        id_recipes = recomendar.recomendar(name, N=recomendar.N_RANKING)
+        ranking_id = secrets.token_urlsafe(8)
+        offset = 0
+        RANKINGS.guardar_muchos({ranking_id: (name, id_recipes)})
+
+    pagina = id_recipes[offset:offset + n]
+
+    # solo se registran como vistas las recetas que efectivamente se entregan
+    recomendar.insertar_impresiones(pagina, name)
+
+    fin = offset + len(pagina)
+    return jsonify({
+        "recetas": [{campo: getattr(r, campo, None) for campo in CAMPOS_API} for r in recomendar.datos_recipes(pagina)],
+        "cursor": f"{ranking_id}:{fin}" if fin < len(id_recipes) else None,
+    })
+
+### Filtro y similitud por ingredientes (ver ingredientes.py) ###
+@app.get('/api/recetas_por_ingredientes')
+def api_recetas_por_ingredientes():
+    # ?con=egg,flour&sin=walnut
+    con = [i for i in request.args.get('con', '').split(',') if i.strip()]
+    sin = [i for i in request.args.get('sin', '').split(',') if i.strip()]
+    n = max(1, min(request.args.get('n', 16, type=int), 50))
+
+    id_recipes = recomendar.recetas_con_ingredientes(con, sin, N=n)
+    return jsonify([{campo: getattr(r, campo, None) for campo in CAMPOS_API} for r in recomendar.datos_recipes(id_recipes)])
+
+@app.get('/api/similares/<int:recipe_id>')
+def api_similares(recipe_id):
+    n = max(1, min(request.args.get('n', 8, type=int), 50))
+
+    id_recipes = recomendar.similares_por_ingredientes(recipe_id, N=n)
+    return jsonify([{campo: getattr(r, campo, None) for campo in CAMPOS_API} for r in recomendar.datos_recipes(id_recipes)])
+
 @app.context_processor
 def inject_globals():
     return {
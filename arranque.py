@@ -0,0 +1,80 @@
+## Arranque: deja todo listo antes del primer request
+#
+# En PythonAnywhere (o con gunicorn --max-requests) los workers se reciclan
+# seguido, y sin esto el primer request después de cada reinicio pagaba
+# mapear los modelos, compilar los templates y traer las recetas populares.
+# instalar(app) hace todo eso al importar la app, loguea cuánto tardó cada
+# componente y expone /ready para que un health check no mande tráfico antes.
+#
+# Las migraciones también corren acá, pero si la base todavía no existe se
+# vuelven a intentar antes de cada request hasta que aparezca.
+#
+# El snapshot (catálogo, ranking de top_n, índice de búsqueda y vecinos de
+# pares) es la última generación que arma offline `python modelos.py`.
+
+import time
+
+from flask import jsonify
+
+import migraciones
+import recarga
+import recomendar
+
+RECETAS_POPULARES = 500  # cuántas de las más populares se precargan en la caché de recetas
+
+ESTADO = {"listo": False, "migrada": False, "generacion": None, "componentes": {}, "errores": {}}
+
+###
+
+def _componente(nombre, funcion):
+    inicio = time.perf_counter()
+    try:
+        funcion()
+    except Exception as e: # un componente que falla no frena el arranque: la app cae a SQL
+        ESTADO["errores"][nombre] = str(e)
+        print(f"⚠️ Arranque: {nombre} falló: {e}")
+    ESTADO["componentes"][nombre] = round((time.perf_counter() - inicio) * 1000, 2)
+
+def _migrar():
+    if migraciones.aplicar_db(recomendar.DATABASE_FILE) is not None:
+        ESTADO["migrada"] = True
+
+def _templates(app):
+    for nombre in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nombre) # compila y queda en la caché de jinja
+
+def _recetas_populares():
+    generacion = recarga.actual()
+    if generacion is not None:
+        recomendar.datos_recipes(list(generacion.ranking[:RECETAS_POPULARES]))
+
+def calentar(app, directorio=None, intervalo=recarga.INTERVALO):
+    inicio = time.perf_counter()
+    _componente("migraciones", _migrar)
+    _componente("modelos", lambda: recarga.instalar(app, directorio, intervalo))
+    generacion = recarga.actual()
+    if generacion is not None:
+        ESTADO["generacion"] = generacion.nombre
+        ESTADO["componentes"].update({f"modelos.{c}": ms for c, ms in generacion.tiempos.items()})
+    else:
+        print("⚠️ Arranque: no hay snapshot de modelos (correr `python modelos.py`), se sirve con SQL")
+    _componente("templates", lambda: _templates(app))
+    _componente("recetas", _recetas_populares)
+    ESTADO["listo"] = True
+
+    detalle = ", ".join(f"{c} {ms} ms" for c, ms in ESTADO["componentes"].items())
+    print(f"🚀 Arranque listo en {(time.perf_counter() - inicio) * 1000:.1f} ms ({detalle})")
+
+def instalar(app, directorio=None, intervalo=recarga.INTERVALO):
+    @app.before_request
+    def _migrar_pendiente():
+        if not ESTADO["migrada"]:
+            _migrar()
+
+    @app.get('/ready')
+    def ready():
+        generacion = recarga.actual()
+        estado = dict(ESTADO, generacion=generacion.nombre if generacion is not None else None)
+        return jsonify(estado), 200 if ESTADO["listo"] else 503
+
+    calentar(app, directorio, intervalo)
@@ -0,0 +1,300 @@
+## Artefactos de modelos mapeados en memoria, compartidos entre workers
+#
+# Un artefacto es un único archivo con arreglos numéricos y tablas de textos
+# (ids de recetas, títulos, rankings, vecinos, matrices de factores...). Se
+# abre con mmap de solo lectura y cada arreglo es un memoryview sobre el mapa:
+# no se copia nada, así que todos los workers de gunicorn comparten las mismas
+# páginas físicas (el page cache del sistema) y abrirlo tarda milisegundos.
+#
+# Formato:
+#   "RMART1\0\0" | largo del índice (8 bytes) | índice JSON | secciones alineadas a 64 bytes
+# El índice describe cada sección: {"nombre": {"tipo", "offset", "bytes", "forma"}}.
+# Los tipos son los códigos de array/struct ("q" int64, "i" int32, "d" float64);
+# las tablas de textos se guardan como offsets ("q") + un blob utf-8.
+#
+# modelos.py arma los artefactos de los recomendadores y recarga.py los sirve.
+
+import array
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+
+MAGIA = b"RMART1\0\0"
+ALINEACION = 64
+
+###
+
+def escribir(path, arreglos=None, textos=None, meta=None):
+    """Escribe un artefacto de forma atómica.
+
+    arreglos: {nombre: (tipo, valores) o (tipo, valores, forma)} - forma para matrices, ej. (filas, columnas)
+    textos: {nombre: [str, ...]}
+    """
+    secciones = []
+    for nombre, spec in (arreglos or {}).items():
+        tipo, valores = spec[0], spec[1]
+        datos = array.array(tipo, valores)
+        forma = list(spec[2]) if len(spec) > 2 else [len(datos)]
+        secciones.append((nombre, tipo, forma, datos.tobytes()))
+    for nombre, lista in (textos or {}).items():
+        codificados = [t.encode() if t is not None else b"" for t in lista]
+        offsets = array.array("q", [0])
+        for c in codificados:
+            offsets.append(offsets[-1] + len(c))
+        secciones.append((nombre + ".offsets", "q", [len(offsets)], offsets.tobytes()))
+        secciones.append((nombre + ".blob", "B", [offsets[-1]], b"".join(codificados)))
+
+    # el índice necesita los offsets, que dependen del largo del índice: se calcula con un largo fijo holgado
+    indice = {"meta": meta or {}, "secciones": {}}
+    reserva = len(json.dumps({"meta": meta or {}, "secciones": {s[0]: {"tipo": "q", "offset": 2**62, "bytes": 2**62, "forma": s[2]} for s in secciones}})) + 16
+    posicion = _alinear(len(MAGIA) + 8 + reserva)
+    for nombre, tipo, forma, datos in secciones:
+        indice["secciones"][nombre] = {"tipo": tipo, "offset": posicion, "bytes": len(datos), "forma": forma}
+        posicion = _alinear(posicion + len(datos))
+    cabecera = json.dumps(indice).encode().ljust(reserva)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIA + struct.pack("Q", len(cabecera)) + cabecera)
+        for nombre, _, _, datos in secciones:
+            f.seek(indice["secciones"][nombre]["offset"])
+            f.write(datos)
+        f.truncate(max(posicion, f.tell()))
+    os.replace(tmp, path)
+
+def _alinear(n):
+    return (n + ALINEACION - 1) // ALINEACION * ALINEACION
+
+class TablaTextos:
+    """Lista de strings de solo lectura sobre el mapa; decodifica cada elemento recién cuando se pide."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+class Artefacto:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIA)] != MAGIA:
+            raise ValueError(f"{path} no es un artefacto de modelos")
+        largo = struct.unpack_from("Q", self.mm, len(MAGIA))[0]
+        inicio = len(MAGIA) + 8
+        indice = json.loads(bytes(self.mm[inicio:inicio + largo]))
+        self.meta = indice["meta"]
+        self.secciones = indice["secciones"]
+        self.vista = memoryview(self.mm)
+
+    def arreglo(self, nombre):
+        """memoryview tipado (sin copia). Las matrices se devuelven planas; la forma está en forma(nombre)."""
+        s = self.secciones[nombre]
+        return self.vista[s["offset"]:s["offset"] + s["bytes"]].cast(s["tipo"])
+
+    def forma(self, nombre):
+        return tuple(self.secciones[nombre]["forma"])
+
+    def textos(self, nombre):
+        return TablaTextos(self.arreglo(nombre + ".offsets"), self.arreglo(nombre + ".blob"))
+
+    def rango(self, nombre):
+        """(inicio, fin) de la sección en el archivo."""
+        s = self.secciones[nombre]
+        return s["offset"], s["offset"] + s["bytes"]
+
+    def calentar(self, prefijo=""):
+        """Trae al page cache las secciones que empiezan con `prefijo`. Devuelve los bytes recorridos.
+
+        Así el primer request no paga los page faults de leer el archivo desde el disco.
+        """
+        total = 0
+        for nombre in self.secciones:
+            if not nombre.startswith(prefijo):
+                continue
+            inicio, fin = self.rango(nombre)
+            if fin <= inicio:
+                continue
+            if hasattr(mmap, "MADV_WILLNEED"):
+                desde = inicio - inicio % mmap.PAGESIZE
+                self.mm.madvise(mmap.MADV_WILLNEED, desde, fin - desde)
+            for i in range(inicio, fin, mmap.PAGESIZE):
+                self.mm[i]  # un byte por página alcanza para cargarla
+            total += fin - inicio
+        return total
+
+    def __contains__(self, nombre):
+        return nombre in self.secciones or nombre + ".offsets" in self.secciones
+
+    def cerrar(self):
+        # solo se puede cerrar si nadie conserva vistas; si no, el mapa se libera cuando se recolecten
+        try:
+            self.vista.release()
+            self.mm.close()
+        except BufferError:
+            pass
+
+###
+
+class Catalogo:
+    """recipe_id -> posición por búsqueda binaria sobre los ids ordenados (sin armar un dict al arrancar)."""
+
+    def __init__(self, artefacto):
+        self.ids = artefacto.arreglo("recipes.ids")
+        self.titulos = artefacto.textos("recipes.titulos")
+
+    def posicion(self, recipe_id):
+        i = bisect.bisect_left(self.ids, recipe_id)
+        return i if i < len(self.ids) and self.ids[i] == recipe_id else None
+
+    def titulo(self, recipe_id):
+        i = self.posicion(recipe_id)
+        return self.titulos[i] if i is not None else None
+
+class VecinosCSR:
+    """Vecinos de pares en formato CSR; se usa igual que el dict de modelos.entrenar_pares (con .get)."""
+
+    def __init__(self, artefacto, catalogo):
+        self.catalogo = catalogo
+        self.indptr = artefacto.arreglo("pares.indptr")
+        self.indices = artefacto.arreglo("pares.indices")
+        self.cantidades = artefacto.arreglo("pares.cantidades")
+
+    def get(self, recipe_id, defecto=()):
+        i = self.catalogo.posicion(recipe_id)
+        if i is None:
+            return defecto
+        desde, hasta = self.indptr[i], self.indptr[i + 1]
+        return list(zip(self.indices[desde:hasta], self.cantidades[desde:hasta]))
+
+class IndiceBusqueda:
+    """Búsqueda por substring en los títulos (como el LIKE '%q%' de recomendar.buscar_recetas).
+
+    Los títulos están en minúscula, de la receta más valorada a la menos, en un
+    único blob separado por \\n: mmap.find recorre el blob en C y corta apenas
+    junta `limite` resultados, que ya salen ordenados por popularidad.
+    """
+
+    def __init__(self, artefacto):
+        self.mm = artefacto.mm
+        self.ids = artefacto.arreglo("busqueda.ids")
+        self.offsets = artefacto.arreglo("busqueda.titulos.offsets")
+        self.inicio, self.fin = artefacto.rango("busqueda.titulos.blob")
+
+    def buscar(self, texto, limite):
+        patron = texto.lower().encode()
+        if not patron or b"\n" in patron:
+            return []
+        ids = []
+        pos = self.inicio
+        while len(ids) < limite:
+            pos = self.mm.find(patron, pos, self.fin)
+            if pos < 0:
+                break
+            i = bisect.bisect_right(self.offsets, pos - self.inicio) - 1
+            ids.append(self.ids[i])
+            pos = self.inicio + self.offsets[i + 1]  # sigo en el título siguiente
+        return ids
+
+class IndiceIngredientes:
+    """Índice invertido ingrediente -> recetas, con cada posting list como arreglo ordenado de posiciones del catálogo.
+
+    Filtrar por ingredientes es intersecar esos arreglos: se recorre el más
+    corto y se busca cada posición en los otros con bisect, avanzando siempre
+    hacia adelante (o con un set, si los largos son parecidos). La similitud entre recetas suma el idf de los ingredientes
+    compartidos recorriendo solo las listas de los ingredientes de la receta.
+    Los nombres van normalizados (ingredientes.normalizar).
+    """
+
+    MAX_LISTA = 20000  # para similitud no se recorren los ingredientes de más recetas que esto (sal, agua)
+
+    def __init__(self, artefacto, catalogo):
+        self.catalogo = catalogo
+        self.num_ratings = artefacto.arreglo("recipes.num_ratings")
+        self.nombres = artefacto.textos("ingredientes.nombres")
+        self.indptr = artefacto.arreglo("ingredientes.indptr")
+        self.recetas = artefacto.arreglo("ingredientes.recetas")
+        self.idf = artefacto.arreglo("ingredientes.idf")
+        self.directo_indptr = artefacto.arreglo("recetas_ingredientes.indptr")
+        self.directo = artefacto.arreglo("recetas_ingredientes.ids")
+        self.pesos = artefacto.arreglo("recetas_ingredientes.pesos")
+
+    def ingrediente(self, nombre):
+        """Posición del ingrediente en el vocabulario del artefacto, o None."""
+        k = bisect.bisect_left(self.nombres, nombre)
+        return k if k < len(self.nombres) and self.nombres[k] == nombre else None
+
+    def lista(self, k):
+        return self.recetas[self.indptr[k]:self.indptr[k + 1]]
+
+    def ingredientes_de(self, recipe_id):
+        i = self.catalogo.posicion(recipe_id)
+        if i is None:
+            return []
+        return [self.nombres[k] for k in self.directo[self.directo_indptr[i]:self.directo_indptr[i + 1]]]
+
+    def filtrar(self, incluidos, excluidos=(), limite=None):
+        """recipe_id de las recetas con todos los `incluidos` y ninguno de los `excluidos`, las más valoradas primero."""
+        listas = []
+        for nombre in incluidos:
+            k = self.ingrediente(nombre)
+            if k is None:
+                return []
+            listas.append(self.lista(k))
+        if not listas:
+            return []
+        listas.sort(key=len)
+        posiciones = listas[0]
+        for otra in listas[1:]:
+            posiciones = _interseccion(posiciones, otra)
+        for nombre in excluidos:
+            k = self.ingrediente(nombre)
+            if k is not None:
+                posiciones = _interseccion(posiciones, self.lista(k), excluir=True)
+
+        clave = lambda i: (-self.num_ratings[i], i)  # como el ORDER BY num_ratings DESC, recipe_id del SQL
+        orden = heapq.nsmallest(limite, posiciones, key=clave) if limite else sorted(posiciones, key=clave)
+        return [self.catalogo.ids[i] for i in orden]
+
+    def similares(self, recipe_id, limite, excluir=()):
+        """Las `limite` recetas más parecidas por ingredientes: Jaccard pesado por idf."""
+        i = self.catalogo.posicion(recipe_id)
+        if i is None:
+            return []
+        comunes = {}
+        for k in self.directo[self.directo_indptr[i]:self.directo_indptr[i + 1]]:
+            desde, hasta = self.indptr[k], self.indptr[k + 1]
+            if hasta - desde > self.MAX_LISTA:
+                continue
+            peso = self.idf[k]
+            for otra in self.recetas[desde:hasta]:
+                comunes[otra] = comunes.get(otra, 0.0) + peso
+        comunes.pop(i, None)
+
+        propio = self.pesos[i]
+        puntaje = lambda item: item[1] / (propio + self.pesos[item[0]] - item[1] or 1.0)
+        candidatos = ((otra, comun) for otra, comun in comunes.items() if self.catalogo.ids[otra] not in excluir)
+        return [self.catalogo.ids[otra] for otra, _ in heapq.nlargest(limite, candidatos, key=puntaje)]
+
+def _interseccion(corta, larga, excluir=False):
+    """Posiciones de `corta` que están (o, con excluir, que no están) en `larga`; las dos ordenadas."""
+    if len(larga) < 8 * len(corta):
+        # largos parecidos: armar el set en C sale más barato que un bisect por elemento
+        presentes = set(larga)
+        return [x for x in corta if (x in presentes) != excluir]
+    res, desde = [], 0
+    for x in corta:
+        desde = bisect.bisect_left(larga, x, desde)
+        if (desde < len(larga) and larga[desde] == x) != excluir:
+            res.append(x)
+    return res
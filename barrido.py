@@ -0,0 +1,245 @@
+## Barrido de hiperparámetros con caché de modelos entrenados
+#
+# Entrena cada configuración una sola vez y guarda el artefacto bajo una clave
+# hecha con el hash de la configuración + el hash del snapshot de datos + el
+# split de evaluación. Las configuraciones se evalúan en paralelo sobre el
+# mismo split cacheado (NDCG como recomendar.test, más cobertura, Gini,
+# diversidad y novedad), y si se corta el barrido, al relanzarlo se saltea
+# todo lo que ya tiene resultado.
+#
+# Uso:
+#   python barrido.py --usuarios 200 --procesos 4
+#   python barrido.py --algoritmos pares --salida barrido.json
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metricas
+import modelos
+import recomendar
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "barrido_cache")
+MIN_VALORACIONES = 20  # usuarios con al menos tantas valoraciones entran al split
+USUARIOS = 200
+CORTE = 0.8            # mismo corte training/testing que recomendar.test
+N = 20
+
+# grilla por algoritmo: se prueban todas las combinaciones
+ESPACIO = {
+    "azar": {"seed": [0, 1, 2]},
+    "top_n": {"min_ratings": [0, 5, 20]},
+    "pares": {"umbral": [2, 3, 4], "vecinos": [20, 50, 200], "max_por_usuario": [200]},
+}
+
+###
+
+def clave(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()[:16]
+
+def huella_datos(db):
+    """Hash barato del snapshot de datos: cambia si se agregan/borran/modifican reviews o recetas."""
+    con = sqlite3.connect(db)
+    reviews = con.execute("SELECT count(*), coalesce(max(rowid), 0), coalesce(sum(rating), 0) FROM reviews").fetchone()
+    recipes = con.execute("SELECT count(*), coalesce(max(recipe_id), 0), coalesce(sum(num_ratings), 0) FROM recipes").fetchone()
+    con.close()
+    return clave([list(reviews), list(recipes)])
+
+def configuraciones(algoritmos):
+    for alg in algoritmos:
+        grilla = ESPACIO[alg]
+        for valores in itertools.product(*grilla.values()):
+            yield alg, dict(zip(grilla.keys(), valores))
+
+def _guardar(path, obj):
+    """Escritura atómica: un barrido cortado a la mitad nunca deja un artefacto a medio escribir."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def _cargar(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+###
+
+def crear_split(db, huella, usuarios=USUARIOS, seed=0, cache_dir=CACHE_DIR):
+    """{author: (training, {recipe_id: rating} de testing)}, cacheado por datos + parámetros."""
+    split_key = clave({"datos": huella, "usuarios": usuarios, "min": MIN_VALORACIONES, "corte": CORTE, "seed": seed})
+    path = os.path.join(cache_dir, "splits", f"{split_key}.pkl")
+    if os.path.exists(path):
+        return split_key, path
+
+    rnd = random.Random(seed)
+    con = sqlite3.connect(db)
+    autores = [r[0] for r in con.execute(
+        "SELECT author FROM reviews WHERE rating > 0 GROUP BY author HAVING count(*) >= ? ORDER BY author",
+        (MIN_VALORACIONES,))]
+    if usuarios:  # 0 = toda la población
+        autores = rnd.sample(autores, min(usuarios, len(autores)))
+
+    split = {}
+    for author in autores:
+        valorados = con.execute("SELECT recipe_id, rating FROM reviews WHERE author = ? AND rating > 0", (author,)).fetchall()
+        rnd.shuffle(valorados)
+        corte = int(len(valorados) * CORTE)
+        split[author] = ([r[0] for r in valorados[:corte]], dict(valorados[corte:]))
+    con.close()
+
+    _guardar(path, split)
+    return split_key, path
+
+def crear_contexto(db, huella, cache_dir=CACHE_DIR):
+    """Lo que necesitan las métricas poblacionales; depende solo de los datos, así que se cachea por huella."""
+    path = os.path.join(cache_dir, "contexto", f"{huella}.pkl")
+    if os.path.exists(path):
+        return path
+
+    con = sqlite3.connect(db)
+    try:
+        popularidad, cant_usuarios = modelos.popularidad(con)
+        contexto = {
+            "catalogo": con.execute("SELECT count(*) FROM recipes").fetchone()[0],
+            "popularidad": popularidad,
+            "usuarios": cant_usuarios,
+            "mascaras": metricas.feature_masks(modelos.atributos(con)),
+        }
+    finally:
+        con.close()
+    _guardar(path, contexto)
+    return path
+
+def entrenar(db, alg, params, split):
+    con = sqlite3.connect(db)
+    try:
+        if alg == "top_n":
+            return {"ranking": modelos.entrenar_top_n(con, params["min_ratings"])}
+        if alg == "pares":
+            excluir = {(author, recipe_id) for author, (_, testing) in split.items() for recipe_id in testing}
+            return {
+                "ranking": modelos.entrenar_top_n(con),
+                "vecinos": modelos.entrenar_pares(con, params["umbral"], params["vecinos"],
+                                                  params["max_por_usuario"], excluir),
+            }
+        return {"recipes": [r[0] for r in con.execute("SELECT recipe_id FROM recipes")]}
+    finally:
+        con.close()
+
+def recomendar_con(alg, params, modelo, training, rnd, n):
+    conocidos = set(training)
+    if alg == "top_n":
+        return modelos.recomendar_top_n(modelo["ranking"], conocidos, n)
+    if alg == "pares":
+        return modelos.recomendar_pares(modelo["vecinos"], modelo["ranking"], training, conocidos, n)
+    candidatos = [r for r in modelo["recipes"] if r not in conocidos]
+    return rnd.sample(candidatos, min(n, len(candidatos)))
+
+def evaluar_config(db, alg, params, huella, split_key, split_path, contexto_path, n=N, cache_dir=CACHE_DIR):
+    """Entrena (o levanta de caché) una configuración y la evalúa sobre el split. Corre en un proceso aparte."""
+    key = clave({"algoritmo": alg, "params": params, "datos": huella, "split": split_key})
+    path_resultado = os.path.join(cache_dir, "resultados", f"{key}.json")
+    if os.path.exists(path_resultado):
+        with open(path_resultado) as f:
+            return json.load(f)
+
+    split = _cargar(split_path)
+
+    path_modelo = os.path.join(cache_dir, "modelos", f"{key}.pkl")
+    inicio = time.perf_counter()
+    if os.path.exists(path_modelo):
+        modelo = _cargar(path_modelo)
+    else:
+        modelo = entrenar(db, alg, params, split)
+        _guardar(path_modelo, modelo)
+    t_entrenamiento = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    rnd = random.Random(params.get("seed", 0))
+    scores, aciertos, recomendaciones = [], 0, {}
+    for author, (training, testing) in split.items():
+        recomendacion = recomendar_con(alg, params, modelo, training, rnd, n)
+        recomendaciones[author] = recomendacion
+        relevance_scores = [testing.get(recipe_id, 0) for recipe_id in recomendacion]
+        scores.append(metricas.normalized_discounted_cumulative_gain(relevance_scores))
+        aciertos += sum(1 for r in relevance_scores if r > 0)
+
+    contexto = _cargar(contexto_path)
+    poblacionales = {
+        "cobertura": metricas.catalog_coverage(recomendaciones, contexto["catalogo"]),
+        "gini": metricas.gini_index(recomendaciones, contexto["catalogo"]),
+        "diversidad": metricas.intra_list_diversity(recomendaciones, contexto["mascaras"]),
+        "novedad": metricas.novelty(recomendaciones, contexto["popularidad"], contexto["usuarios"]),
+    }
+    t_evaluacion = time.perf_counter() - inicio
+
+    resultado = {
+        "clave": key,
+        "algoritmo": alg,
+        "params": params,
+        "ndcg": sum(scores) / len(scores) if scores else 0.0,
+        "precision": aciertos / (n * len(split)) if split else 0.0,
+        **poblacionales,
+        "usuarios": len(split),
+        "entrenamiento_s": round(t_entrenamiento, 3),
+        "evaluacion_s": round(t_evaluacion, 3),
+    }
+    os.makedirs(os.path.dirname(path_resultado), exist_ok=True)
+    with open(path_resultado + ".tmp", "w") as f:
+        json.dump(resultado, f)
+    os.replace(path_resultado + ".tmp", path_resultado)
+    return resultado
+
+def barrer(db, algoritmos, usuarios=USUARIOS, procesos=None, n=N, cache_dir=CACHE_DIR):
+    huella = huella_datos(db)
+    split_key, split_path = crear_split(db, huella, usuarios, cache_dir=cache_dir)
+    contexto_path = crear_contexto(db, huella, cache_dir)
+    print(f"📊 Datos {huella} | split {split_key}")
+
+    resultados = []
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = {pool.submit(evaluar_config, db, alg, params, huella, split_key, split_path,
+                               contexto_path, n, cache_dir): (alg, params)
+                   for alg, params in configuraciones(algoritmos)}
+        for futuro in as_completed(futuros):
+            alg, params = futuros[futuro]
+            try:
+                res = futuro.result()
+            except Exception as e:
+                print(f"❌ {alg} {params}: {e}")
+                continue
+            resultados.append(res)
+            print(f"  {alg:>6} {json.dumps(params, sort_keys=True):<55} NDCG {res['ndcg']:.6f} "
+                  f"| P@{n} {res['precision']:.4f} | cobertura {res['cobertura']:.4f} | gini {res['gini']:.4f} "
+                  f"| diversidad {res['diversidad']:.4f} | novedad {res['novedad']:.2f} | entrenamiento {res['entrenamiento_s']}s")
+
+    resultados.sort(key=lambda r: r["ndcg"], reverse=True)
+    return {"datos": huella, "split": split_key, "n": n, "resultados": resultados}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Barrido de hiperparámetros de los recomendadores")
+    parser.add_argument("--db", default=recomendar.DATABASE_FILE)
+    parser.add_argument("--algoritmos", nargs="+", default=list(ESPACIO))
+    parser.add_argument("--usuarios", type=int, default=USUARIOS, help="usuarios en el split de evaluación (0 = todos)")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--salida", default=None, help="archivo JSON con el resumen")
+    args = parser.parse_args()
+
+    resumen = barrer(args.db, args.algoritmos, args.usuarios, args.procesos, cache_dir=args.cache)
+    mejor = resumen["resultados"][0] if resumen["resultados"] else None
+    if mejor:
+        print(f"🏆 Mejor: {mejor['algoritmo']} {mejor['params']} NDCG {mejor['ndcg']:.6f}")
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resumen, f, indent=2)
+        print(f"📝 Resumen guardado en {args.salida}")
@@ -0,0 +1,143 @@
+## Benchmark de latencia/throughput de los algoritmos de recomendación
+#
+# Para cada algoritmo de recomendar.ALGORITHM_FUNCTIONS mide p50/p95/p99 de
+# latencia y usuarios por segundo, variando el tamaño del catálogo y la
+# cantidad de valoraciones del usuario. El resultado se guarda en JSON para
+# poder comparar entre versiones.
+#
+# Uso:
+#   python benchmark.py --catalogos 10000 100000 1000000 --salida benchmark.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+import generar_datos
+import recomendar
+
+CATALOGOS = [10_000, 100_000, 1_000_000]
+VALORACIONES = [0, 10, 100, 1000]
+USUARIOS_POR_CASO = 20
+REVIEWS_FONDO_POR_RECETA = 2  # reviews de otros usuarios, para que "pares" tenga co-ocurrencias
+N = 16
+
+###
+
+def crear_db(path, cant_recipes, valoraciones, usuarios_por_caso, seed=0):
+    """Genera un catálogo sintético y le agrega los usuarios del benchmark: bench_<valoraciones>_<i>."""
+    generar_datos.generar(path, recetas=cant_recipes, usuarios=max(cant_recipes // 20, 1),
+                          reviews=cant_recipes * REVIEWS_FONDO_POR_RECETA, detalles=0, seed=seed)
+
+    rnd = random.Random(seed)
+    con = sqlite3.connect(path)
+    usuarios = {}
+    for k in valoraciones:
+        nombres = [f"bench_{k}_{i}" for i in range(usuarios_por_caso)]
+        usuarios[k] = nombres
+        con.executemany("INSERT INTO users(name) VALUES (?)", [(n,) for n in nombres])
+        for nombre in nombres:
+            ids = rnd.sample(range(1, cant_recipes + 1), min(k, cant_recipes))
+            con.executemany("INSERT INTO reviews(recipe_id, author, rating) VALUES (?, ?, ?)",
+                            [(i, nombre, rnd.randint(1, 5)) for i in ids])
+    con.commit()
+    con.close()
+    return usuarios
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return None
+    idx = max(0, min(len(valores) - 1, round(p / 100 * len(valores) + 0.5) - 1))
+    return valores[idx]
+
+def medir(func, usuarios, n=N):
+    """Mide el flujo completo de recomendar() para cada usuario: carga de datos + algoritmo."""
+    latencias = []
+    errores = []
+    for nombre in usuarios:
+        inicio = time.perf_counter()
+        try:
+            relevantes = recomendar.items_valorados(nombre)
+            desconocidos = recomendar.items_desconocidos(nombre)
+            func(nombre, relevantes, desconocidos, n)
+        except Exception as e:
+            errores.append(f"{type(e).__name__}: {e}")
+            continue
+        latencias.append(time.perf_counter() - inicio)
+
+    latencias.sort()
+    total = sum(latencias)
+    return {
+        "usuarios": len(usuarios),
+        "p50_ms": _ms(percentil(latencias, 50)),
+        "p95_ms": _ms(percentil(latencias, 95)),
+        "p99_ms": _ms(percentil(latencias, 99)),
+        "usuarios_por_seg": round(len(latencias) / total, 2) if total > 0 else None,
+        "errores": len(errores),
+        "error": errores[0] if errores else None,
+    }
+
+def _ms(segundos):
+    return round(segundos * 1000, 3) if segundos is not None else None
+
+def _version():
+    try:
+        res = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return res.stdout.strip() or None
+    except OSError:
+        return None
+
+def correr(catalogos, valoraciones, usuarios_por_caso, algoritmos):
+    resultados = []
+    db_original = recomendar.DATABASE_FILE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for cant_recipes in catalogos:
+            path = os.path.join(tmp, f"bench_{cant_recipes}.db")
+            print(f"📦 Generando catálogo de {cant_recipes} recetas...")
+            usuarios = crear_db(path, cant_recipes, valoraciones, usuarios_por_caso)
+            recomendar.DATABASE_FILE = path
+            try:
+                for k in valoraciones:
+                    for alg in algoritmos:
+                        func = recomendar.ALGORITHM_FUNCTIONS[alg]
+                        res = medir(func, usuarios[k])
+                        res.update({"algoritmo": alg, "catalogo": cant_recipes, "valoraciones": k})
+                        resultados.append(res)
+                        print(f"  {alg:>6} | catálogo {cant_recipes:>8} | {k:>4} valoraciones | "
+                              f"p50 {res['p50_ms']} ms | p95 {res['p95_ms']} ms | p99 {res['p99_ms']} ms | "
+                              f"{res['usuarios_por_seg']} usr/s | errores {res['errores']}")
+            finally:
+                recomendar.DATABASE_FILE = db_original
+                os.remove(path)
+
+    return {
+        "version": _version(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "n": N,
+        "resultados": resultados,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de los algoritmos de recomendación")
+    parser.add_argument("--catalogos", type=int, nargs="+", default=CATALOGOS)
+    parser.add_argument("--valoraciones", type=int, nargs="+", default=VALORACIONES)
+    parser.add_argument("--usuarios", type=int, default=USUARIOS_POR_CASO, help="usuarios por caso")
+    parser.add_argument("--algoritmos", nargs="+", default=list(recomendar.ALGORITHM_FUNCTIONS))
+    parser.add_argument("--salida", default="benchmark.json")
+    args = parser.parse_args()
+
+    reporte = correr(args.catalogos, args.valoraciones, args.usuarios, args.algoritmos)
+
+    with open(args.salida, "w") as f:
+        json.dump(reporte, f, indent=2)
+    print(f"📝 Resultados guardados en {args.salida}")
@@ -0,0 +1,53 @@
+## Caché LRU en memoria, compartida por todos los hilos del proceso
+
+import threading
+from collections import OrderedDict
+
+import monitoreo
+
+###
+
+class CacheLRU:
+    def __init__(self, nombre, maximo):
+        self.nombre = nombre  # etiqueta en /metrics
+        self.maximo = maximo
+        self.datos = OrderedDict()
+        self.lock = threading.Lock()
+
+    def obtener_muchos(self, claves):
+        """({clave: valor} de los hits, [claves que faltan]), marcando los hits como recientes."""
+        encontrados = {}
+        faltan = []
+        with self.lock:
+            for clave in claves:
+                valor = self.datos.get(clave)
+                if valor is None:
+                    faltan.append(clave)
+                else:
+                    self.datos.move_to_end(clave)
+                    encontrados[clave] = valor
+        if encontrados:
+            monitoreo.contar("recetamatch_cache_total", len(encontrados), cache=self.nombre, resultado="hit")
+        if faltan:
+            monitoreo.contar("recetamatch_cache_total", len(faltan), cache=self.nombre, resultado="miss")
+        return encontrados, faltan
+
+    def guardar_muchos(self, valores):
+        with self.lock:
+            self.datos.update(valores)
+            for clave in valores:
+                self.datos.move_to_end(clave)
+            while len(self.datos) > self.maximo:
+                self.datos.popitem(last=False)
+
+    def invalidar(self, claves=None):
+        """Borra esas claves, o toda la caché si no se indica ninguna."""
+        with self.lock:
+            if claves is None:
+                self.datos.clear()
+            else:
+                for clave in claves:
+                    self.datos.pop(clave, None)
+
+    def __len__(self):
+        return len(self.datos)
@@ -0,0 +1,184 @@
+## Generador de carga HTTP para los endpoints de Flask
+#
+# Reproduce sesiones de usuario realistas (login, recomendaciones, detalle de
+# receta, valoración y autocompletado tecla por tecla) con N sesiones en
+# paralelo, y reporta throughput, percentiles de latencia por ruta y errores de
+# bloqueo de SQLite ("database is locked").
+#
+# Por defecto maneja app.app en el mismo proceso con el cliente de test WSGI;
+# con --url le pega a un servidor ya levantado (python app.py, gunicorn, etc.).
+#
+# Uso:
+#   python carga.py --concurrencias 1 4 16 --sesiones 50
+#   python carga.py --url http://localhost:5000 --concurrencias 8
+
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import percentil
+
+CONCURRENCIAS = [1, 4, 16]
+SESIONES = 40
+TERMINOS = ["chicken", "pasta", "chocolate", "soup", "salad", "cake", "beef", "lemon"]
+RE_RECETA = re.compile(r'href="/recomendaciones/(\d+)"')
+LOCK = "database is locked"
+
+###
+
+class ClienteWSGI:
+    """Un usuario contra app.app en el mismo proceso (cada uno con su cookie jar)."""
+
+    def __init__(self):
+        import app
+        self.cliente = app.app.test_client()
+
+    def pedir(self, metodo, ruta, data=None):
+        try:
+            res = self.cliente.open(ruta, method=metodo, data=data)
+            return res.status_code, res.get_data(as_text=True)
+        except Exception as e:  # con app.debug las excepciones se propagan al cliente de test
+            return 500, f"{type(e).__name__}: {e}"
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class ClienteHTTP:
+    """Un usuario contra un servidor real, sin seguir redirecciones (igual que el cliente WSGI)."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SinRedirecciones)
+
+    def pedir(self, metodo, ruta, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.url + ruta, data=body, method=metodo)
+        try:
+            with self.opener.open(req, timeout=60) as res:
+                return res.status, res.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+        except OSError as e:
+            return 599, f"{type(e).__name__}: {e}"
+
+###
+
+class Resultados:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.bloqueos = 0
+
+    def registrar(self, ruta, segundos, status, body):
+        with self.lock:
+            self.latencias[ruta].append(segundos)
+            if status >= 500:
+                self.errores[ruta] += 1
+                if LOCK in body:
+                    self.bloqueos += 1
+
+def sesion(cliente, nombre, resultados, rnd):
+    def pedir(ruta_label, metodo, ruta, data=None):
+        inicio = time.perf_counter()
+        status, body = cliente.pedir(metodo, ruta, data)
+        resultados.registrar(ruta_label, time.perf_counter() - inicio, status, body)
+        return body
+
+    pedir("login", "POST", "/", {"name": nombre})
+    html = pedir("recomendaciones", "GET", "/recomendaciones")
+    ids = list(dict.fromkeys(RE_RECETA.findall(html)))
+
+    for recipe_id in rnd.sample(ids, min(2, len(ids))):
+        pedir("detalle", "GET", f"/recomendaciones/{recipe_id}")
+
+    # autocompletado: una consulta por tecla a partir de la segunda letra
+    termino = rnd.choice(TERMINOS)
+    for i in range(2, len(termino) + 1):
+        pedir("autocompletar", "GET", "/api/buscar_recetas?" + urllib.parse.urlencode({"q": termino[:i]}))
+
+    if ids:
+        ratings = {recipe_id: rnd.choice([0, 0, 3, 4, 5]) for recipe_id in ids}
+        pedir("valorar", "POST", "/recomendaciones", ratings)
+    pedir("recomendaciones", "GET", "/recomendaciones")
+
+def correr_nivel(crear_cliente, concurrencia, sesiones, prefijo, seed=0):
+    resultados = Resultados()
+
+    def una(i):
+        sesion(crear_cliente(), f"{prefijo}_{concurrencia}_{i}", resultados, random.Random(seed + i))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(una, range(sesiones)))
+    duracion = time.perf_counter() - inicio
+
+    rutas = {}
+    for ruta, lat in resultados.latencias.items():
+        lat.sort()
+        rutas[ruta] = {
+            "pedidos": len(lat),
+            "errores": resultados.errores[ruta],
+            "p50_ms": round(percentil(lat, 50) * 1000, 2),
+            "p95_ms": round(percentil(lat, 95) * 1000, 2),
+            "p99_ms": round(percentil(lat, 99) * 1000, 2),
+        }
+    total = sum(r["pedidos"] for r in rutas.values())
+    return {
+        "concurrencia": concurrencia,
+        "sesiones": sesiones,
+        "duracion_s": round(duracion, 3),
+        "pedidos_por_seg": round(total / duracion, 2),
+        "sesiones_por_seg": round(sesiones / duracion, 2),
+        "errores": sum(resultados.errores.values()),
+        "bloqueos_sqlite": resultados.bloqueos,
+        "rutas": rutas,
+    }
+
+def imprimir(nivel):
+    print(f"▶ concurrencia {nivel['concurrencia']}: {nivel['pedidos_por_seg']} req/s, "
+          f"{nivel['sesiones_por_seg']} sesiones/s, errores {nivel['errores']}, "
+          f"bloqueos SQLite {nivel['bloqueos_sqlite']}")
+    for ruta, r in sorted(nivel["rutas"].items()):
+        print(f"    {ruta:>15} | {r['pedidos']:>5} req | p50 {r['p50_ms']} ms | p95 {r['p95_ms']} ms | "
+              f"p99 {r['p99_ms']} ms | errores {r['errores']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de carga de la app de recomendaciones")
+    parser.add_argument("--url", default=None, help="servidor a probar; si no se indica se usa app.app en proceso")
+    parser.add_argument("--db", default=None, help="base a usar en modo en proceso (ej. una generada con generar_datos.py)")
+    parser.add_argument("--concurrencias", type=int, nargs="+", default=CONCURRENCIAS)
+    parser.add_argument("--sesiones", type=int, default=SESIONES, help="sesiones por nivel de concurrencia")
+    parser.add_argument("--prefijo", default="carga", help="prefijo de los usuarios que se crean")
+    parser.add_argument("--salida", default=None, help="archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    if args.url:
+        crear_cliente = lambda: ClienteHTTP(args.url)
+    else:
+        if args.db:
+            import recomendar
+            recomendar.DATABASE_FILE = args.db
+        crear_cliente = ClienteWSGI
+
+    niveles = []
+    for c in args.concurrencias:
+        nivel = correr_nivel(crear_cliente, c, args.sesiones, args.prefijo)
+        imprimir(nivel)
+        niveles.append(nivel)
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"url": args.url, "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "niveles": niveles}, f, indent=2)
+        print(f"📝 Resultados guardados en {args.salida}")
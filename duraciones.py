@@ -0,0 +1,44 @@
+# duraciones.py
+# Duraciones ISO-8601 de las recetas ("PT1H30M") como minutos enteros.
+#
+# details guarda los textos tal como vienen (prep_time, cook_time, total_time)
+# y, al lado, prep_minutes/cook_minutes/total_minutes, que son los que se
+# indexan: "menos de 30 minutos" es un rango sobre idx_details_total_minutes.
+# scrapping/fase2 las llena al guardar; la migración 3 de migraciones.py usa
+# este mismo módulo para agregarlas y rellenarlas en bases viejas.
+
+import re
+
+ISO_DURATION = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?", re.IGNORECASE)
+COLUMNS = ("prep_minutes", "cook_minutes", "total_minutes")
+
+def iso_minutes(value):
+    """Minutos enteros de una duración ISO-8601 ("PT1H30M" -> 90); None si falta o no se entiende."""
+    match = ISO_DURATION.fullmatch(value.strip()) if isinstance(value, str) else None
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 1440 + int(hours or 0) * 60 + int(minutes or 0) + round(float(seconds or 0) / 60)
+
+def minutes(prep_time, cook_time, total_time):
+    """(prep, cook, total) en minutos; si el sitio no trae totalTime, total = prep + cook."""
+    prep, cook, total = iso_minutes(prep_time), iso_minutes(cook_time), iso_minutes(total_time)
+    if total is None and prep is not None and cook is not None:
+        total = prep + cook
+    return prep, cook, total
+
+def add_columns(conn):
+    """Agrega las columnas en minutos a una details de antes y crea sus índices."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(details)")}
+    for column in COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE details ADD COLUMN {column} INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_details_total_minutes ON details(total_minutes)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_details_prep_minutes ON details(prep_minutes)")
+
+def backfill(conn):
+    """Recalcula las columnas en minutos de todas las filas desde los textos (no hace commit)."""
+    rows = conn.execute("SELECT recipe_id, prep_time, cook_time, total_time FROM details").fetchall()
+    conn.executemany("UPDATE details SET prep_minutes = ?, cook_minutes = ?, total_minutes = ? WHERE recipe_id = ?",
+                     [(*minutes(prep, cook, total), recipe_id) for recipe_id, prep, cook, total in rows])
+    return len(rows)
@@ -0,0 +1,168 @@
+## Escritura diferida (write-behind) de ratings e impresiones
+#
+# Un único hilo en segundo plano toma las escrituras de una cola y las commitea
+# en transacciones por lotes, así los requests no esperan el commit de SQLite
+# ni se pisan entre ellos con "database is locked".
+#
+# Garantía de lectura: antes de leer los datos de un usuario se llama a
+# sincronizar(usuario), que espera a que sus escrituras pendientes estén
+# commiteadas. Cada usuario ve siempre sus propias escrituras.
+#
+# Si una sentencia del lote falla (ej. IntegrityError), el lote se vuelve a
+# escribir de a una escritura, cada una en su savepoint: solo se pierde la que
+# falla, y sincronizar() le devuelve False a ese usuario.
+
+import atexit
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+
+import monitoreo
+
+LOTE_MAXIMO = 500      # escrituras por transacción
+ESPERA_LOTE = 0.005    # segundos que se espera para juntar más escrituras en el lote
+REINTENTOS = 10        # si la base está bloqueada por otro proceso
+TIMEOUT_SINCRONIZAR = 10
+
+###
+
+class EscritorDiferido:
+    def __init__(self, database_file):
+        # database_file es una función, para respetar cambios a recomendar.DATABASE_FILE
+        self.database_file = database_file
+        self.cola = queue.Queue()
+        self.pendientes = {}  # usuario -> escrituras encoladas sin commitear
+        self.fallidas = {}    # usuario -> escrituras descartadas desde su último sincronizar()
+        self.condicion = threading.Condition()
+        self.hilo = None
+        self.lock_inicio = threading.Lock()
+        self.reintentos = 0   # veces que se reintentó por base bloqueada
+        self.lotes = 0
+
+    def encolar(self, usuario, query, params):
+        self._iniciar()
+        with self.condicion:
+            self.pendientes[usuario] = self.pendientes.get(usuario, 0) + 1
+        self.cola.put((usuario, query, params))
+
+    def sincronizar(self, usuario, timeout=TIMEOUT_SINCRONIZAR):
+        """Bloquea hasta que todas las escrituras encoladas de `usuario` estén resueltas.
+
+        Devuelve False si se venció el timeout o si alguna escritura de `usuario`
+        se descartó desde la sincronización anterior.
+        """
+        with self.condicion:
+            listo = self.condicion.wait_for(lambda: not self.pendientes.get(usuario), timeout)
+            return listo and not self.fallidas.pop(usuario, 0)
+
+    def vaciar(self, timeout=TIMEOUT_SINCRONIZAR):
+        """Espera a que se commitee todo lo encolado (al salir, en tests o en scripts)."""
+        with self.condicion:
+            return self.condicion.wait_for(lambda: not self.pendientes, timeout)
+
+    def profundidad(self):
+        return self.cola.qsize()
+
+    ###
+
+    def _iniciar(self):
+        if self.hilo is not None:
+            return
+        with self.lock_inicio:
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._correr, name="escritor-diferido", daemon=True)
+                self.hilo.start()
+                atexit.register(self.vaciar)
+
+    def _correr(self):
+        con = None
+        while True:
+            lote = [self.cola.get()]
+            # junto lo que llegue enseguida para commitearlo todo junto
+            limite = time.monotonic() + ESPERA_LOTE
+            while len(lote) < LOTE_MAXIMO:
+                try:
+                    lote.append(self.cola.get(timeout=max(0, limite - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            fallidas = []
+            try:
+                if con is None:
+                    con = sqlite3.connect(self.database_file(), timeout=1)
+                try:
+                    self._escribir(con, lote, self._ejecutar_lote)
+                except sqlite3.Error as e:
+                    if _bloqueada(e):
+                        raise
+                    # alguna escritura no entra: de a una, para perder solo esa
+                    fallidas = self._escribir(con, lote, self._ejecutar_de_a_una)
+            except Exception as e:
+                fallidas = [(escritura, e) for escritura in lote]
+                if con is not None:
+                    try:
+                        con.rollback()
+                    finally:
+                        con.close()
+                        con = None
+            finally:
+                self._confirmar(lote, fallidas)
+
+    def _escribir(self, con, lote, ejecutar):
+        """Corre ejecutar(con, lote) y commitea, reintentando si la base está bloqueada. Devuelve las fallidas."""
+        for intento in range(REINTENTOS):
+            try:
+                fallidas = ejecutar(con, lote)
+                con.commit()
+                self.lotes += 1
+                return fallidas
+            except sqlite3.Error as e:
+                con.rollback()
+                if not _bloqueada(e) or intento == REINTENTOS - 1:
+                    raise
+                self.reintentos += 1
+                monitoreo.contar("recetamatch_sqlite_busy_retries_total")
+                time.sleep(0.01 * 2 ** intento)
+
+    def _ejecutar_lote(self, con, lote):
+        # las consultas iguales y consecutivas van juntas en un executemany, respetando el orden
+        for query, grupo in itertools.groupby(lote, key=lambda e: e[1]):
+            con.executemany(query, [params for _, _, params in grupo])
+        return []
+
+    def _ejecutar_de_a_una(self, con, lote):
+        fallidas = []
+        con.execute("BEGIN")
+        for escritura in lote:
+            _, query, params = escritura
+            con.execute("SAVEPOINT escritura")
+            try:
+                con.execute(query, params)
+            except sqlite3.Error as e:
+                if _bloqueada(e):
+                    raise
+                con.execute("ROLLBACK TO escritura")
+                fallidas.append((escritura, e))
+            con.execute("RELEASE escritura")
+        return fallidas
+
+    def _confirmar(self, lote, fallidas=()):
+        for (usuario, _, _), e in fallidas:
+            print(f"❌ Escritor diferido: se descarta una escritura de {usuario}: {e}")
+        if fallidas:
+            monitoreo.contar("recetamatch_escritor_descartadas_total", len(fallidas))
+        with self.condicion:
+            for (usuario, _, _), _ in fallidas:
+                self.fallidas[usuario] = self.fallidas.get(usuario, 0) + 1
+            for usuario, _, _ in lote:
+                restantes = self.pendientes.get(usuario, 0) - 1
+                if restantes > 0:
+                    self.pendientes[usuario] = restantes
+                else:
+                    self.pendientes.pop(usuario, None)
+            self.condicion.notify_all()
+
+def _bloqueada(e):
+    return isinstance(e, sqlite3.OperationalError) and "locked" in str(e)
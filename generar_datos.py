@@ -0,0 +1,314 @@
+## Generador de un foodcom.db sintético para pruebas de escala
+#
+# Escribe una base con el mismo esquema que producen los scrapers (recipes,
+# reviews, users, details, ingredients, instructions) más los índices que usa
+# la aplicación. La popularidad de las recetas y la actividad de los usuarios
+# siguen una Zipf, y los ratings la distribución sesgada a 5 de Food.com.
+#
+# Uso:
+#   python generar_datos.py --recetas 100000 --usuarios 50000 --reviews 1000000 --salida datos/foodcom.db
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import time
+from bisect import bisect_left
+
+import migraciones
+
+RECETAS = 10_000
+USUARIOS = 5_000
+REVIEWS = 100_000
+ZIPF_RECETAS = 1.0   # exponente de popularidad de las recetas
+ZIPF_USUARIOS = 1.1  # exponente de actividad de los usuarios
+RATINGS = [1, 2, 3, 4, 5]
+PESOS_RATINGS = [1.3, 1.3, 3.8, 17.4, 76.2]  # aprox. lo observado en Food.com
+LOTE = 50_000
+
+PALABRAS = ["chicken", "beef", "pork", "tofu", "salmon", "shrimp", "pasta", "rice", "potato",
+            "tomato", "garlic", "lemon", "honey", "cheese", "spinach", "mushroom", "bean",
+            "chocolate", "apple", "banana", "pumpkin", "coconut", "ginger", "curry", "basil"]
+ESTILOS = ["easy", "creamy", "spicy", "baked", "grilled", "slow cooker", "quick", "healthy",
+           "classic", "crispy", "roasted", "stuffed", "smoky", "sweet"]
+PLATOS = ["soup", "salad", "casserole", "stew", "pie", "cake", "bread", "tacos", "stir fry",
+          "muffins", "cookies", "sauce", "burgers", "lasagna", "chili"]
+CATEGORIAS = ["Breakfast", "Lunch/Snacks", "One Dish Meal", "Vegetable", "Dessert", "Chicken",
+              "Beverages", "Breads", "Meat", "Pork", "Seafood", "Pasta", "Sauces"]
+UNIDADES = ["1", "2", "1/2", "1/4", "3", "1 1/2", "2 cups", "1 cup", "1 tablespoon", "2 teaspoons"]
+
+###
+
+def esquema(con):
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS recipes (
+            recipe_id INTEGER PRIMARY KEY,
+            title TEXT,
+            description TEXT,
+            image_url TEXT,
+            url TEXT,
+            category TEXT,
+            rating REAL,
+            num_ratings INTEGER,
+            prep_time INTEGER,
+            cook_time INTEGER,
+            total_time INTEGER,
+            author_id INTEGER,
+            author_name TEXT,
+            author_url TEXT,
+            author_avatar TEXT
+        );
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY,
+            recipe_id INTEGER,
+            author_id INTEGER,
+            author TEXT,
+            rating INTEGER,
+            likes INTEGER,
+            submitted TEXT,
+            text TEXT
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT,
+            profile_url TEXT,
+            avatar_url TEXT,
+            date_joined TEXT,
+            followers INTEGER,
+            following INTEGER,
+            total_activities INTEGER,
+            total_reviews INTEGER,
+            total_photos INTEGER,
+            total_likes INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS details (
+            recipe_id INTEGER PRIMARY KEY,
+            url TEXT,
+            title TEXT,
+            description TEXT,
+            prep_time TEXT,
+            cook_time TEXT,
+            total_time TEXT,
+            author TEXT,
+            image TEXT,
+            category TEXT,
+            keywords TEXT,
+            total_ingredients INTEGER,
+            total_steps INTEGER,
+            total_reviews INTEGER,
+            prep_minutes INTEGER,
+            cook_minutes INTEGER,
+            total_minutes INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS ingredients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER,
+            quantity TEXT,
+            text TEXT,
+            category_texts TEXT
+        );
+        CREATE TABLE IF NOT EXISTS instructions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER,
+            step_num INTEGER,
+            step_text TEXT
+        );
+    """)
+
+def indices(con):
+    """Índices que asume la aplicación (los ON CONFLICT de recomendar.py) y las consultas por autor."""
+    con.executescript("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_name ON users(name);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_recipe_author ON reviews(recipe_id, author);
+        CREATE INDEX IF NOT EXISTS idx_reviews_author ON reviews(author);
+        CREATE INDEX IF NOT EXISTS idx_ingredients_recipe ON ingredients(recipe_id);
+        CREATE INDEX IF NOT EXISTS idx_instructions_recipe ON instructions(recipe_id);
+    """)
+
+def conectar_rapido(path):
+    """Conexión con pragmas de carga masiva: sin journal ni fsync (la base es descartable)."""
+    con = sqlite3.connect(path)
+    con.executescript("""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        PRAGMA locking_mode = EXCLUSIVE;
+        PRAGMA temp_store = MEMORY;
+        PRAGMA cache_size = -262144;
+    """)
+    return con
+
+def pesos_zipf(n, s):
+    """Pesos acumulados de una Zipf(s) sobre n rangos, para random.choices(cum_weights=...)."""
+    return list(itertools.accumulate(1.0 / (r ** s) for r in range(1, n + 1)))
+
+def repartir(total, acumulados, maximo):
+    """Reparte `total` eventos entre rangos con pesos Zipf, con un tope por rango."""
+    W = acumulados[-1]
+    cantidades = []
+    anterior = 0.0
+    for acum in acumulados:
+        cantidades.append(min(maximo, max(1, round(total * (acum - anterior) / W))))
+        anterior = acum
+
+    # lo que se perdió por el tope se lo llevan los siguientes más activos
+    faltan = total - sum(cantidades)
+    for i in range(len(cantidades)):
+        if faltan <= 0:
+            break
+        extra = min(faltan, maximo - cantidades[i])
+        cantidades[i] += extra
+        faltan -= extra
+    return cantidades
+
+def muestra_zipf(rnd, k, acumulados, poblacion):
+    """k recetas distintas, elegidas según popularidad Zipf."""
+    elegidas = set()
+    intentos = 0
+    W = acumulados[-1]
+    while len(elegidas) < k and intentos < 8:
+        faltan = k - len(elegidas)
+        for _ in range(int(faltan * 1.3) + 1):
+            elegidas.add(bisect_left(acumulados, rnd.random() * W))
+        intentos += 1
+    if len(elegidas) < k:  # usuarios muy activos: relleno uniforme
+        libres = [i for i in range(poblacion) if i not in elegidas]
+        elegidas.update(rnd.sample(libres, k - len(elegidas)))
+    return list(itertools.islice(elegidas, k))
+
+def iso_duracion(minutos):
+    h, m = divmod(minutos, 60)
+    return "PT" + (f"{h}H" if h else "") + (f"{m}M" if m or not h else "")
+
+def titulo(rnd):
+    return f"{rnd.choice(ESTILOS).title()} {rnd.choice(PALABRAS).title()} {rnd.choice(PLATOS).title()}"
+
+###
+
+def generar_reviews(con, rnd, cant_recetas, cant_usuarios, cant_reviews):
+    """Inserta las reviews y devuelve (suma, cantidad) de ratings por receta y reviews por usuario."""
+    acum_recetas = pesos_zipf(cant_recetas, ZIPF_RECETAS)
+    acum_usuarios = pesos_zipf(cant_usuarios, ZIPF_USUARIOS)
+    por_usuario = repartir(cant_reviews, acum_usuarios, max(1, cant_recetas // 2))
+
+    # el id de receta no coincide con su rango de popularidad
+    ids_recetas = list(range(1, cant_recetas + 1))
+    rnd.shuffle(ids_recetas)
+
+    suma = [0] * (cant_recetas + 1)
+    cantidad = [0] * (cant_recetas + 1)
+    review_id = 0
+    lote = []
+    inicio = time.perf_counter()
+
+    fechas = [f"20{a:02d}-{m:02d}-{d:02d}" for a in range(5, 25) for m in range(1, 13) for d in range(1, 29)]
+    acum_ratings = list(itertools.accumulate(PESOS_RATINGS))
+
+    for user_id, k in enumerate(por_usuario, start=1):
+        autor = f"user{user_id}"
+        ratings = rnd.choices(RATINGS, cum_weights=acum_ratings, k=k)
+        likes = rnd.choices((0, 0, 0, 1, 2, 3), k=k)
+        dias = rnd.choices(fechas, k=k)
+        for i, rango in enumerate(muestra_zipf(rnd, k, acum_recetas, cant_recetas)):
+            recipe_id = ids_recetas[rango]
+            rating = ratings[i]
+            review_id += 1
+            suma[recipe_id] += rating
+            cantidad[recipe_id] += 1
+            lote.append((review_id, recipe_id, user_id, autor, rating, likes[i], dias[i], ""))
+        if len(lote) >= LOTE:
+            con.executemany("INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)", lote)
+            lote = []
+            print(f"  reviews: {review_id} ({review_id / (time.perf_counter() - inicio):,.0f}/s)", end="\r")
+    if lote:
+        con.executemany("INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)", lote)
+    print(f"  reviews: {review_id}" + " " * 20)
+
+    return suma, cantidad, por_usuario
+
+def generar_usuarios(con, rnd, por_usuario):
+    con.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        (user_id, f"user{user_id}", f"https://www.food.com/user/{user_id}", None,
+         f"20{rnd.randint(0, 23):02d}-{rnd.randint(1, 12):02d}-01", rnd.randint(0, 50), rnd.randint(0, 50),
+         k, k, 0, 0)
+        for user_id, k in enumerate(por_usuario, start=1)
+    ))
+
+def generar_recetas(con, rnd, cant_recetas, cant_usuarios, suma, cantidad):
+    def filas():
+        for recipe_id in range(1, cant_recetas + 1):
+            prep, cook = rnd.randint(5, 60), rnd.choice([0, 10, 20, 30, 45, 60, 90, 120, 240])
+            autor = rnd.randint(1, cant_usuarios)
+            n = cantidad[recipe_id]
+            yield (recipe_id, titulo(rnd), "A synthetic recipe.", None,
+                   f"https://www.food.com/recipe/synthetic-{recipe_id}", rnd.choice(CATEGORIAS),
+                   round(suma[recipe_id] / n, 2) if n else None, n,
+                   prep, cook, prep + cook, autor, f"user{autor}", None, None)
+    con.executemany("INSERT INTO recipes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", filas())
+
+def generar_detalles(con, rnd, cant_detalles):
+    """details, ingredients e instructions para las primeras `cant_detalles` recetas."""
+    rows = con.execute("SELECT recipe_id, url, title, category, prep_time, cook_time, author_name, num_ratings "
+                       "FROM recipes WHERE recipe_id <= ?", (cant_detalles,))
+    detalles, ingredientes, pasos = [], [], []
+
+    def volcar():
+        con.executemany("INSERT INTO details VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", detalles)
+        con.executemany("INSERT INTO ingredients (recipe_id, quantity, text, category_texts) VALUES (?, ?, ?, ?)", ingredientes)
+        con.executemany("INSERT INTO instructions (recipe_id, step_num, step_text) VALUES (?, ?, ?)", pasos)
+        detalles.clear(); ingredientes.clear(); pasos.clear()
+
+    for recipe_id, url, title, category, prep, cook, autor, num_ratings in rows.fetchall():
+        n_ing, n_pasos = rnd.randint(4, 14), rnd.randint(2, 10)
+        detalles.append((recipe_id, url, title, "A synthetic recipe.", iso_duracion(prep), iso_duracion(cook),
+                         iso_duracion(prep + cook), autor, None, category, None, n_ing, n_pasos, num_ratings,
+                         prep, cook, prep + cook))
+        for palabra in rnd.sample(PALABRAS, n_ing):
+            ingredientes.append((recipe_id, rnd.choice(UNIDADES), palabra, palabra))
+        for paso in range(1, n_pasos + 1):
+            pasos.append((recipe_id, paso, f"Step {paso}: mix the {rnd.choice(PALABRAS)}."))
+        if len(ingredientes) >= LOTE:
+            volcar()
+    volcar()
+
+def generar(path, recetas=RECETAS, usuarios=USUARIOS, reviews=REVIEWS, detalles=None, seed=0):
+    """Genera la base completa en `path` (la pisa si existe). detalles=None genera detalles para todas las recetas."""
+    if os.path.exists(path):
+        os.remove(path)
+    rnd = random.Random(seed)
+    detalles = recetas if detalles is None else min(detalles, recetas)
+
+    inicio = time.perf_counter()
+    con = conectar_rapido(path)
+    esquema(con)
+
+    suma, cantidad, por_usuario = generar_reviews(con, rnd, recetas, usuarios, reviews)
+    generar_usuarios(con, rnd, por_usuario)
+    generar_recetas(con, rnd, recetas, usuarios, suma, cantidad)
+    if detalles:
+        generar_detalles(con, rnd, detalles)
+    con.commit()
+
+    # los índices al final: construirlos de una vez es mucho más rápido que mantenerlos fila a fila
+    indices(con)
+    migraciones.aplicar(con)  # tablas derivadas (user_stats) y sus triggers
+    con.execute("ANALYZE")
+    con.commit()
+    con.close()
+
+    print(f"🎉 {path}: {recetas} recetas, {len(por_usuario)} usuarios, {sum(por_usuario)} reviews, "
+          f"{detalles} detalles en {time.perf_counter() - inicio:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera un foodcom.db sintético")
+    parser.add_argument("--recetas", type=int, default=RECETAS)
+    parser.add_argument("--usuarios", type=int, default=USUARIOS)
+    parser.add_argument("--reviews", type=int, default=REVIEWS)
+    parser.add_argument("--detalles", type=int, default=None,
+                        help="cantidad de recetas con detalles/ingredientes/pasos (por defecto todas)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--salida", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "foodcom.db"))
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    generar(args.salida, args.recetas, args.usuarios, args.reviews, args.detalles, args.seed)
@@ -0,0 +1,123 @@
+## Ingredientes normalizados: vocabulario y relación receta-ingrediente
+#
+# fase2 guarda cada ingrediente como texto libre más category_texts, los
+# nombres de comida que el sitio linkea dentro del texto ("sugar, brown sugar").
+# Acá esos nombres se normalizan (minúsculas, sin acentos ni signos, la última
+# palabra en singular) y se guardan como:
+#
+#   ingredient_vocab(ingredient_id, name, recipes)   -- recipes: en cuántas recetas aparece
+#   recipe_ingredients(recipe_id, ingredient_id)
+#
+# Los ingredientes sin link (el texto libre) no entran: son cantidades y
+# aclaraciones mezcladas, lo mismo que ya dejaba afuera modelos.atributos.
+#
+# modelos.py arma con estas tablas el índice invertido que se consulta en
+# memoria (artefactos.IndiceIngredientes); sin snapshot, recomendar.py las usa
+# directo con SQL.
+#
+# Uso:
+#   python ingredientes.py               # rehace recipe_ingredients desde ingredients
+#   python ingredientes.py --top 30      # y muestra los más frecuentes
+
+import argparse
+import re
+import sqlite3
+import time
+import unicodedata
+
+# palabras que terminan en s y no son plurales, y plurales que no salen sacando la s
+SINGULARES = {"molasses", "hummus", "asparagus", "couscous", "swiss", "brussels", "grits", "bitters", "schnapps"}
+IRREGULARES = {"leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife",
+               "cookies": "cookie", "brownies": "brownie", "pies": "pie", "veggies": "veggie"}
+
+###
+
+def _singular(palabra):
+    if palabra in SINGULARES or len(palabra) <= 3:
+        return palabra
+    if palabra in IRREGULARES:
+        return IRREGULARES[palabra]
+    if palabra.endswith("ies"):
+        return palabra[:-3] + "y"         # berries -> berry
+    if palabra.endswith(("oes", "ches", "shes", "xes", "sses")):
+        return palabra[:-2]               # tomatoes -> tomato, peaches -> peach
+    if palabra.endswith("s") and not palabra.endswith(("ss", "us", "is")):
+        return palabra[:-1]               # eggs -> egg
+    return palabra
+
+def normalizar(texto):
+    """Nombre canónico de un ingrediente ("Brown Sugars" -> "brown sugar"); None si no queda nada."""
+    if not texto:
+        return None
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    palabras = re.sub(r"[^a-z0-9]+", " ", texto).split()
+    if not palabras:
+        return None
+    palabras[-1] = _singular(palabras[-1])
+    return " ".join(palabras)
+
+###
+
+def crear_tablas(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS ingredient_vocab (
+            ingredient_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            recipes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            recipe_id INTEGER NOT NULL,
+            ingredient_id INTEGER NOT NULL,
+            PRIMARY KEY (recipe_id, ingredient_id)
+        ) WITHOUT ROWID
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_ingredient ON recipe_ingredients(ingredient_id, recipe_id)")
+
+def normalizar_db(con):
+    """Rehace recipe_ingredients desde ingredients, dentro de la transacción abierta (no hace commit).
+
+    Los ids del vocabulario no cambian entre corridas: los nombres nuevos se
+    agregan al final y los que ya no aparecen quedan con recipes = 0.
+    Devuelve (cantidad de ingredientes distintos, cantidad de pares receta-ingrediente).
+    """
+    crear_tablas(con)
+    pares = set()
+    for recipe_id, category_texts in con.execute(
+            "SELECT recipe_id, category_texts FROM ingredients WHERE category_texts IS NOT NULL"):
+        for parte in category_texts.split(","):
+            nombre = normalizar(parte)
+            if nombre:
+                pares.add((recipe_id, nombre))
+
+    nombres = sorted({nombre for _, nombre in pares})
+    con.executemany("INSERT OR IGNORE INTO ingredient_vocab (name) VALUES (?)", [(n,) for n in nombres])
+    ids = dict(con.execute("SELECT name, ingredient_id FROM ingredient_vocab"))
+    con.execute("DELETE FROM recipe_ingredients")
+    con.executemany("INSERT INTO recipe_ingredients (recipe_id, ingredient_id) VALUES (?, ?)",
+                    sorted((recipe_id, ids[nombre]) for recipe_id, nombre in pares))
+    con.execute("""
+        UPDATE ingredient_vocab SET recipes = (
+            SELECT count(*) FROM recipe_ingredients ri WHERE ri.ingredient_id = ingredient_vocab.ingredient_id
+        )
+    """)
+    return len(nombres), len(pares)
+
+if __name__ == '__main__':
+    import recomendar
+
+    parser = argparse.ArgumentParser(description="Normaliza los ingredientes en ingredient_vocab y recipe_ingredients")
+    parser.add_argument("--db", default=recomendar.DATABASE_FILE)
+    parser.add_argument("--top", type=int, default=0, help="muestra los N ingredientes más frecuentes")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    con = sqlite3.connect(args.db)
+    distintos, pares = normalizar_db(con)
+    con.commit()
+    print(f"🧂 {distintos} ingredientes distintos en {pares} pares receta-ingrediente ({time.perf_counter() - inicio:.1f}s)")
+    for name, recipes in con.execute("SELECT name, recipes FROM ingredient_vocab ORDER BY recipes DESC LIMIT ?", (args.top,)):
+        print(f"   {recipes:7d}  {name}")
+    con.close()
@@ -1,4 +1,5 @@
 import math
+from collections import Counter
 
 def discounted_cumulative_gain(relevance_scores):
     if not relevance_scores:
@@ -22,6 +23,82 @@ def normalized_discounted_cumulative_gain(relevance_scores):
 
     return dcg / idcg
 
+### Métricas poblacionales (más allá de la precisión)
+# Todas reciben la salida de un batch de recomendaciones: {usuario: [recipe_id, ...]}
+
+def catalog_coverage(recommendations, catalog_size):
+    if catalog_size == 0:
+        return 0.0
+
+    recommended = set()
+    for items in recommendations.values():
+        recommended.update(items)
+    return len(recommended) / catalog_size
+
+def gini_index(recommendations, catalog_size):
+    # 0 = todas las recetas se recomiendan igual, 1 = todo concentrado en una sola
+    counts = Counter()
+    for items in recommendations.values():
+        counts.update(items)
+    if catalog_size == 0 or not counts:
+        return 0.0
+
+    values = sorted(counts.values())
+    values = [0] * max(0, catalog_size - len(values)) + values
+    n = len(values)
+    total = sum(values)
+    weighted = sum((2 * (i + 1) - n - 1) * v for i, v in enumerate(values))
+    return weighted / (n * total)
+
+def feature_masks(features):
+    # {recipe_id: iterable de atributos} -> {recipe_id: bitmask}, para comparar listas con operaciones de bits
+    ids = {}
+    masks = {}
+    for item, values in features.items():
+        mask = 0
+        for value in values:
+            mask |= 1 << ids.setdefault(value, len(ids))
+        masks[item] = mask
+    return masks
+
+def intra_list_diversity(recommendations, masks):
+    # promedio de (1 - Jaccard) entre los pares de cada lista; `masks` sale de feature_masks
+    total = 0.0
+    lists = 0
+    for items in recommendations.values():
+        item_masks = [masks.get(i, 0) for i in items]
+        pairs = 0
+        distance = 0.0
+        for a in range(len(item_masks)):
+            ma = item_masks[a]
+            for b in range(a + 1, len(item_masks)):
+                mb = item_masks[b]
+                union = (ma | mb).bit_count()
+                distance += 1 - (ma & mb).bit_count() / union if union else 0.0
+                pairs += 1
+        if pairs:
+            total += distance / pairs
+            lists += 1
+    return total / lists if lists else 0.0
+
+def novelty(recommendations, popularity, num_users):
+    # autoinformación media: -log2 de la fracción de usuarios que interactuó con cada receta
+    if num_users == 0:
+        return 0.0
+
+    self_information = {}
+    total = 0.0
+    count = 0
+    for items in recommendations.values():
+        for item in items:
+            info = self_information.get(item)
+            if info is None:
+                info = -math.log2(max(popularity.get(item, 0), 1) / num_users)
+                self_information[item] = info
+            total += info
+            count += 1
+    return total / count if count else 0.0
+
 if __name__ == "__main__":
     relevance_scores_example = [3, 2, 3, 0, 1, 2]
 
@@ -0,0 +1,147 @@
+## Migraciones del esquema de foodcom.db
+#
+# Cada migración tiene un número; la última aplicada se guarda en
+# PRAGMA user_version. aplicar() corre las pendientes en una transacción
+# IMMEDIATE, así que si varios workers arrancan a la vez solo uno migra.
+#
+# Uso:
+#   python migraciones.py                # aplica las pendientes
+#   python migraciones.py --recalcular   # vuelve a calcular las tablas derivadas
+
+import argparse
+import os
+import sqlite3
+
+import duraciones
+import ingredientes
+
+###
+
+def _user_stats(con):
+    """user_stats: cantidad de recetas valoradas (rating > 0) y vistas (rating = 0) por autor.
+
+    La mantienen triggers sobre reviews, así que queda al día con cualquier
+    escritura (insertar_review, insertar_impresiones, reset_usuario, scrapers).
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            author TEXT PRIMARY KEY,
+            valorados INTEGER NOT NULL DEFAULT 0,
+            vistos INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_stats_insert AFTER INSERT ON reviews WHEN NEW.author IS NOT NULL
+        BEGIN
+            INSERT INTO user_stats(author, valorados, vistos)
+            VALUES (NEW.author, coalesce(NEW.rating > 0, 0), coalesce(NEW.rating = 0, 0))
+            ON CONFLICT(author) DO UPDATE SET valorados = valorados + excluded.valorados, vistos = vistos + excluded.vistos;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_stats_delete AFTER DELETE ON reviews WHEN OLD.author IS NOT NULL
+        BEGIN
+            UPDATE user_stats
+            SET valorados = valorados - coalesce(OLD.rating > 0, 0), vistos = vistos - coalesce(OLD.rating = 0, 0)
+            WHERE author = OLD.author;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_stats_update AFTER UPDATE OF rating, author ON reviews
+        BEGIN
+            UPDATE user_stats
+            SET valorados = valorados - coalesce(OLD.rating > 0, 0), vistos = vistos - coalesce(OLD.rating = 0, 0)
+            WHERE author = OLD.author;
+            INSERT INTO user_stats(author, valorados, vistos)
+            SELECT NEW.author, coalesce(NEW.rating > 0, 0), coalesce(NEW.rating = 0, 0) WHERE NEW.author IS NOT NULL
+            ON CONFLICT(author) DO UPDATE SET valorados = valorados + excluded.valorados, vistos = vistos + excluded.vistos;
+        END
+    """)
+    recalcular_user_stats(con)
+
+def recalcular_user_stats(con):
+    con.execute("DELETE FROM user_stats")
+    con.execute("""
+        INSERT INTO user_stats(author, valorados, vistos)
+        SELECT author, sum(rating > 0), sum(rating = 0)
+        FROM reviews
+        WHERE author IS NOT NULL
+        GROUP BY author
+    """)
+
+def _ingredientes(con):
+    """ingredient_vocab y recipe_ingredients (ver ingredientes.py), con lo que ya hay en ingredients."""
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingredients'").fetchone() is None:
+        ingredientes.crear_tablas(con)
+    else:
+        ingredientes.normalizar_db(con)
+
+def _minutos_details(con):
+    """details.prep_minutes/cook_minutes/total_minutes, indexadas y rellenas desde los textos (ver duraciones.py)."""
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'details'").fetchone() is None:
+        return  # la crea fase2 ya con las columnas
+    duraciones.add_columns(con)
+    duraciones.backfill(con)
+
+MIGRACIONES = [
+    (1, _user_stats),
+    (2, _ingredientes),
+    (3, _minutos_details),
+]
+
+###
+
+def version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar(con):
+    """Aplica las migraciones pendientes. Devuelve la lista de las que aplicó."""
+    if not MIGRACIONES or version(con) >= MIGRACIONES[-1][0]:
+        return []
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reviews'").fetchone() is None:
+        return []  # base vacía: todavía no corrieron los scrapers ni generar_datos.py
+
+    con.commit()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        actual = version(con)  # otro proceso pudo haber migrado mientras esperábamos el lock
+        aplicadas = []
+        for numero, migracion in MIGRACIONES:
+            if numero > actual:
+                migracion(con)
+                con.execute(f"PRAGMA user_version = {numero}")
+                aplicadas.append(numero)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return aplicadas
+
+def aplicar_db(path):
+    """Aplica las pendientes en la base de `path`; None si la base todavía no existe (no la crea)."""
+    if not os.path.exists(path):
+        return None
+    con = sqlite3.connect(path, timeout=60)
+    try:
+        aplicadas = aplicar(con)
+    finally:
+        con.close()
+    if aplicadas:
+        print(f"🛠 Migraciones aplicadas en {path}: {aplicadas}")
+    return aplicadas
+
+if __name__ == '__main__':
+    import recomendar
+
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes de la base")
+    parser.add_argument("--db", default=recomendar.DATABASE_FILE)
+    parser.add_argument("--recalcular", action="store_true", help="rehace las tablas derivadas (user_stats)")
+    args = parser.parse_args()
+
+    aplicar_db(args.db)
+    if args.recalcular:
+        con = sqlite3.connect(args.db)
+        recalcular_user_stats(con)
+        con.commit()
+        con.close()
+        print("🔁 user_stats recalculada")
@@ -0,0 +1,241 @@
+## Modelos entrenados offline para los algoritmos de recomendar.py
+#
+# Las versiones de recomendar.py calculan todo con SQL en cada request. Acá
+# están las mismas ideas como artefactos que se entrenan una vez y después se
+# consultan en memoria:
+#
+#   - top_n: ranking global por rating * log(num_ratings + 1)
+#   - pares: co-ocurrencias item-item entre recetas que le gustaron a un mismo autor
+#   - busqueda: títulos en minúscula por popularidad, para el autocompletar
+#   - ingredientes: índice invertido ingrediente -> recetas (ver ingredientes.py)
+#
+# Para servirlos, se exportan como artefactos mapeables (artefactos.py) en una
+# carpeta versionada que la app recarga en caliente (recarga.py).
+#
+# Uso:
+#   python modelos.py                 # nueva generación en datos/modelos/
+#   python modelos.py --conservar 5
+
+import argparse
+import glob
+import math
+import os
+import random
+import sqlite3
+import time
+from collections import Counter, defaultdict
+
+import artefactos
+import ingredientes
+import recomendar
+
+MODELOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "modelos")
+CONSERVAR = 3  # generaciones que se dejan en disco
+
+###
+
+def entrenar_top_n(con, min_ratings=0):
+    """Lista de recipe_id ordenada por la misma fórmula que recomendador_top_n."""
+    rows = con.execute("SELECT recipe_id, rating, num_ratings FROM recipes WHERE coalesce(num_ratings, 0) >= ?",
+                       (min_ratings,)).fetchall()
+    puntaje = lambda r: (r[1] or 0) * math.log((r[2] or 0) + 1)
+    return [r[0] for r in sorted(rows, key=puntaje, reverse=True)]
+
+def entrenar_pares(con, umbral=None, vecinos=50, max_por_usuario=200, excluir=None, seed=0):
+    """Vecinos de cada receta: {recipe_id: [(otra, co-ocurrencias), ...]} con los `vecinos` más frecuentes.
+
+    Cuenta, para cada par de recetas con rating > umbral del mismo autor, cuántos
+    autores las valoraron a ambas (lo mismo que el count(*) de recomendador_pares).
+    `excluir` es un set de (author, recipe_id) que no se usan (los de testing).
+    Los autores con muchísimas reviews se submuestrean a `max_por_usuario` para
+    que el costo no sea cuadrático en los usuarios más activos.
+    """
+    if umbral is None:
+        umbral = recomendar.UMBRAL_PARES
+    rnd = random.Random(seed)
+    excluir = excluir or set()
+    coocurrencias = defaultdict(Counter)
+
+    def acumular(items):
+        if len(items) > max_por_usuario:
+            items = rnd.sample(items, max_por_usuario)
+        for a in items:
+            fila = coocurrencias[a]
+            for b in items:
+                if a != b:
+                    fila[b] += 1
+
+    autor_actual, items = None, []
+    for author, recipe_id in con.execute("SELECT author, recipe_id FROM reviews WHERE rating > ? ORDER BY author", (umbral,)):
+        if author != autor_actual:
+            acumular(items)
+            autor_actual, items = author, []
+        if (author, recipe_id) not in excluir:
+            items.append(recipe_id)
+    acumular(items)
+
+    return {recipe_id: fila.most_common(vecinos) for recipe_id, fila in coocurrencias.items()}
+
+###
+
+def recomendar_top_n(ranking, conocidos, N):
+    res = []
+    for recipe_id in ranking:
+        if recipe_id not in conocidos:
+            res.append(recipe_id)
+            if len(res) == N:
+                break
+    return res
+
+def recomendar_pares(vecinos, ranking, relevantes, conocidos, N):
+    """Suma las co-ocurrencias con las recetas relevantes; completa con top_n si no alcanza."""
+    puntajes = Counter()
+    for recipe_id in relevantes:
+        for otra, cantidad in vecinos.get(recipe_id, ()):
+            if otra not in conocidos:
+                puntajes[otra] += cantidad
+
+    res = [recipe_id for recipe_id, _ in puntajes.most_common(N)]
+    if len(res) < N:
+        res += recomendar_top_n(ranking, conocidos | set(res), N - len(res))
+    return res
+
+###
+
+def popularidad(con):
+    """({recipe_id: cantidad de usuarios que la valoraron}, cantidad de usuarios), para la novedad."""
+    pop = dict(con.execute("SELECT recipe_id, count(*) FROM reviews WHERE rating > 0 GROUP BY recipe_id"))
+    usuarios = con.execute("SELECT count(DISTINCT author) FROM reviews WHERE rating > 0").fetchone()[0]
+    return pop, usuarios
+
+def atributos(con):
+    """{recipe_id: set de atributos}: la categoría de la receta más sus ingredientes normalizados."""
+    res = defaultdict(set)
+    for recipe_id, category in con.execute("SELECT recipe_id, category FROM recipes WHERE category IS NOT NULL"):
+        res[recipe_id].add(f"cat:{category}")
+    if _hay_tabla(con, "recipe_ingredients"):
+        for recipe_id, name in con.execute(
+                "SELECT recipe_id, name FROM recipe_ingredients JOIN ingredient_vocab USING (ingredient_id)"):
+            res[recipe_id].add(f"ing:{name}")
+        return res
+    for recipe_id, category_texts in con.execute("SELECT recipe_id, category_texts FROM ingredients WHERE category_texts IS NOT NULL"):
+        for ing in category_texts.split(","):
+            ing = ingredientes.normalizar(ing)
+            if ing:
+                res[recipe_id].add(f"ing:{ing}")
+    return res
+
+def _hay_tabla(con, nombre):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (nombre,)).fetchone() is not None
+
+def indice_ingredientes(con, ids):
+    """Secciones del índice de ingredientes para el artefacto, alineadas con `ids` (los recipe_id ordenados).
+
+    - ingredientes.nombres: los nombres ordenados; la posición es el id del ingrediente dentro del artefacto
+    - ingredientes.indptr / .recetas: posting list de cada ingrediente, posiciones de receta ordenadas (CSR)
+    - ingredientes.idf: log(recetas / recetas con el ingrediente)
+    - recetas_ingredientes.indptr / .ids / .pesos: el índice directo y la suma de idf de cada receta
+    """
+    posicion = {recipe_id: i for i, recipe_id in enumerate(ids)}
+    listas = defaultdict(list)
+    for name, recipe_id in con.execute("""
+        SELECT name, recipe_id FROM recipe_ingredients JOIN ingredient_vocab USING (ingredient_id)
+        ORDER BY recipe_id
+    """):
+        if recipe_id in posicion:
+            listas[name].append(posicion[recipe_id])
+    nombres = sorted(listas)
+    idf = [math.log(len(ids) / len(listas[n])) for n in nombres]
+
+    indptr, recetas = [0], []
+    por_receta = defaultdict(list)
+    for k, nombre in enumerate(nombres):
+        recetas.extend(listas[nombre])
+        indptr.append(len(recetas))
+        for i in listas[nombre]:
+            por_receta[i].append(k)
+    directo_indptr, directo, pesos = [0], [], []
+    for i in range(len(ids)):
+        directo.extend(por_receta.get(i, ()))
+        directo_indptr.append(len(directo))
+        pesos.append(sum(idf[k] for k in por_receta.get(i, ())))
+
+    arreglos = {
+        "ingredientes.indptr": ("q", indptr),
+        "ingredientes.recetas": ("i", recetas),
+        "ingredientes.idf": ("d", idf),
+        "recetas_ingredientes.indptr": ("q", directo_indptr),
+        "recetas_ingredientes.ids": ("i", directo),
+        "recetas_ingredientes.pesos": ("d", pesos),
+    }
+    return arreglos, {"ingredientes.nombres": nombres}
+
+###
+
+def exportar(con, path, vecinos=None):
+    """Arma el artefacto (el snapshot que mapea la app al arrancar): catálogo, top_n, pares, búsqueda e ingredientes."""
+    rows = con.execute("SELECT recipe_id, title, num_ratings FROM recipes ORDER BY recipe_id").fetchall()
+    ids = [r[0] for r in rows]
+    ranking = entrenar_top_n(con)
+    if vecinos is None:
+        vecinos = entrenar_pares(con)
+
+    indptr, indices, cantidades = [0], [], []
+    for recipe_id in ids:
+        for otra, cantidad in vecinos.get(recipe_id, ()):
+            indices.append(otra)
+            cantidades.append(cantidad)
+        indptr.append(len(indices))
+
+    # mismo orden que el ORDER BY num_ratings DESC de recomendar.buscar_recetas
+    populares = sorted(rows, key=lambda r: (-(r[2] or 0), r[0]))
+
+    arreglos = {
+        "recipes.ids": ("q", ids),
+        "recipes.num_ratings": ("q", [r[2] or 0 for r in rows]),
+        "top_n.ranking": ("q", ranking),
+        "pares.indptr": ("q", indptr),
+        "pares.indices": ("q", indices),
+        "pares.cantidades": ("i", cantidades),
+        "busqueda.ids": ("q", [r[0] for r in populares]),
+    }
+    textos = {
+        "recipes.titulos": [r[1] for r in rows],
+        "busqueda.titulos": [(r[1] or "").replace("\n", " ").lower() + "\n" for r in populares],
+    }
+    if _hay_tabla(con, "recipe_ingredients"):
+        arreglos_ing, textos_ing = indice_ingredientes(con, ids)
+        arreglos.update(arreglos_ing)
+        textos.update(textos_ing)
+
+    artefactos.escribir(path, arreglos=arreglos, textos=textos,
+                        meta={"creado": time.strftime("%Y-%m-%dT%H:%M:%S"), "recetas": len(ids)})
+
+def nueva_generacion(con, directorio=MODELOS_DIR, conservar=CONSERVAR):
+    """Exporta una generación nueva (el nombre ordena por fecha) y borra las más viejas.
+
+    Borrar el archivo no afecta a los workers que todavía lo tienen mapeado:
+    el sistema libera las páginas recién cuando se cierra el último mapa.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    path = os.path.join(directorio, time.strftime("%Y%m%d-%H%M%S") + ".art")
+    exportar(con, path)
+    for viejo in sorted(glob.glob(os.path.join(directorio, "*.art")))[:-conservar]:
+        os.remove(viejo)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Entrena los modelos y publica una generación nueva de artefactos")
+    parser.add_argument("--db", default=recomendar.DATABASE_FILE)
+    parser.add_argument("--dir", default=MODELOS_DIR)
+    parser.add_argument("--conservar", type=int, default=CONSERVAR)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    con = sqlite3.connect(args.db)
+    if _hay_tabla(con, "ingredients"):
+        ingredientes.normalizar_db(con)  # recipe_ingredients al día con lo último que bajó fase2
+        con.commit()
+    path = nueva_generacion(con, args.dir, args.conservar)
+    con.close()
+    print(f"🎉 Generación {path} ({os.path.getsize(path) / 1e6:.1f} MB) en {time.perf_counter() - inicio:.1f}s")
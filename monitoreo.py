@@ -0,0 +1,235 @@
+## Métricas en formato Prometheus (/metrics)
+#
+# Histogramas de latencia por ruta y por algoritmo de recomendación,
+# contadores de hits/misses de caché, reintentos por SQLite ocupado y
+# profundidad de la cola de escritura.
+#
+# Para que sumen bien con varios procesos (gunicorn con N workers), cada
+# proceso escribe sus valores en su propio archivo mmapeado dentro de
+# METRICAS_DIR, sin locks entre procesos; el proceso que atiende /metrics lee
+# y suma los archivos de todos. Cada proceso arranca su archivo vacío (un pid
+# reusado no hereda valores viejos) y lo borra al salir.
+
+import atexit
+import glob
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from flask import Response, g, request
+
+METRICAS_DIR = os.path.join(tempfile.gettempdir(), "recetamatch_metricas")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+TAMANIO_INICIAL = 64 * 1024
+
+AYUDA = {
+    "recetamatch_request_seconds": ("histogram", "Latencia de los requests por ruta"),
+    "recetamatch_recomendador_seconds": ("histogram", "Latencia de recomendar() por algoritmo y origen"),
+    "recetamatch_cache_total": ("counter", "Consultas a cachés por resultado (hit/miss)"),
+    "recetamatch_cache_hit_ratio": ("gauge", "Hits sobre el total de consultas de cada caché"),
+    "recetamatch_sqlite_busy_retries_total": ("counter", "Reintentos por base de datos bloqueada"),
+    "recetamatch_escritor_cola": ("gauge", "Escrituras en la cola del escritor diferido, todavía sin tomar (suma de procesos vivos)"),
+    "recetamatch_escritor_descartadas_total": ("counter", "Escrituras diferidas que fallaron y se descartaron"),
+}
+
+###
+
+class ArchivoMetricas:
+    """Diccionario clave -> float sobre un archivo mmapeado, escrito por un solo proceso.
+
+    Formato: 8 bytes con el largo usado, y después entradas
+    [largo de la clave (4 bytes)][clave utf-8 con padding a 8][valor double].
+    El archivo se trunca al abrirlo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.posiciones = {}
+        self.f = open(path, "w+b")
+        self.f.truncate(TAMANIO_INICIAL)
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        self.usado = 8
+
+    def sumar(self, clave, valor):
+        pos = self.posiciones.get(clave) or self._agregar(clave)
+        struct.pack_into("d", self.mm, pos, struct.unpack_from("d", self.mm, pos)[0] + valor)
+
+    def fijar(self, clave, valor):
+        pos = self.posiciones.get(clave) or self._agregar(clave)
+        struct.pack_into("d", self.mm, pos, valor)
+
+    def _agregar(self, clave):
+        datos = clave.encode()
+        relleno = (8 - (4 + len(datos)) % 8) % 8
+        tamanio = 4 + len(datos) + relleno + 8
+        while self.usado + tamanio > len(self.mm):
+            nuevo = len(self.mm) * 2
+            self.mm.close()
+            self.f.truncate(nuevo)
+            self.mm = mmap.mmap(self.f.fileno(), 0)
+        struct.pack_into(f"i{len(datos)}s{relleno}xd", self.mm, self.usado, len(datos), datos, 0.0)
+        pos = self.usado + tamanio - 8
+        self.usado += tamanio
+        struct.pack_into("Q", self.mm, 0, self.usado)  # el largo se publica al final: un lector nunca ve media entrada
+        self.posiciones[clave] = pos
+        return pos
+
+def _entradas(buf, usado):
+    pos = 8
+    while pos < usado:
+        largo = struct.unpack_from("i", buf, pos)[0]
+        clave = bytes(buf[pos + 4:pos + 4 + largo]).decode()
+        relleno = (8 - (4 + largo) % 8) % 8
+        pos_valor = pos + 4 + largo + relleno
+        yield clave, struct.unpack_from("d", buf, pos_valor)[0], pos_valor
+        pos = pos_valor + 8
+
+###
+
+_lock = threading.Lock()
+_archivo = None
+_pid = None
+
+def _mi_archivo():
+    # uno por proceso; si el proceso se forkeó (workers de gunicorn) se abre uno nuevo
+    global _archivo, _pid
+    if _pid != os.getpid():
+        os.makedirs(METRICAS_DIR, exist_ok=True)
+        _archivo = ArchivoMetricas(os.path.join(METRICAS_DIR, f"{os.getpid()}.db"))
+        _pid = os.getpid()
+        atexit.register(_borrar_archivo, _pid, _archivo.path)
+    return _archivo
+
+def _borrar_archivo(pid, path):
+    # los hijos forkeados heredan este atexit: solo borra el archivo el proceso dueño
+    if os.getpid() == pid:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _clave(nombre, etiquetas):
+    return json.dumps([nombre, sorted(etiquetas.items())])
+
+def contar(nombre, valor=1, **etiquetas):
+    with _lock:
+        _mi_archivo().sumar(_clave(nombre, etiquetas), valor)
+
+def fijar(nombre, valor, **etiquetas):
+    with _lock:
+        _mi_archivo().fijar(_clave(nombre, etiquetas), valor)
+
+def observar(nombre, segundos, **etiquetas):
+    """Suma una observación al histograma: se guarda el bucket no acumulado, la suma y la cantidad."""
+    le = next(b for b in BUCKETS if segundos <= b)
+    with _lock:
+        archivo = _mi_archivo()
+        archivo.sumar(_clave(nombre + "_bucket", {**etiquetas, "le": le}), 1)
+        archivo.sumar(_clave(nombre + "_sum", etiquetas), segundos)
+        archivo.sumar(_clave(nombre + "_count", etiquetas), 1)
+
+def cache(nombre, hit):
+    contar("recetamatch_cache_total", cache=nombre, resultado="hit" if hit else "miss")
+
+###
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def leer_todo():
+    """Suma los archivos de todos los procesos. Los gauges solo cuentan procesos vivos."""
+    total = {}
+    for path in glob.glob(os.path.join(METRICAS_DIR, "*.db")):
+        pid = int(os.path.basename(path).split(".")[0])
+        vivo = pid == os.getpid() or _vivo(pid)
+        with open(path, "rb") as f:
+            buf = f.read()
+        for clave, valor, _ in _entradas(buf, struct.unpack_from("Q", buf, 0)[0]):
+            nombre, etiquetas = json.loads(clave)
+            if not vivo and AYUDA.get(nombre, ("",))[0] == "gauge":
+                continue
+            k = (nombre, tuple(tuple(e) for e in etiquetas))
+            total[k] = total.get(k, 0.0) + valor
+    return total
+
+def _formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    partes = []
+    for k, v in etiquetas:
+        if k == "le":
+            v = "+Inf" if v == float("inf") else repr(float(v))
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+def exponer():
+    total = leer_todo()
+
+    # los buckets se guardan sin acumular: acá se acumulan por serie
+    series = {}
+    for (nombre, etiquetas), valor in total.items():
+        if nombre.endswith("_bucket"):
+            sin_le = tuple(e for e in etiquetas if e[0] != "le")
+            le = next(e[1] for e in etiquetas if e[0] == "le")
+            series.setdefault((nombre, sin_le), {})[le] = valor
+
+    # hit ratio de cada caché, a partir de los contadores sumados
+    caches = {}
+    for (nombre, etiquetas), valor in total.items():
+        if nombre == "recetamatch_cache_total":
+            e = dict(etiquetas)
+            h, t = caches.get(e["cache"], (0.0, 0.0))
+            caches[e["cache"]] = (h + (valor if e["resultado"] == "hit" else 0), t + valor)
+    for nombre_cache, (h, t) in caches.items():
+        total[("recetamatch_cache_hit_ratio", (("cache", nombre_cache),))] = h / t if t else 0.0
+
+    lineas = []
+    for metrica, (tipo, ayuda) in AYUDA.items():
+        lineas.append(f"# HELP {metrica} {ayuda}")
+        lineas.append(f"# TYPE {metrica} {tipo}")
+        if tipo == "histogram":
+            for (nombre, etiquetas), buckets in sorted(series.items()):
+                if nombre != metrica + "_bucket":
+                    continue
+                acumulado = 0.0
+                for b in BUCKETS:
+                    acumulado += buckets.get(b, 0.0)
+                    lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas + (('le', b),))} {acumulado:g}")
+                lineas.append(f"{metrica}_sum{_formatear_etiquetas(etiquetas)} {total.get((metrica + '_sum', etiquetas), 0.0):g}")
+                lineas.append(f"{metrica}_count{_formatear_etiquetas(etiquetas)} {total.get((metrica + '_count', etiquetas), 0.0):g}")
+        else:
+            for (nombre, etiquetas), valor in sorted(k_v for k_v in total.items() if k_v[0][0] == metrica):
+                lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor:g}")
+    return "\n".join(lineas) + "\n"
+
+def instalar(app, escritor=None):
+    """Mide la latencia de cada request y agrega /metrics. `escritor` es el EscritorDiferido a monitorear."""
+
+    @app.before_request
+    def _metricas_inicio():
+        g.metricas_inicio = time.perf_counter()
+
+    @app.after_request
+    def _metricas_fin(response):
+        if "metricas_inicio" in g:
+            ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+            observar("recetamatch_request_seconds", time.perf_counter() - g.metricas_inicio,
+                     ruta=ruta, metodo=request.method)
+        if escritor is not None:
+            fijar("recetamatch_escritor_cola", escritor.profundidad())
+        return response
+
+    @app.get("/metrics")
+    def get_metrics():
+        return Response(exponer(), mimetype="text/plain; version=0.0.4")
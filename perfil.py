@@ -0,0 +1,121 @@
+## Perfilado de SQL por request
+#
+# recomendar.sql_select / sql_execute (y las escrituras diferidas) llaman a
+# registrar() con cada sentencia. Por request se cuenta la cantidad de queries
+# y el tiempo total (headers X-Query-Count y Server-Timing); en una muestra de
+# los requests además se agrega por sentencia normalizada (texto, duración,
+# filas, llamadas por request) para /debug/perf. Con eso se ven los N+1, como
+# un insertar_review por cada receta recomendada. /debug/perf solo responde con
+# app.debug o con app.config["PERF_DEBUG"].
+
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import abort, g, has_request_context, render_template
+
+MUESTREO = 0.1      # fracción de requests que se agregan al detalle por sentencia
+MAX_SENTENCIAS = 500  # tope de sentencias distintas en el agregado
+LISTA_PARAMETROS = re.compile(r"\?(?:,\?)+")  # ",".join("?" * n), como arma las listas IN recomendar.py
+
+_lock = threading.Lock()
+_agregado = {}  # sentencia normalizada -> estadísticas
+_requests_muestreados = 0
+
+###
+
+def normalizar(query):
+    """Colapsa espacios y listas de parámetros (IN (?,?,?...)) para agrupar sentencias iguales.
+
+    Las listas se colapsan antes del caché: una sentencia con un placeholder
+    por receta del catálogo no queda guardada entera como clave.
+    """
+    return _normalizar(LISTA_PARAMETROS.sub("?…", query))
+
+@lru_cache(maxsize=1024)
+def _normalizar(query):
+    query = re.sub(r"\s+", " ", query).strip()
+    return re.sub(r"\?(\s*,\s*\?)+", "?…", query)
+
+def registrar(query, segundos, filas=None):
+    if not has_request_context() or "perf_cantidad" not in g:
+        return
+    g.perf_cantidad += 1
+    g.perf_segundos += segundos
+    if g.perf_muestreado:
+        g.perf_sentencias.append((query, segundos, filas))
+
+def instalar(app):
+    """Engancha el perfilado a la app de Flask y agrega la página /debug/perf."""
+
+    @app.before_request
+    def _perf_inicio():
+        g.perf_inicio = time.perf_counter()
+        g.perf_cantidad = 0
+        g.perf_segundos = 0.0
+        g.perf_muestreado = random.random() < MUESTREO
+        g.perf_sentencias = []
+
+    @app.after_request
+    def _perf_fin(response):
+        if "perf_cantidad" not in g:
+            return response
+        total = time.perf_counter() - g.perf_inicio
+        response.headers["X-Query-Count"] = str(g.perf_cantidad)
+        response.headers["Server-Timing"] = (f'sql;dur={g.perf_segundos * 1000:.2f};desc="{g.perf_cantidad} queries", '
+                                             f'app;dur={total * 1000:.2f}')
+        if g.perf_muestreado:
+            _agregar(g.perf_sentencias)
+        return response
+
+    @app.get("/debug/perf")
+    def get_debug_perf():
+        if not (app.debug or app.config.get("PERF_DEBUG")):
+            abort(404)
+        return render_template("perf.html", sentencias=resumen(), requests_muestreados=_requests_muestreados,
+                               muestreo=MUESTREO)
+
+def _agregar(sentencias):
+    global _requests_muestreados
+    por_request = {}
+    for query, segundos, filas in sentencias:
+        clave = normalizar(query)
+        s = por_request.setdefault(clave, [0, 0.0, 0, 0.0])
+        s[0] += 1
+        s[1] += segundos
+        s[2] += filas or 0
+        s[3] = max(s[3], segundos)
+
+    with _lock:
+        _requests_muestreados += 1
+        for clave, (llamadas, segundos, filas, maximo) in por_request.items():
+            a = _agregado.get(clave)
+            if a is None:
+                if len(_agregado) >= MAX_SENTENCIAS:
+                    continue
+                a = _agregado[clave] = {"sentencia": clave, "llamadas": 0, "requests": 0, "total_s": 0.0,
+                                        "max_s": 0.0, "filas": 0, "max_por_request": 0}
+            a["llamadas"] += llamadas
+            a["requests"] += 1
+            a["total_s"] += segundos
+            a["max_s"] = max(a["max_s"], maximo)
+            a["filas"] += filas
+            a["max_por_request"] = max(a["max_por_request"], llamadas)
+
+def resumen(limite=50):
+    """Las sentencias más lentas por tiempo total acumulado."""
+    with _lock:
+        filas = [dict(a) for a in _agregado.values()]
+    for a in filas:
+        a["promedio_ms"] = a["total_s"] / a["llamadas"] * 1000
+        a["llamadas_por_request"] = a["llamadas"] / a["requests"]
+    filas.sort(key=lambda a: a["total_s"], reverse=True)
+    return filas[:limite]
+
+def reiniciar():
+    global _requests_muestreados
+    with _lock:
+        _agregado.clear()
+        _requests_muestreados = 0
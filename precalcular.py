@@ -0,0 +1,101 @@
+## Batch nocturno de recomendaciones precalculadas
+#
+# Calcula el top-K de cada usuario activo para cada algoritmo de
+# recomendar.ALGORITMOS_PRECALCULADOS y lo escribe en precomputed_recs con un
+# número de generación. recomendar.recomendar sirve desde ahí (filtrando lo
+# que el usuario vio después) y cae al scoring en vivo para usuarios nuevos.
+#
+# La generación nueva se escribe completa antes de publicarse en
+# precomputed_generations, así que la app nunca ve una generación a medias.
+#
+# Uso (ej. en un cron nocturno):
+#   python precalcular.py --k 64
+
+import argparse
+import sqlite3
+import time
+from collections import defaultdict
+
+import modelos
+import recomendar
+
+K = recomendar.N_RANKING  # cuántas se guardan por usuario: margen para filtrar las que vaya viendo
+MIN_VALORACIONES = 1      # usuarios "activos"
+LOTE = 50_000
+
+###
+
+def crear_tablas(con):
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS precomputed_generations (
+            generation INTEGER PRIMARY KEY,
+            created TEXT,
+            users INTEGER,
+            seconds REAL
+        );
+        CREATE TABLE IF NOT EXISTS precomputed_recs (
+            generation INTEGER,
+            algoritmo TEXT,
+            author TEXT,
+            pos INTEGER,
+            recipe_id INTEGER,
+            PRIMARY KEY (generation, algoritmo, author, pos)
+        ) WITHOUT ROWID;
+    """)
+
+def usuarios_activos(con, min_valoraciones=MIN_VALORACIONES):
+    """{author: (valorados, conocidos)} en una sola pasada sobre reviews."""
+    valorados = defaultdict(list)
+    conocidos = defaultdict(set)
+    for author, recipe_id, rating in con.execute("SELECT author, recipe_id, rating FROM reviews WHERE author IS NOT NULL"):
+        conocidos[author].add(recipe_id)
+        if rating is not None and rating > 0:
+            valorados[author].append(recipe_id)
+    return {a: (valorados[a], conocidos[a]) for a in valorados if len(valorados[a]) >= min_valoraciones}
+
+def calcular(con, algoritmos, k=K, min_valoraciones=MIN_VALORACIONES):
+    inicio = time.perf_counter()
+    crear_tablas(con)
+    generation = con.execute("SELECT coalesce(max(generation), 0) + 1 FROM precomputed_generations").fetchone()[0]
+
+    ranking = modelos.entrenar_top_n(con)
+    vecinos = modelos.entrenar_pares(con) if "pares" in algoritmos else None
+    usuarios = usuarios_activos(con, min_valoraciones)
+    print(f"🧮 Generación {generation}: {len(usuarios)} usuarios, algoritmos {algoritmos}")
+
+    lote = []
+    def volcar():
+        con.executemany("INSERT INTO precomputed_recs VALUES (?, ?, ?, ?, ?)", lote)
+        lote.clear()
+
+    for author, (valorados, conocidos) in usuarios.items():
+        for alg in algoritmos:
+            if alg == "pares":
+                recs = modelos.recomendar_pares(vecinos, ranking, valorados, conocidos, k)
+            else:
+                recs = modelos.recomendar_top_n(ranking, conocidos, k)
+            lote.extend((generation, alg, author, pos, recipe_id) for pos, recipe_id in enumerate(recs))
+        if len(lote) >= LOTE:
+            volcar()
+    volcar()
+
+    # publico la generación y borro las anteriores en la misma transacción
+    segundos = round(time.perf_counter() - inicio, 3)
+    con.execute("INSERT INTO precomputed_generations VALUES (?, datetime('now'), ?, ?)", (generation, len(usuarios), segundos))
+    con.execute("DELETE FROM precomputed_recs WHERE generation < ?", (generation,))
+    con.execute("DELETE FROM precomputed_generations WHERE generation < ?", (generation,))
+    con.commit()
+    print(f"🎉 Generación {generation} publicada en {segundos}s")
+    return generation
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precalcula recomendaciones para todos los usuarios activos")
+    parser.add_argument("--db", default=recomendar.DATABASE_FILE)
+    parser.add_argument("--algoritmos", nargs="+", default=recomendar.ALGORITMOS_PRECALCULADOS)
+    parser.add_argument("--k", type=int, default=K)
+    parser.add_argument("--min-valoraciones", type=int, default=MIN_VALORACIONES)
+    args = parser.parse_args()
+
+    con = sqlite3.connect(args.db)
+    calcular(con, args.algoritmos, args.k, args.min_valoraciones)
+    con.close()
@@ -0,0 +1,116 @@
+## Recarga en caliente de los modelos (artefactos versionados)
+#
+# Un hilo revisa cada INTERVALO segundos la carpeta de generaciones que escribe
+# `python modelos.py`. Cuando aparece una más nueva la mapea en segundo plano
+# y la publica con una sola asignación (atómica), sin reiniciar la app.
+#
+# Cada request fija la generación vigente al empezar (instalar(app)), así que
+# un request en curso termina con los mismos modelos con los que arrancó. La
+# generación vieja se desmapea sola cuando el último request que la usaba
+# suelta la referencia.
+
+import glob
+import os
+import threading
+import time
+import weakref
+
+from flask import g, has_request_context
+
+import artefactos
+import modelos
+
+INTERVALO = 30  # segundos entre revisiones de la carpeta
+
+###
+
+class Generacion:
+    """Los modelos de una generación, listos para usar con modelos.recomendar_*.
+
+    Cada componente se mapea y se trae al page cache al cargar, y se guarda
+    cuánto tardó en `tiempos` (ms) para los logs y /ready (ver arranque.py).
+    """
+
+    def __init__(self, path):
+        self.nombre = os.path.basename(path)
+        self.tiempos = {}
+        self.artefacto = self._medir("artefacto", artefactos.Artefacto, path)
+        self.catalogo = self._medir("catalogo", artefactos.Catalogo, self.artefacto, calentar="recipes.")
+        self.ranking = self._medir("ranking", self.artefacto.arreglo, "top_n.ranking", calentar="top_n.")
+        self.vecinos = self._medir("vecinos", artefactos.VecinosCSR, self.artefacto, self.catalogo, calentar="pares.")
+        self.busqueda = None  # las generaciones anteriores al índice de búsqueda no lo traen
+        if "busqueda.titulos" in self.artefacto:
+            self.busqueda = self._medir("busqueda", artefactos.IndiceBusqueda, self.artefacto, calentar="busqueda.")
+        self.ingredientes = None  # ni las que se exportaron antes de correr ingredientes.py
+        if "ingredientes.nombres" in self.artefacto:
+            self.ingredientes = self._medir("ingredientes", artefactos.IndiceIngredientes, self.artefacto, self.catalogo,
+                                            calentar="ingredientes.")
+        weakref.finalize(self, print, f"🗑 Generación de modelos {self.nombre} liberada")
+
+    def _medir(self, componente, cargar, *args, calentar=None):
+        inicio = time.perf_counter()
+        valor = cargar(*args)
+        if calentar is not None:
+            self.artefacto.calentar(calentar)
+        self.tiempos[componente] = round((time.perf_counter() - inicio) * 1000, 2)
+        return valor
+
+_actual = None
+_lock = threading.Lock()
+_pid_hilo = None
+
+def actual():
+    """La generación del request en curso (o la vigente si no hay request). None si no hay modelos."""
+    if has_request_context() and "modelos" in g:
+        return g.modelos
+    return _actual
+
+def revisar(directorio=None):
+    """Carga y publica la generación más nueva de la carpeta, si cambió. Devuelve True si hubo cambio."""
+    global _actual
+    with _lock:
+        generaciones = sorted(glob.glob(os.path.join(directorio or modelos.MODELOS_DIR, "*.art")))
+        if not generaciones:
+            return False
+        ultima = generaciones[-1]
+        if _actual is not None and _actual.nombre == os.path.basename(ultima):
+            return False
+
+        inicio = time.perf_counter()
+        try:
+            nueva = Generacion(ultima)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo cargar la generación {ultima}: {e}")
+            return False
+        _actual = nueva  # swap atómico: los requests nuevos ya ven esta
+        detalle = ", ".join(f"{c} {ms} ms" for c, ms in nueva.tiempos.items())
+        print(f"🔄 Modelos: generación {nueva.nombre} cargada en {(time.perf_counter() - inicio) * 1000:.1f} ms ({detalle})")
+        return True
+
+def _vigilar(directorio, intervalo):
+    while True:
+        time.sleep(intervalo)
+        try:
+            revisar(directorio)
+        except Exception as e:
+            print(f"⚠️ Error revisando modelos: {e}")
+
+def iniciar(directorio=None, intervalo=INTERVALO):
+    """Carga la generación actual (si hay) y arranca el hilo que vigila la carpeta.
+
+    Los hilos no sobreviven a un fork (gunicorn --preload), así que se arranca uno por proceso.
+    """
+    global _pid_hilo
+    revisar(directorio)
+    if _pid_hilo != os.getpid():
+        _pid_hilo = os.getpid()
+        threading.Thread(target=_vigilar, args=(directorio, intervalo), name="recarga-modelos", daemon=True).start()
+
+def instalar(app, directorio=None, intervalo=INTERVALO):
+    @app.before_request
+    def _fijar_generacion():
+        if _pid_hilo != os.getpid():
+            iniciar(directorio, intervalo)
+        g.modelos = _actual
+
+    iniciar(directorio, intervalo)
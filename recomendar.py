@@ -1,20 +1,35 @@
 ## version: 1.0 -- recomendaciones al azar
 
-from flask import request
+from flask import request, g, has_request_context
 from math import log
 import sqlite3
 import os
 import random
+from collections import namedtuple
+import time
 
+import cache
+import escritor
+import ingredientes
 import metricas
+import modelos
+import monitoreo
+import perfil
+import recarga
 
 
 #DATABASE_FILE = os.path.dirname(os.path.abspath("__file__")) + "/datos/qll.db"
 DATABASE_FILE = os.path.dirname(__file__) + "/datos/foodcom.db"
 
+ESCRITURA_DIFERIDA = True # ratings e impresiones se escriben en segundo plano (ver escritor.py)
+ESCRITOR = escritor.EscritorDiferido(lambda: DATABASE_FILE)
+
+UMBRAL_PARES = 3 # rating mínimo (exclusivo) para que una review cuente como "le gustó" en pares
+
 ###
 
 def sql_execute(query, params=None):
+    inicio = time.perf_counter()
     con = sqlite3.connect(DATABASE_FILE)
     cur = con.cursor()
     if params:
@@ -24,9 +39,11 @@ def sql_execute(query, params=None):
 
     con.commit()
     con.close()
+    perfil.registrar(query, time.perf_counter() - inicio)
     return res
 
 def sql_select(query, params=None):
+    inicio = time.perf_counter()
     con = sqlite3.connect(DATABASE_FILE)
     con.row_factory = sqlite3.Row # esto es para que devuelva registros en el fetchall
     cur = con.cursor()
@@ -37,6 +54,7 @@ def sql_select(query, params=None):
 
     ret = res.fetchall()
     con.close()
+    perfil.registrar(query, time.perf_counter() - inicio, len(ret))
     return ret
 
 ###
@@ -48,40 +66,122 @@ def crear_usuario(name):
 
 def insertar_review(recipe_id, author_id, rating):
     query = f"INSERT INTO reviews(recipe_id, author, rating) VALUES (?, ?, ?) ON CONFLICT (recipe_id, author) DO UPDATE SET rating=?;" # si el rating existia lo actualizo
-    sql_execute(query, [recipe_id, author_id, rating, rating])
+    escribir(author_id, query, [recipe_id, author_id, rating, rating])
+    return
+
+def insertar_impresiones(id_recipes, author_id):
+    # marca recetas como vistas (rating = 0) sin pisar una valoración que ya exista
+    query = "INSERT INTO reviews(recipe_id, author, rating) VALUES (?, ?, 0) ON CONFLICT (recipe_id, author) DO NOTHING;"
+    for recipe_id in id_recipes:
+        escribir(author_id, query, [recipe_id, author_id])
     return
 
 def reset_usuario(author_id):
-    query = f"DELETE FROM reviews WHERE author_id = ?;"
-    sql_execute(query, [author_id])
+    query = f"DELETE FROM reviews WHERE author = ?;"
+    escribir(author_id, query, [author_id])
     return
 
+def escribir(author_id, query, params):
+    # escritura de datos de un usuario: diferida o sincrónica según ESCRITURA_DIFERIDA
+    if ESCRITURA_DIFERIDA:
+        inicio = time.perf_counter()
+        ESCRITOR.encolar(author_id, query, params)
+        perfil.registrar("[diferida] " + query, time.perf_counter() - inicio)
+    else:
+        sql_execute(query, params)
+    if has_request_context():
+        g.get("estados_usuario", {}).pop(author_id, None) # el estado cargado en este request quedó viejo
+
 def obtener_receta(recipe_id):
-    query = "SELECT * FROM recipes WHERE recipe_id = ?;"
-    recipe = sql_select(query, [recipe_id])[0]
+    recipe = datos_recipes([recipe_id])[0]
     return recipe
 
-def items_valorados(author_id):
-    query = f"SELECT recipe_id FROM reviews WHERE author = ? AND rating > 0"
+EstadoUsuario = namedtuple("EstadoUsuario", ["valorados", "vistos"])
+
+def estado_usuario(author_id):
+    # valorados y vistos en una sola consulta; dentro de un request se reutiliza hasta que el usuario escriba
+    estados = g.setdefault("estados_usuario", {}) if has_request_context() else {}
+    if author_id in estados:
+        return estados[author_id]
+
+    ESCRITOR.sincronizar(author_id) # que vea sus propias escrituras
+    query = f"SELECT recipe_id, rating FROM reviews WHERE author = ? AND rating IS NOT NULL"
     rows = sql_select(query, [author_id])
-    return [i["recipe_id"] for i in rows]
+    estado = EstadoUsuario([r["recipe_id"] for r in rows if r["rating"] > 0],
+                           [r["recipe_id"] for r in rows if r["rating"] == 0])
+    estados[author_id] = estado
+    return estado
+
+def items_valorados(author_id):
+    return estado_usuario(author_id).valorados
 
 def items_vistos(author_id):
-    query = f"SELECT recipe_id FROM reviews WHERE author = ? AND rating = 0"
-    rows = sql_select(query, [author_id])
-    return [i["recipe_id"] for i in rows]
+    return estado_usuario(author_id).vistos
+
+def contadores_usuario(author_id):
+    # (cant_valorados, cant_vistos) para el encabezado: de user_stats (ver migraciones.py), sin traer las listas
+    estado = g.get("estados_usuario", {}).get(author_id) if has_request_context() else None
+    if estado is not None:
+        return len(estado.valorados), len(estado.vistos)
+
+    ESCRITOR.sincronizar(author_id)
+    try:
+        rows = sql_select("SELECT valorados, vistos FROM user_stats WHERE author = ?", [author_id])
+    except sqlite3.OperationalError: # base sin migrar
+        estado = estado_usuario(author_id)
+        return len(estado.valorados), len(estado.vistos)
+    return (rows[0]["valorados"], rows[0]["vistos"]) if rows else (0, 0)
 
 def items_desconocidos(author_id):
+    ESCRITOR.sincronizar(author_id)
     query = f"SELECT recipe_id FROM recipes WHERE recipe_id NOT IN (SELECT recipe_id FROM reviews WHERE author = ? AND rating IS NOT NULL)"
     rows = sql_select(query, [author_id])
     return [i["recipe_id"] for i in rows]
 
+### Caché de recetas: las filas de recipes casi nunca cambian ###
+CACHE_RECETAS = cache.CacheLRU("recetas", maximo=20000)
+_tipos_receta = {}
+
+def _clave_receta(recipe_id):
+    # los ids llegan como int de los recomendadores y como str desde la URL
+    try:
+        return int(recipe_id)
+    except (TypeError, ValueError):
+        return recipe_id
+
+def _tipo_receta(columnas):
+    # namedtuple con las columnas de recipes: más liviana que sqlite3.Row y con acceso recipe.title
+    if columnas not in _tipos_receta:
+        _tipos_receta[columnas] = namedtuple("Receta", columnas)
+    return _tipos_receta[columnas]
+
 def datos_recipes(id_recipes):
-    query = f"SELECT DISTINCT * FROM recipes WHERE recipe_id IN ({','.join(['?']*len(id_recipes))})"
-    recipes = sql_select(query, id_recipes)
-    return recipes
+    # devuelve las recetas en el orden pedido; las que no están en caché se traen en una sola consulta
+    claves = list(dict.fromkeys(_clave_receta(i) for i in id_recipes))
+    recipes, faltan = CACHE_RECETAS.obtener_muchos(claves)
+
+    if faltan:
+        query = f"SELECT * FROM recipes WHERE recipe_id IN ({','.join(['?']*len(faltan))})"
+        rows = sql_select(query, faltan)
+        if rows:
+            Receta = _tipo_receta(tuple(rows[0].keys()))
+            nuevas = {r["recipe_id"]: Receta(*r) for r in rows}
+            CACHE_RECETAS.guardar_muchos(nuevas)
+            recipes.update(nuevas)
+
+    return [recipes[c] for c in claves if c in recipes]
+
+def invalidar_recetas(id_recipes=None):
+    # para llamar después de actualizar recipes (sin argumentos vacía toda la caché)
+    CACHE_RECETAS.invalidar(None if id_recipes is None else [_clave_receta(i) for i in id_recipes])
 
 def buscar_recetas(query):
+    # con el snapshot de modelos cargado (ver arranque.py) se busca en memoria, sin recorrer recipes
+    generacion = recarga.actual()
+    if generacion is not None and generacion.busqueda is not None:
+        ids = generacion.busqueda.buscar(query, 15)
+        return [{"recipe_id": i, "title": generacion.catalogo.titulo(i)} for i in ids]
+
     texto = f"%{query.lower()}%"
     sql = """
         SELECT recipe_id, title
@@ -92,7 +192,50 @@ def buscar_recetas(query):
     """
     return sql_select(sql, (texto,))
 
-
+def recetas_con_ingredientes(incluidos, excluidos=(), N=50):
+    # con el snapshot se intersecan las posting lists en memoria; si no, recipe_ingredients con SQL (sin LIKE)
+    incluidos = [n for n in map(ingredientes.normalizar, incluidos) if n]
+    excluidos = [n for n in map(ingredientes.normalizar, excluidos) if n]
+    if not incluidos:
+        return []
+    generacion = recarga.actual()
+    if generacion is not None and generacion.ingredientes is not None:
+        return generacion.ingredientes.filtrar(incluidos, excluidos, N)
+
+    sql = f"""
+        SELECT recipe_id
+        FROM recipes
+        WHERE recipe_id IN (
+            SELECT recipe_id FROM recipe_ingredients JOIN ingredient_vocab USING (ingredient_id)
+            WHERE name IN ({",".join("?"*len(incluidos))})
+            GROUP BY recipe_id
+            HAVING count(*) = ?
+        )
+        AND recipe_id NOT IN (
+            SELECT recipe_id FROM recipe_ingredients JOIN ingredient_vocab USING (ingredient_id)
+            WHERE name IN ({",".join("?"*len(excluidos))})
+        )
+        ORDER BY num_ratings DESC, recipe_id
+        LIMIT ?
+    """
+    return [r["recipe_id"] for r in sql_select(sql, incluidos + [len(set(incluidos))] + excluidos + [N])]
+
+def similares_por_ingredientes(recipe_id, N=8, excluir=()):
+    generacion = recarga.actual()
+    if generacion is not None and generacion.ingredientes is not None:
+        return generacion.ingredientes.similares(int(recipe_id), N, set(excluir))
+
+    # sin snapshot: cantidad de ingredientes en común (sin pesar por idf)
+    res = sql_select("""
+        SELECT b.recipe_id AS recipe_id
+        FROM recipe_ingredients AS a
+        JOIN recipe_ingredients AS b ON a.ingredient_id = b.ingredient_id AND b.recipe_id != a.recipe_id
+        WHERE a.recipe_id = ?
+        GROUP BY b.recipe_id
+        ORDER BY count(*) DESC, b.recipe_id
+        LIMIT ?
+    """, (recipe_id, N + len(excluir)))
+    return [r["recipe_id"] for r in res if r["recipe_id"] not in excluir][:N]
 
 ###
 
@@ -110,39 +253,91 @@ def recomendador_top_n(id_usuario, recipes_relevantes, recipes_desconocidos, N):
     """, recipes_desconocidos + [N])
     return [r["recipe_id"] for r in res]
 
-def recomendador_pares(id_usuario, recipes_relevantes, recipes_desconocidos, N):
+def recomendador_pares(id_usuario, recipes_relevantes, recipes_desconocidos, N, umbral=UMBRAL_PARES):
     if len(recipes_relevantes) == 0:
         return recomendador_top_n(id_usuario, recipes_relevantes, recipes_desconocidos, N)
 
     res = sql_select(f"""
-        SELECT recipe_id
+        SELECT r2.recipe_id AS recipe_id
         FROM reviews AS r1
         JOIN reviews AS r2 ON r1.author = r2.author
         WHERE r1.recipe_id IN ({",".join("?"*len(recipes_relevantes))})
           AND r2.recipe_id IN ({",".join("?"*len(recipes_desconocidos))})
           AND r1.recipe_id != r2.recipe_id
-          AND r1.rating > 3
-          AND r2.rating > 3
-        GROUP BY recipe_id
+          AND r1.rating > ?
+          AND r2.rating > ?
+        GROUP BY r2.recipe_id
         ORDER BY count(*) DESC
         LIMIT ?
-    """, recipes_relevantes + recipes_desconocidos + [N])
+    """, recipes_relevantes + recipes_desconocidos + [umbral, umbral, N])
 
     return [r["recipe_id"] for r in res]
 
+### Recomendaciones precalculadas (ver precalcular.py) ###
+ALGORITMOS_PRECALCULADOS = ["top_n", "pares"] # los que no necesitan frescura por request
+N_RANKING = 64 # largo de las listas precalculadas y del ranking que pagina /api/recomendaciones
+
+def recomendaciones_precalculadas(id_usuario, algoritmo, N):
+    # top-K de la última generación, sin lo que el usuario vio o valoró después de calcularla
+    query = """
+        SELECT recipe_id
+        FROM precomputed_recs
+        WHERE generation = (SELECT max(generation) FROM precomputed_generations)
+          AND algoritmo = ?
+          AND author = ?
+          AND recipe_id NOT IN (SELECT recipe_id FROM reviews WHERE author = ?)
+        ORDER BY pos
+        LIMIT ?
+    """
+    ESCRITOR.sincronizar(id_usuario)
+    try:
+        rows = sql_select(query, [algoritmo, id_usuario, id_usuario, N])
+    except sqlite3.OperationalError: # todavía no se corrió el batch
+        return []
+    return [r["recipe_id"] for r in rows]
+
 ### Router basado en cookie ###
 def recomendar(id_usuario, relevantes=None, desconocidos=None, N=16):
+    algoritmo = request.cookies.get("algoritmo", "azar")
+    inicio = time.perf_counter()
+
+    # si no es una evaluación (que pasa sus propios relevantes/desconocidos), sirvo lo precalculado
+    if relevantes is None and desconocidos is None and algoritmo in ALGORITMOS_PRECALCULADOS:
+        id_recipes = recomendaciones_precalculadas(id_usuario, algoritmo, N)
+        monitoreo.cache("precalculadas", len(id_recipes) == N)
+        if len(id_recipes) == N:
+            monitoreo.observar("recetamatch_recomendador_seconds", time.perf_counter() - inicio,
+                               algoritmo=algoritmo, origen="precalculado")
+            return id_recipes
+        # usuario nuevo o lista agotada: scoring en vivo
+
+    # con modelos cargados (ver recarga.py) no hace falta traer todo el catálogo desconocido
+    generacion = recarga.actual()
+    if relevantes is None and desconocidos is None and generacion is not None and algoritmo in ALGORITMOS_PRECALCULADOS:
+        valorados, vistos = estado_usuario(id_usuario)
+        conocidos = set(valorados) | set(vistos)
+        if algoritmo == "pares":
+            id_recipes = modelos.recomendar_pares(generacion.vecinos, generacion.ranking, valorados, conocidos, N)
+        else:
+            id_recipes = modelos.recomendar_top_n(generacion.ranking, conocidos, N)
+        monitoreo.observar("recetamatch_recomendador_seconds", time.perf_counter() - inicio,
+                           algoritmo=algoritmo, origen="modelo")
+        return id_recipes
+
     relevantes = relevantes or items_valorados(id_usuario)
     desconocidos = desconocidos or items_desconocidos(id_usuario)
 
-    algoritmo = request.cookies.get("algoritmo", "azar")
-
     if algoritmo == "top_n":
-        return recomendador_top_n(id_usuario, relevantes, desconocidos, N)
+        id_recipes = recomendador_top_n(id_usuario, relevantes, desconocidos, N)
     elif algoritmo == "pares":
-        return recomendador_pares(id_usuario, relevantes, desconocidos, N)
+        id_recipes = recomendador_pares(id_usuario, relevantes, desconocidos, N)
     else:
-        return recomendador_azar(id_usuario, relevantes, desconocidos, N)
+        algoritmo = "azar"
+        id_recipes = recomendador_azar(id_usuario, relevantes, desconocidos, N)
+
+    monitoreo.observar("recetamatch_recomendador_seconds", time.perf_counter() - inicio,
+                       algoritmo=algoritmo, origen="vivo")
+    return id_recipes
 
 def recomendador_contexto(id_usuario, id_recipe, recipes_relevantes=None, recipes_desconocidos=None, N=4):
     recipes_relevantes = recipes_relevantes or items_valorados(id_usuario)
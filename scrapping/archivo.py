@@ -0,0 +1,303 @@
+# archivo.py
+# Archivo de respuestas crudas de los scrapers, para re-parsear sin re-crawlear.
+#
+# Cada fase agrega cada respuesta 200 que baja a segmentos JSONL comprimidos
+# con gzip (zstd no está entre las dependencias) en raw/<fase>/. Los registros
+# se juntan en bloques de ~BLOCK_BYTES que se comprimen como un miembro gzip
+# independiente, así que se puede leer cualquier bloque con seek + decompress.
+# Un índice SQLite (raw/<fase>/index.sqlite) guarda dónde quedó cada respuesta:
+#   (key, page) -> (segmento, offset del bloque, largo, línea dentro del bloque)
+# Los segmentos rotan al pasar SEGMENT_BYTES; cada proceso escribe los suyos.
+#
+# El replay vuelve a correr el parseo de cada fase sobre lo archivado,
+# repartido entre procesos, y escribe el resultado con las mismas funciones de
+# guardado de la fase. Qué respuestas entran depende de la fase:
+#   recipes, details: la última de cada (key, page)
+#   reviews: las páginas de la bajada más nueva de la página 1 (si la receta
+#            perdió reviews, las páginas altas de antes ya no cuentan)
+#   users: todas; el feed se arma juntando las actividades de todas las
+#          corridas, porque las incrementales solo bajan las primeras páginas
+#
+# Uso:
+#   python archivo.py stats
+#   python archivo.py replay reviews --db foodcom_nuevo.db --procesos 8
+
+import argparse
+import atexit
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+ARCHIVE_DIR = "raw"
+BLOCK_BYTES = 1 << 20       # 1 MB sin comprimir por bloque
+SEGMENT_BYTES = 256 << 20   # 256 MB comprimidos por segmento
+STAGES = ["recipes", "details", "reviews", "users"]
+CHUNK_KEYS = 2000           # keys por tarea del replay
+
+class Archive:
+    """Agrega respuestas crudas de una fase. Es seguro usarlo desde varios hilos."""
+
+    def __init__(self, stage, directory=ARCHIVE_DIR, enabled=True):
+        self.stage = stage
+        self.directory = os.path.join(directory, stage)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.lines = []
+        self.pending = []    # (key, page, fetched_at) de las líneas del bloque en curso
+        self.size = 0
+        self.segment = None
+        self.file = None
+        self.index = None
+        self.rotation = 0
+        atexit.register(self.close)
+
+    def append(self, key, page, url, body, ref=None):
+        """Guarda una respuesta. key identifica la entidad (página, recipe_id, user_id); page la página dentro de ella."""
+        if not self.enabled:
+            return
+        fetched_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        line = json.dumps({"k": str(key), "p": page, "u": url, "r": ref, "t": fetched_at, "b": body},
+                          ensure_ascii=False).encode() + b"\n"
+        with self.lock:
+            self.lines.append(line)
+            self.pending.append((str(key), page, fetched_at))
+            self.size += len(line)
+            if self.size >= BLOCK_BYTES:
+                self._write_block()
+
+    def flush(self):
+        with self.lock:
+            if self.lines:
+                self._write_block()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+            if self.index:
+                self.index.close()
+                self.index = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.index is None:
+            self.index = open_index(self.directory)
+        if self.file is None or self.file.tell() >= SEGMENT_BYTES:
+            if self.file:
+                self.file.close()
+            self.rotation += 1
+            self.segment = f"seg-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.rotation:04d}.jsonl.gz"
+            self.file = open(os.path.join(self.directory, self.segment), "ab")
+
+    def _write_block(self):
+        self._open()
+        block = gzip.compress(b"".join(self.lines), compresslevel=6)
+        offset = self.file.tell()
+        self.file.write(block)
+        self.file.flush()
+        self.index.executemany(
+            "INSERT INTO entries (key, page, segment, offset, length, line, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(key, page, self.segment, offset, len(block), i, fetched_at)
+             for i, (key, page, fetched_at) in enumerate(self.pending)])
+        self.index.commit()
+        self.lines, self.pending, self.size = [], [], 0
+
+def open_index(directory):
+    conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30, check_same_thread=False)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            key TEXT,
+            page INTEGER,
+            segment TEXT,
+            offset INTEGER,
+            length INTEGER,
+            line INTEGER,
+            fetched_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_key ON entries(key, page);
+    """)
+    return conn
+
+def read_block(directory, segment, offset, length):
+    with open(os.path.join(directory, segment), "rb") as f:
+        f.seek(offset)
+        return gzip.decompress(f.read(length)).splitlines()
+
+# --- replay ---
+
+SELECTS = {
+    "latest": """
+        SELECT id, key, page, segment, offset, length, line FROM entries
+        WHERE id IN (SELECT max(id) FROM entries GROUP BY key, page)
+    """,
+    "newest_first_page": """
+        WITH first_page AS (SELECT key, max(id) AS since FROM entries WHERE page = 1 GROUP BY key)
+        SELECT id, key, page, segment, offset, length, line FROM entries
+        WHERE id IN (
+            SELECT max(e.id) FROM entries e JOIN first_page f ON e.key = f.key AND e.id >= f.since
+            GROUP BY e.key, e.page
+        )
+    """,
+    "all": "SELECT id, key, page, segment, offset, length, line FROM entries",
+}
+STAGE_SELECT = {"recipes": "latest", "details": "latest", "reviews": "newest_first_page", "users": "all"}
+
+def replay_entries(directory, stage):
+    """{key: [(id, page, segment, offset, length, line), ...]} con las respuestas de cada key que usa el replay de `stage`."""
+    conn = open_index(directory)
+    entries = defaultdict(list)
+    for id_, key, page, segment, offset, length, line in conn.execute(
+            SELECTS[STAGE_SELECT[stage]] + " ORDER BY segment, offset, line"):
+        entries[key].append((id_, page, segment, offset, length, line))
+    conn.close()
+    return entries
+
+def _load_pages(directory, entries, blocks):
+    """[(page, registro)] en el orden en que se bajaron."""
+    pages = []
+    for _, page, segment, offset, length, line in sorted(entries):
+        if (segment, offset) not in blocks:
+            blocks[(segment, offset)] = read_block(directory, segment, offset, length)
+        pages.append((page, json.loads(blocks[(segment, offset)][line])))
+    return pages
+
+def _parse_recipes(key, pages):
+    import fase1_recetas
+    _, record = pages[-1]
+    results = json.loads(record["b"]).get("response", {}).get("results", [])
+    return [fase1_recetas.parse_recipe(r) for r in results]
+
+def _parse_details(key, pages):
+    import fase2_detalles_recetas
+    _, record = pages[-1]
+    parsed = fase2_detalles_recetas.parse_recipe(json.loads(record["b"]), record["r"])
+    return [parsed] if parsed else []
+
+def _parse_reviews(key, pages):
+    import fase3_review
+    rows = []
+    for _, record in sorted(pages, key=lambda p: p[0]):
+        rows.extend(fase3_review.parse_reviews(json.loads(record["b"]), int(key)))
+    return rows
+
+def _parse_users(key, pages):
+    import fase4_user
+    # las páginas vienen de todas las corridas: una incremental trae una página 1 nueva que
+    # empuja a la página 2 actividades que solo están en la página 1 de la corrida completa.
+    # Se juntan todas las actividades (la versión más nueva de cada una), del feed más nuevo
+    # al más viejo, y se vuelve a paginar
+    first = next((json.loads(record["b"]) for page, record in reversed(pages) if page == 1), None)
+    if not first or "data" not in first:
+        return []
+    items, seen = [], set()
+    for _, record in reversed(pages):
+        for item in json.loads(record["b"]).get("data", {}).get("items", []):
+            if item.get("id") not in seen:
+                seen.add(item.get("id"))
+                items.append(item)
+    items.sort(key=lambda item: item.get("submitted") or item.get("createdOn") or "", reverse=True)
+
+    def fetch_page(page):
+        chunk = items[(page - 1) * fase4_user.PAGE_SIZE:page * fase4_user.PAGE_SIZE]
+        data = {"items": chunk}
+        if page == 1 and "user" in first["data"]:
+            data["user"] = first["data"]["user"]
+        return {"data": data}, None
+
+    summary = fase4_user.summarize_user(int(key), fetch_page=fetch_page)
+    return [summary] if summary["name"] else []
+
+PARSERS = {"recipes": _parse_recipes, "details": _parse_details, "reviews": _parse_reviews, "users": _parse_users}
+
+def _replay_chunk(args):
+    directory, stage, chunk = args
+    blocks = {}  # bloques ya descomprimidos en esta tarea
+    rows = []
+    for key, entries in chunk:
+        rows.extend(PARSERS[stage](key, _load_pages(directory, entries, blocks)))
+    return len(chunk), rows
+
+def _writer(stage, db_path):
+    """Función que guarda un lote de filas parseadas con el guardado de la fase, contra db_path."""
+    if stage == "recipes":
+        import fase1_recetas as fase
+        fase.DB_PATH = db_path
+        fase.create_tables()
+        return fase.save_batch
+    if stage == "details":
+        import fase2_detalles_recetas as fase
+        conn = sqlite3.connect(db_path)
+        fase.create_tables(conn)
+
+        def write(parsed):
+            fase.write_recipes(conn, parsed)
+            conn.commit()
+        return write
+    if stage == "reviews":
+        import fase3_review as fase
+        fase.DB_PATH = db_path
+        fase.create_table()
+        return fase.save_reviews
+    import fase4_user as fase
+    fase.DB_PATH = db_path
+    fase.create_users_table()
+    return fase.save_users
+
+def replay(stage, db_path, processes=None, directory=ARCHIVE_DIR):
+    start = time.perf_counter()
+    stage_dir = os.path.join(directory, stage)
+    entries = replay_entries(stage_dir, stage)
+    keys = list(entries.items())  # ya vienen en orden de archivo: cada tarea lee bloques contiguos
+    chunks = [(stage_dir, stage, keys[i:i + CHUNK_KEYS]) for i in range(0, len(keys), CHUNK_KEYS)]
+    print(f"🔁 Replay de {stage}: {len(keys)} entidades en {len(chunks)} tareas → {db_path}")
+
+    write = _writer(stage, db_path)
+    done = rows_written = 0
+    with Pool(processes) as pool:
+        for n, rows in pool.imap_unordered(_replay_chunk, chunks):
+            if rows:
+                write(rows)
+            done += n
+            rows_written += len(rows)
+            print(f"💾 {done}/{len(keys)} entidades, {rows_written} filas")
+
+    elapsed = time.perf_counter() - start
+    print(f"🎉 Replay de {stage} completo: {rows_written} filas en {elapsed:.1f}s "
+          f"({done / max(elapsed, 1e-9):.0f} entidades/s)")
+
+def stats(directory=ARCHIVE_DIR):
+    for stage in STAGES:
+        stage_dir = os.path.join(directory, stage)
+        if not os.path.exists(os.path.join(stage_dir, "index.sqlite")):
+            continue
+        conn = open_index(stage_dir)
+        n, keys, first, last = conn.execute(
+            "SELECT count(*), count(DISTINCT key), min(fetched_at), max(fetched_at) FROM entries").fetchone()
+        conn.close()
+        size = sum(os.path.getsize(os.path.join(stage_dir, f)) for f in os.listdir(stage_dir) if f.endswith(".gz"))
+        print(f"📦 {stage}: {n} respuestas de {keys} entidades, {size / 1e6:.1f} MB comprimidos ({first} → {last})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archivo de respuestas crudas de los scrapers")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="resumen del archivo")
+    p_replay = sub.add_parser("replay", help="re-parsea una fase desde el archivo")
+    p_replay.add_argument("stage", choices=STAGES)
+    p_replay.add_argument("--db", default="foodcom.db")
+    p_replay.add_argument("--procesos", type=int, default=None, help="por defecto, uno por CPU")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats(args.dir)
+    else:
+        replay(args.stage, args.db, args.procesos, args.dir)
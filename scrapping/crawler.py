@@ -0,0 +1,732 @@
+# crawler.py
+# Framework común para las fases del scraping: una sola corrida que baja
+# recetas, detalles, reviews y usuarios a la vez.
+#
+# Cada fase es una Stage con cuatro piezas:
+#   seed(conn)                -> trabajos iniciales [(key, payload)]
+#   fetch(ctx, key, payload)  -> (valor, huella); baja y parsea, corre en los hilos fetchers
+#   write(conn, results)      -> escribe un lote de Result dentro de la transacción del coordinador
+#   emit(result)              -> trabajos para otras fases {stage: [(key, payload)]}
+#
+# Los trabajos viven en la tabla crawl_jobs, uno por (stage, key), con estado
+# pending / running / done / failed. El coordinador tiene la única conexión de
+# escritura: reparte trabajos pendientes a los fetchers y, en la misma
+# transacción en que guarda sus resultados, los marca done y encola lo que
+# emiten. Así, apenas se guarda una página de recetas ya hay trabajos de
+# detalles y reviews para esas recetas, y apenas se guardan reviews, de sus
+# autores: las fases de abajo no esperan a que termine la de arriba.
+# Al arrancar, los trabajos que quedaron en running (corrida cortada) vuelven
+# a pending; se asume un solo crawler por base.
+#
+# Un trabajo que falla queda en failed y se anota en crawl_failures con su
+# próximo intento (backoff exponencial con jitter, ver fallos.py). El mismo
+# coordinador hace de worker de reintentos: cada RETRY_EVERY segundos vuelve a
+# encolar los fallos vencidos, también los que anotaron las fases sueltas, y
+# mientras queden reintentos programados la corrida espera en vez de terminar.
+#
+# Todos los pedidos salen por una sola sesión HTTP con pool de conexiones y
+# un rate limiter compartido que se frena ante 429/5xx. Las huellas
+# (huellas.py) y el archivo de respuestas crudas (archivo.py) funcionan igual
+# que en las fases sueltas, que siguen andando por su cuenta pero usan la
+# misma sesión (make_session) y el mismo RateLimiter de acá, y el mismo
+# parseo y paginado de cada fase.
+#
+# Uso:
+#   python crawler.py run                                  # las cuatro fases
+#   python crawler.py run --stages reviews users --seed    # encola desde lo que ya hay en la base
+#   python crawler.py run --stub http://127.0.0.1:8765     # contra stub_server.py
+#   python crawler.py run --retry-failed                   # vuelve a intentar también los abandonados
+#   python crawler.py status
+
+import argparse
+import json
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+import archivo
+import fallos
+import huellas
+
+DB_PATH = "foodcom.db"
+WORKERS = 8            # fetchers en paralelo, entre todas las fases
+RATE = 5.0             # pedidos por segundo entre todos los hilos
+RETRY_EVERY = 5.0      # segundos entre pasadas del worker de reintentos
+BATCH_JOBS = 200       # resultados por transacción
+BATCH_SECONDS = 2.0    # o commit cada tantos segundos, lo que pase primero
+STATS_EVERY = 10.0     # segundos entre reportes de métricas
+TIMEOUT = 20
+USER_AGENT = "Mozilla/5.0 (compatible; food-scraper/1.0)"
+
+# --- trabajos ---
+
+def create_jobs_table(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS crawl_jobs (
+            id INTEGER PRIMARY KEY,
+            stage TEXT NOT NULL,
+            key TEXT NOT NULL,
+            payload TEXT,
+            state TEXT NOT NULL DEFAULT 'pending' CHECK (state IN ('pending', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            UNIQUE (stage, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_crawl_jobs_state ON crawl_jobs(stage, state, id);
+    """)
+
+def enqueue(conn, stage, items):
+    """Agrega trabajos [(key, payload)]; los que ya existen (en cualquier estado) no se tocan."""
+    conn.executemany("""
+        INSERT OR IGNORE INTO crawl_jobs (stage, key, payload, created_at, updated_at)
+        VALUES (?, ?, ?, datetime('now'), datetime('now'))
+    """, [(stage, str(key), json.dumps(payload) if payload is not None else None) for key, payload in items])
+
+def claim(conn, stage, n):
+    """Pasa hasta n trabajos pendientes (los más viejos primero) a running y los devuelve."""
+    rows = conn.execute("""
+        UPDATE crawl_jobs SET state = 'running', updated_at = datetime('now')
+        WHERE id IN (SELECT id FROM crawl_jobs WHERE stage = ? AND state = 'pending' ORDER BY id LIMIT ?)
+        RETURNING id, key, payload, attempts
+    """, (stage, n)).fetchall()
+    return [Job(job_id, stage, key, json.loads(payload) if payload else None, attempts)
+            for job_id, key, payload, attempts in sorted(rows)]
+
+def reset(conn, stages, states):
+    """Vuelve a pending los trabajos de esas fases en esos estados; devuelve cuántos."""
+    return conn.execute(f"""
+        UPDATE crawl_jobs SET state = 'pending', updated_at = datetime('now')
+        WHERE stage IN ({', '.join('?' * len(stages))}) AND state IN ({', '.join('?' * len(states))})
+    """, [*stages, *states]).rowcount
+
+def job_counts(conn):
+    """{stage: {state: n}}"""
+    counts = defaultdict(dict)
+    for stage, state, n in conn.execute("SELECT stage, state, count(*) FROM crawl_jobs GROUP BY stage, state"):
+        counts[stage][state] = n
+    return counts
+
+Job = namedtuple("Job", "id stage key payload attempts")
+
+class Result(namedtuple("Result", "key payload value record")):
+    """Lo que devolvió fetch para un trabajo; record es la huella (o None)."""
+
+    __slots__ = ()
+
+    @property
+    def unchanged(self):
+        return self.record is not None and self.record.unchanged
+
+class FetchError(Exception):
+    """Respuesta que no sirve. Los 429/5xx y errores de conexión se reintentan; el resto falla directo."""
+
+    def __init__(self, status, url, retry_after=None):
+        super().__init__(f"HTTP {status} en {url}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status == 429 or self.status >= 500
+
+# --- recursos compartidos ---
+
+class RateLimiter:
+    """Reparte los pedidos de todos los hilos a `rate` por segundo. Baja la tasa ante 429/5xx y la recupera de a poco."""
+
+    def __init__(self, rate):
+        self.max_rate = rate
+        self.rate = rate
+        self.next = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next)
+            self.next = slot + 1.0 / self.rate
+        time.sleep(max(0.0, slot - now))
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+def make_session(pool_size=10, retries=0):
+    """Una sesión para todos los hilos: el pool de urllib3 reusa las conexiones por host.
+
+    Por defecto sin Retry de urllib3: el crawler reintenta el trabajo entero, con
+    backoff (ver fallos.py). Con retries, reintenta los 5xx con backoff corto.
+    """
+    s = requests.Session()
+    max_retries = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504)) if retries else 0
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=max_retries)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"User-Agent": USER_AGENT})
+    return s
+
+class Metrics:
+    """Contadores por fase; report() imprime el throughput desde el último reporte y el acumulado."""
+
+    FIELDS = ["claimed", "done", "unchanged", "retried", "failed", "requests", "bytes"]
+
+    def __init__(self, stages):
+        self.lock = threading.Lock()
+        self.start = self.last = time.perf_counter()
+        self.counts = {s: dict.fromkeys(self.FIELDS, 0) for s in stages}
+        self.prev = {s: dict(c) for s, c in self.counts.items()}
+        self.statuses = {s: defaultdict(int) for s in stages}
+        self.fetch_seconds = dict.fromkeys(stages, 0.0)
+        self.commits = 0
+        self.commit_seconds = 0.0
+
+    def add(self, stage, **counts):
+        with self.lock:
+            for k, v in counts.items():
+                self.counts[stage][k] += v
+
+    def request(self, stage, status, size):
+        with self.lock:
+            self.counts[stage]["requests"] += 1
+            self.counts[stage]["bytes"] += size
+            self.statuses[stage][status] += 1
+
+    def fetched(self, stage, seconds):
+        with self.lock:
+            self.fetch_seconds[stage] += seconds
+
+    def committed(self, seconds):
+        with self.lock:
+            self.commits += 1
+            self.commit_seconds += seconds
+
+    def report(self, pending, rate, final=False):
+        with self.lock:
+            now = time.perf_counter()
+            counts = {s: dict(c) for s, c in self.counts.items()}
+            elapsed = (now - self.start) if final else (now - self.last)
+            base = {s: dict.fromkeys(self.FIELDS, 0) for s in counts} if final else self.prev
+            self.prev, self.last = counts, now
+            commit_avg = self.commit_seconds / max(1, self.commits)
+        for stage, c in counts.items():
+            delta = {k: c[k] - base[stage][k] for k in c}
+            finished = c["done"] + c["unchanged"] + c["failed"] + c["retried"]
+            print(f"📈 {stage:8s} {delta['done'] / elapsed:7.1f} trabajos/s, {delta['requests'] / elapsed:6.1f} pedidos/s "
+                  f"({self.fetch_seconds[stage] / max(1, finished):.2f}s c/u) | total: {c['done']} hechos, "
+                  f"{c['unchanged']} sin cambios, {c['retried']} reintentos, {c['failed']} fallidos | "
+                  f"pendientes: {pending.get(stage, 0)}")
+        print(f"📈 tasa {rate:.2f}/s | {self.commits} commits ({commit_avg * 1000:.0f} ms c/u)")
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "seconds": round(time.perf_counter() - self.start, 3),
+                "commits": self.commits,
+                "commit_seconds": round(self.commit_seconds, 3),
+                "stages": {s: dict(c, fetch_seconds=round(self.fetch_seconds[s], 3),
+                                   statuses={str(k): v for k, v in self.statuses[s].items()})
+                           for s, c in self.counts.items()},
+            }
+
+class Context:
+    """Lo que comparten los fetchers: sesión, rate limiter, huellas, archivo y métricas."""
+
+    def __init__(self, db_path, workers, rate, metrics, fingerprints=True, archive=True):
+        self.session = make_session(workers)
+        self.limiter = RateLimiter(rate)
+        self.fingerprints = huellas.Fingerprints(db_path, enabled=fingerprints)
+        self.archives = {stage: archivo.Archive(stage, enabled=archive) for stage in STAGES}
+        self.metrics = metrics
+
+    def get(self, stage, url, params=None, headers=None, conditional=False):
+        """(response, huella). Con conditional, el pedido usa las huellas y la huella puede venir unchanged.
+
+        Lanza FetchError si la respuesta no es 200 (ni 304 de un pedido condicional).
+        """
+        self.limiter.acquire()
+        if conditional:
+            r, record = self.fingerprints.get(self.session, url, params=params, headers=headers, timeout=TIMEOUT)
+        else:
+            r, record = self.session.get(url, params=params, headers=headers, timeout=TIMEOUT), None
+        self.metrics.request(stage, r.status_code, len(r.content))
+        if r.status_code == 200 or (record and record.unchanged):
+            self.limiter.speed_up()
+            return r, record
+        if r.status_code == 429 or r.status_code >= 500:
+            self.limiter.slow_down()
+        raise FetchError(r.status_code, r.url, r.headers.get("Retry-After"))
+
+    def archive(self, stage):
+        return self.archives[stage]
+
+# --- fases ---
+
+class Stage:
+    """Una fase del crawl. Las subclases definen name, url y las cuatro piezas."""
+
+    name = None
+    url = None
+
+    def prepare(self, conn, db_path):
+        """Crea las tablas de la fase."""
+
+    def seed(self, conn):
+        """Trabajos a encolar desde lo que ya hay en la base (run --seed)."""
+        return []
+
+    def fetch(self, ctx, key, payload):
+        raise NotImplementedError
+
+    def write(self, conn, results):
+        raise NotImplementedError
+
+    def emit(self, result):
+        return {}
+
+class RecipesStage(Stage):
+    """Páginas del listado de recetas. Cada página con recetas encola la que está WINDOW más adelante,
+    así hay hasta WINDOW páginas en vuelo y la cadena se corta sola en la primera vacía."""
+
+    name = "recipes"
+    WINDOW = 16
+
+    def __init__(self, url=None):
+        import fase1_recetas
+        self.fase = fase1_recetas
+        self.url = url or fase1_recetas.API_URL
+        self.total_pages = math.ceil(fase1_recetas.MAX_RECIPES / fase1_recetas.RECIPES_PER_PAGE)
+
+    def prepare(self, conn, db_path):
+        self.fase.DB_PATH = db_path
+        self.fase.create_tables()
+
+    def seed(self, conn):
+        return [(page, None) for page in range(1, min(self.WINDOW, self.total_pages) + 1)]
+
+    def fetch(self, ctx, key, payload):
+        page = int(key)
+        params = {"pn": page, "recordType": "Recipe", "collectionId": self.fase.COLLECTION_ID}
+        r, record = ctx.get(self.name, self.url, params=params, conditional=True)
+        if record and record.unchanged:
+            return None, record
+        ctx.archive(self.name).append(page, 0, r.url, r.text)
+        results = r.json().get("response", {}).get("results", [])
+        return [self.fase.parse_recipe(res) for res in results], record
+
+    def write(self, conn, results):
+        self.fase.write_batch(conn, [row for res in results if res.value for row in res.value])
+
+    def emit(self, result):
+        jobs = {}
+        page = int(result.key)
+        # una página sin cambios ya encoló la siguiente la vez que se bajó (y --recrawl la volvió a pending)
+        if result.value and page + self.WINDOW <= self.total_pages:
+            jobs[self.name] = [(page + self.WINDOW, None)]
+        rows = [row for row in result.value or [] if row[0]]
+        if rows:
+            jobs["details"] = [(row[0], {"url": row[4]}) for row in rows if row[4]]
+            jobs["reviews"] = [(row[0], None) for row in rows]
+        return jobs
+
+class DetailsStage(Stage):
+    """Detalle, ingredientes e instrucciones de cada receta (payload: {"url": url de la receta})."""
+
+    name = "details"
+    HEADERS = {"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+                             "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36"}
+
+    def __init__(self, url=None):
+        import fase2_detalles_recetas
+        self.fase = fase2_detalles_recetas
+        self.url = url or "{recipe_url}/as-json"
+
+    def prepare(self, conn, db_path):
+        self.fase.create_tables(conn)
+
+    def seed(self, conn):
+        return [(rid, {"url": url}) for rid, url in conn.execute("""
+            SELECT recipe_id, url FROM recipes
+            WHERE url IS NOT NULL AND recipe_id NOT IN (SELECT recipe_id FROM details)
+            ORDER BY recipe_id
+        """)]
+
+    def fetch(self, ctx, key, payload):
+        recipe_url = payload["url"]
+        url = self.url.format(recipe_url=recipe_url.rstrip("/"), recipe_id=key)
+        r, record = ctx.get(self.name, url, headers=self.HEADERS, conditional=True)
+        if record and record.unchanged:
+            return None, record
+        ctx.archive(self.name).append(recipe_url, 0, url, r.text, ref=recipe_url)
+        return self.fase.parse_recipe(r.json(), recipe_url), record
+
+    def write(self, conn, results):
+        self.fase.write_recipes(conn, [res.value for res in results if res.value])
+
+class ReviewsStage(Stage):
+    """Todas las páginas de reviews de una receta; la primera va como pedido condicional."""
+
+    name = "reviews"
+
+    def __init__(self, url=None):
+        import fase3_review
+        self.fase = fase3_review
+        self.url = url or fase3_review.API_URL
+
+    def prepare(self, conn, db_path):
+        self.fase.DB_PATH = db_path
+        self.fase.create_table()
+        self.fase.create_done_table(conn)
+
+    def seed(self, conn):
+        return [(rid, None) for rid, in conn.execute(
+            "SELECT recipe_id FROM recipes WHERE recipe_id NOT IN (SELECT recipe_id FROM reviews_done) ORDER BY recipe_id")]
+
+    def fetch(self, ctx, key, payload):
+        recipe_id = int(key)
+        url = self.url.format(recipe_id=recipe_id)
+
+        def get_page(page):
+            r, record = ctx.get(self.name, url, params={"pn": page, "sortBy": "-time"}, conditional=page == 1)
+            if record and record.unchanged:
+                return None, record
+            ctx.archive(self.name).append(recipe_id, page, r.url, r.text)
+            return r.json(), record
+
+        return self.fase.paginate_reviews(recipe_id, get_page)
+
+    def write(self, conn, results):
+        self.fase.write_reviews(conn, [row for res in results if res.value for row in res.value])
+        conn.executemany("INSERT OR REPLACE INTO reviews_done VALUES (?, ?, datetime('now'))",
+                         [(int(res.key), len(res.value)) for res in results if not res.unchanged])
+        conn.executemany("INSERT OR IGNORE INTO reviews_done VALUES (?, NULL, datetime('now'))",
+                         [(int(res.key),) for res in results if res.unchanged])
+
+    def emit(self, result):
+        authors = sorted({row[2] for row in result.value or [] if row[2] is not None})
+        return {"users": [(author, None) for author in authors]} if authors else {}
+
+class UsersStage(Stage):
+    """Resumen de actividad de cada autor (el feed completo; el refresco incremental sigue en fase4_user.py)."""
+
+    name = "users"
+
+    def __init__(self, url=None):
+        import fase4_user
+        self.fase = fase4_user
+        self.url = url or fase4_user.API_URL
+
+    def prepare(self, conn, db_path):
+        self.fase.DB_PATH = db_path
+        self.fase.create_users_table()
+
+    def seed(self, conn):
+        return [(uid, None) for uid, in conn.execute("""
+            SELECT DISTINCT author_id FROM reviews
+            WHERE author_id IS NOT NULL AND author_id NOT IN (SELECT user_id FROM users)
+        """)]
+
+    def fetch(self, ctx, key, payload):
+        user_id = int(key)
+        url = self.url.format(user_id=user_id)
+
+        def fetch_page(page):
+            params = {"pn": page, "size": self.fase.PAGE_SIZE, "blockGdpr": "false"}
+            r, record = ctx.get(self.name, url, params=params, conditional=page == 1)
+            if record and record.unchanged:
+                return None, record
+            ctx.archive(self.name).append(user_id, page, r.url, r.text)
+            return r.json(), record
+
+        summary = self.fase.summarize_user(user_id, fetch_page=fetch_page)
+        if summary["unchanged"]:
+            return None, summary["record"]
+        if not summary["complete"]:
+            return None, None  # feed a medias: ni se guarda ni se da por visto
+        return summary, summary["record"]
+
+    def write(self, conn, results):
+        self.fase.write_users(conn, [res.value for res in results if res.value and res.value["name"]])
+
+STAGES = {"recipes": RecipesStage, "details": DetailsStage, "reviews": ReviewsStage, "users": UsersStage}
+
+def stub_urls(base):
+    """URLs de cada fase apuntando a stub_server.py."""
+    base = base.rstrip("/")
+    return {
+        "recipes": f"{base}/sectionfront",
+        "details": base + "/recipe/{recipe_id}/as-json",
+        "reviews": base + "/recipes/{recipe_id}/feed/reviews",
+        "users": base + "/members/{user_id}/feed",
+    }
+
+# --- coordinador ---
+
+class Crawler:
+    def __init__(self, stages, db_path=DB_PATH, workers=WORKERS, rate=RATE, fingerprints=True, archive=True,
+                 retry_base=fallos.RETRY_BASE, wait=True):
+        self.stages = {s.name: s for s in stages}
+        self.db_path = db_path
+        self.workers = workers
+        self.retry_base = retry_base
+        self.wait = wait  # False: terminar aunque queden reintentos programados
+        self.metrics = Metrics(list(self.stages))
+        self.ctx = Context(db_path, workers, rate, self.metrics, fingerprints, archive)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        create_jobs_table(self.conn)
+        fallos.create_table(self.conn)
+        for stage in self.stages.values():
+            stage.prepare(self.conn, db_path)
+        self.conn.commit()
+        self.stop = threading.Event()
+
+    def seed(self, from_db=False):
+        """Encola la primera ventana de recetas y, con from_db, lo que falte según las tablas ya bajadas."""
+        with self.conn:
+            for stage in self.stages.values():
+                if stage.name == "recipes" or from_db:
+                    enqueue(self.conn, stage.name, stage.seed(self.conn))
+
+    def _fetcher(self, work, results):
+        while True:
+            job = work.get()
+            if job is None:
+                break
+            stage = self.stages[job.stage]
+            start = time.perf_counter()
+            try:
+                value, record = stage.fetch(self.ctx, job.key, job.payload)
+                outcome = (job, Result(job.key, job.payload, value, record), None, False, None)
+            except FetchError as e:
+                outcome = (job, None, str(e), e.retryable, e.retry_after)
+            except Exception as e:  # conexión o JSON inválido se reintentan; un error de parseo, no
+                outcome = (job, None, f"{type(e).__name__}: {e}", isinstance(e, (requests.RequestException, ValueError)), None)
+            self.metrics.fetched(job.stage, time.perf_counter() - start)
+            results.put(outcome)
+
+    def _claim(self, n):
+        """Hasta n trabajos, repartidos entre las fases con pendientes."""
+        jobs = []
+        names = list(self.stages)
+        while n > 0 and names:
+            share = max(1, n // len(names))
+            for name in list(names):
+                got = claim(self.conn, name, min(share, n))
+                if len(got) < share:
+                    names.remove(name)
+                jobs.extend(got)
+                n -= len(got)
+                if n <= 0:
+                    break
+        if jobs:
+            self.conn.commit()
+        return jobs
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        done = defaultdict(list)
+        records = []
+        with self.conn:
+            for job, result, error, retryable, retry_after in batch:
+                if result is None:
+                    attempts, next_at = fallos.record(self.conn, job.stage, job.key, error, job.payload,
+                                                      retryable, retry_after, self.retry_base)
+                    self.conn.execute("""
+                        UPDATE crawl_jobs SET state = 'failed', attempts = attempts + 1, last_error = ?, updated_at = datetime('now')
+                        WHERE id = ?
+                    """, (error, job.id))
+                    self.metrics.add(job.stage, **{"retried" if next_at else "failed": 1})
+                    if not next_at:
+                        print(f"❌ {job.stage} {job.key}: {error} (abandonado tras {attempts} intentos)")
+                else:
+                    done[job.stage].append((job, result))
+            for name, items in done.items():
+                stage = self.stages[name]
+                stage.write(self.conn, [result for _, result in items])
+                for job, result in items:
+                    for target, jobs in stage.emit(result).items():
+                        enqueue(self.conn, target, jobs)
+                    records.append(result.record)
+                self.conn.executemany("""
+                    UPDATE crawl_jobs SET state = 'done', attempts = attempts + 1, last_error = NULL, updated_at = datetime('now')
+                    WHERE id = ?
+                """, [(job.id,) for job, _ in items])
+                fallos.resolve(self.conn, name, [job.key for job, _ in items])
+                unchanged = sum(result.unchanged for _, result in items)
+                self.metrics.add(name, done=len(items) - unchanged, unchanged=unchanged)
+        self.ctx.fingerprints.save(records)  # recién ahora: sus datos ya están en la base
+        self.metrics.committed(time.perf_counter() - start)
+        batch.clear()
+
+    def _retry_due(self):
+        """Worker de reintentos: vuelve a pending los fallos vencidos; devuelve cuántos."""
+        due = fallos.due(self.conn, list(self.stages))
+        if not due:
+            return 0
+        with self.conn:
+            for stage, key, payload in due:
+                enqueue(self.conn, stage, [(key, payload)])  # los de las fases sueltas todavía no tienen trabajo
+            self.conn.executemany("""
+                UPDATE crawl_jobs SET state = 'pending', updated_at = datetime('now')
+                WHERE stage = ? AND key = ? AND state != 'running'
+            """, [(stage, key) for stage, key, _ in due])
+        return len(due)
+
+    def _pending(self):
+        return {stage: states.get("pending", 0) for stage, states in job_counts(self.conn).items()}
+
+    def run(self):
+        with self.conn:
+            released = reset(self.conn, list(STAGES), ["running"])
+        if released:
+            print(f"🔄 {released} trabajos de una corrida cortada vuelven a pending")
+        print(f"🚀 Crawl: fases {', '.join(self.stages)}, {self.workers} fetchers a {self.ctx.limiter.rate} pedidos/s "
+              f"| pendientes: {self._pending()}")
+
+        work, results = queue.Queue(), queue.Queue()
+        threads = [threading.Thread(target=self._fetcher, args=(work, results), name=f"fetcher-{k}", daemon=True)
+                   for k in range(self.workers)]
+        for t in threads:
+            t.start()
+
+        in_flight = 0
+        batch = []
+        last_commit = last_report = last_retry = time.perf_counter()
+        try:
+            while True:
+                claimed = []
+                if not self.stop.is_set() and in_flight < self.workers * 2:
+                    claimed = self._claim(self.workers * 2 - in_flight)
+                    for job in claimed:
+                        work.put(job)
+                    in_flight += len(claimed)
+                    for job in claimed:
+                        self.metrics.add(job.stage, claimed=1)
+                if in_flight == 0:
+                    if batch:
+                        self._flush(batch)  # puede encolar trabajos nuevos para otras fases
+                        last_commit = time.perf_counter()
+                        continue
+                    if self._retry_due():
+                        continue
+                    next_at = fallos.next_due(self.conn, list(self.stages))
+                    if next_at is None or not self.wait or self.stop.is_set():
+                        break
+                    print(f"⏳ Sin trabajos pendientes; próximo reintento en {max(0.0, next_at - time.time()):.0f}s")
+                    time.sleep(min(STATS_EVERY, max(0.0, next_at - time.time())))
+                    continue
+
+                try:
+                    batch.append(results.get(timeout=0.5))
+                    in_flight -= 1
+                    while True:
+                        batch.append(results.get_nowait())
+                        in_flight -= 1
+                except queue.Empty:
+                    pass
+
+                now = time.perf_counter()
+                # si los fetchers se quedan sin trabajo se escribe ya, para que lo emitido pueda arrancar
+                starving = not claimed and work.empty()
+                if batch and (len(batch) >= BATCH_JOBS or now - last_commit >= BATCH_SECONDS or starving):
+                    self._flush(batch)
+                    last_commit = now
+                if now - last_retry >= RETRY_EVERY:
+                    self._retry_due()
+                    last_retry = now
+                if now - last_report >= STATS_EVERY:
+                    self.metrics.report(self._pending(), self.ctx.limiter.rate)
+                    last_report = now
+        except KeyboardInterrupt:
+            # los fetchers terminan el trabajo en curso; se guarda lo que ya llegó
+            print("⏸ Interrumpido por el usuario. Guardando lo descargado...")
+            self.stop.set()
+            while True:
+                try:
+                    work.get_nowait()
+                    in_flight -= 1
+                except queue.Empty:
+                    break
+            while in_flight > 0:
+                batch.append(results.get())
+                in_flight -= 1
+            self._flush(batch)
+        finally:
+            for _ in threads:
+                work.put(None)
+            with self.conn:
+                reset(self.conn, list(self.stages), ["running"])  # lo reclamado que no se llegó a bajar
+            for a in self.ctx.archives.values():
+                a.flush()
+
+        self.metrics.report(self._pending(), self.ctx.limiter.rate, final=True)
+        print(f"🎉 Crawl terminado. {self.ctx.fingerprints.summary()}")
+        self.conn.close()
+        return self.metrics.to_dict()
+
+def status(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    create_jobs_table(conn)
+    counts = job_counts(conn)
+    for stage in STAGES:
+        c = counts.get(stage, {})
+        print(f"📋 {stage:8s} pendientes {c.get('pending', 0):7d} | en curso {c.get('running', 0):5d} | "
+              f"hechos {c.get('done', 0):8d} | fallidos {c.get('failed', 0):6d}")
+    fallos.create_table(conn)
+    for stage, (scheduled, abandoned) in fallos.summary(conn).items():
+        print(f"🔁 {stage:8s} reintentos programados {scheduled:6d} | abandonados {abandoned:6d}")
+    for stage, key, attempts, error, next_at in conn.execute("""
+            SELECT stage, key, attempts, last_error, next_attempt_at FROM crawl_failures
+            ORDER BY last_failed_at DESC LIMIT 10"""):
+        when = f"próximo en {max(0.0, next_at - time.time()):.0f}s" if next_at else "abandonado"
+        print(f"   ❌ {stage} {key} ({attempts} intentos, {when}): {error}")
+    conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl de food.com con todas las fases en paralelo")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="baja los trabajos pendientes de las fases elegidas")
+    p_run.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    p_run.add_argument("--workers", type=int, default=WORKERS)
+    p_run.add_argument("--rate", type=float, default=RATE, help="pedidos por segundo entre todos los hilos")
+    p_run.add_argument("--seed", action="store_true", help="encola lo que falte según lo que ya hay en la base")
+    p_run.add_argument("--recrawl", action="store_true", help="vuelve a pending los trabajos hechos de esas fases")
+    p_run.add_argument("--retry-failed", action="store_true", help="vuelve a programar los fallos abandonados")
+    p_run.add_argument("--retry-base", type=float, default=fallos.RETRY_BASE, help="segundos hasta el primer reintento")
+    p_run.add_argument("--no-wait", action="store_true", help="terminar sin esperar los reintentos programados")
+    p_run.add_argument("--stub", metavar="URL", help="apunta todas las fases a stub_server.py (ej. http://127.0.0.1:8765)")
+    p_run.add_argument("--metrics", metavar="ARCHIVO", help="guarda las métricas finales en JSON")
+    p_run.add_argument("--no-fingerprints", action="store_true", help="bajar y escribir todo aunque no haya cambiado")
+    p_run.add_argument("--no-archive", action="store_true", help="no guardar las respuestas crudas (ver archivo.py)")
+    sub.add_parser("status", help="trabajos por fase y estado")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status(args.db)
+    else:
+        urls = stub_urls(args.stub) if args.stub else {}
+        crawler = Crawler([STAGES[name](urls.get(name)) for name in args.stages], args.db, args.workers, args.rate,
+                          fingerprints=not args.no_fingerprints, archive=not args.no_archive,
+                          retry_base=args.retry_base, wait=not args.no_wait)
+        with crawler.conn:
+            if args.recrawl:
+                reset(crawler.conn, args.stages, ["done"])
+            if args.retry_failed:
+                fallos.release(crawler.conn, args.stages)
+        crawler.seed(from_db=args.seed)
+        metrics = crawler.run()
+        if args.metrics:
+            with open(args.metrics, "w") as f:
+                json.dump(metrics, f, indent=2)
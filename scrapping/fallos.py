@@ -0,0 +1,123 @@
+# fallos.py
+# Registro de descargas fallidas (tabla crawl_failures) con reintentos
+# programados, en lugar de los failed_*.txt que nadie volvía a leer.
+#
+# Cada fallo queda como (stage, key) con la cantidad de intentos, el último
+# error y cuándo se puede volver a intentar: backoff exponencial desde
+# RETRY_BASE segundos, con jitter para que los fallos de una misma racha no
+# vuelvan todos juntos, y como mínimo lo que pida un Retry-After. Después de
+# MAX_ATTEMPTS, o ante un error que no tiene sentido reintentar (404), queda
+# con next_attempt_at NULL: abandonado hasta un `crawler.py run --retry-failed`.
+#
+# Las fases sueltas solo registran (Failures.record); el que reintenta es
+# crawler.py, que vuelve a encolar los fallos vencidos como trabajos de su
+# fase, bajo el mismo rate limiter, y borra el fallo cuando el trabajo sale bien.
+# Por eso el payload de cada fallo es el mismo que el del trabajo del crawler
+# (ej. {"url": ...} para details).
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+MAX_ATTEMPTS = 8
+RETRY_BASE = 30.0        # segundos hasta el primer reintento
+RETRY_MAX = 3600.0       # tope del backoff
+
+def create_table(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS crawl_failures (
+            stage TEXT NOT NULL,
+            key TEXT NOT NULL,
+            payload TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            first_failed_at TEXT,
+            last_failed_at TEXT,
+            next_attempt_at REAL,      -- epoch; NULL = abandonado
+            PRIMARY KEY (stage, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_crawl_failures_next ON crawl_failures(next_attempt_at);
+    """)
+
+def backoff(attempts, base=RETRY_BASE, cap=RETRY_MAX):
+    """Segundos hasta el próximo intento: base * 2^(intentos-1), con tope, entre la mitad y 1.5 veces."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+
+def record(conn, stage, key, error, payload=None, retryable=True, retry_after=None, base=RETRY_BASE):
+    """Suma un intento fallido (no hace commit). Devuelve (intentos, next_attempt_at o None si se abandona)."""
+    row = conn.execute("SELECT attempts FROM crawl_failures WHERE stage = ? AND key = ?", (stage, str(key))).fetchone()
+    attempts = (row[0] if row else 0) + 1
+    next_at = None
+    if retryable and attempts < MAX_ATTEMPTS:
+        delay = backoff(attempts, base)
+        if retry_after and str(retry_after).isdigit():
+            delay = max(delay, int(retry_after))
+        next_at = time.time() + delay
+    conn.execute("""
+        INSERT INTO crawl_failures (stage, key, payload, attempts, last_error, first_failed_at, last_failed_at, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, datetime('now'), datetime('now'), ?)
+        ON CONFLICT(stage, key) DO UPDATE SET
+            payload = coalesce(excluded.payload, payload),
+            attempts = excluded.attempts,
+            last_error = excluded.last_error,
+            last_failed_at = excluded.last_failed_at,
+            next_attempt_at = excluded.next_attempt_at
+    """, (stage, str(key), json.dumps(payload) if payload is not None else None, attempts, error, next_at))
+    return attempts, next_at
+
+def resolve(conn, stage, keys):
+    """Borra los fallos de trabajos que ya salieron bien."""
+    conn.executemany("DELETE FROM crawl_failures WHERE stage = ? AND key = ?", [(stage, str(k)) for k in keys])
+
+def due(conn, stages, now=None):
+    """[(stage, key, payload)] de los fallos que ya se pueden reintentar."""
+    return [(stage, key, json.loads(payload) if payload else None) for stage, key, payload in conn.execute(f"""
+        SELECT stage, key, payload FROM crawl_failures
+        WHERE next_attempt_at <= ? AND stage IN ({', '.join('?' * len(stages))})
+        ORDER BY next_attempt_at
+    """, [now or time.time(), *stages])]
+
+def next_due(conn, stages):
+    """Epoch del próximo reintento programado de esas fases, o None si no queda ninguno."""
+    return conn.execute(f"""
+        SELECT min(next_attempt_at) FROM crawl_failures WHERE stage IN ({', '.join('?' * len(stages))})
+    """, stages).fetchone()[0]
+
+def release(conn, stages):
+    """Vuelve a programar ya los fallos abandonados de esas fases, con los intentos en cero."""
+    return conn.execute(f"""
+        UPDATE crawl_failures SET attempts = 0, next_attempt_at = ?
+        WHERE next_attempt_at IS NULL AND stage IN ({', '.join('?' * len(stages))})
+    """, [time.time(), *stages]).rowcount
+
+def summary(conn):
+    """{stage: (programados, abandonados)}"""
+    return {stage: (scheduled, abandoned) for stage, scheduled, abandoned in conn.execute("""
+        SELECT stage, count(next_attempt_at), count(*) - count(next_attempt_at) FROM crawl_failures GROUP BY stage
+    """)}
+
+class Failures:
+    """Registro de fallos para las fases sueltas: una conexión propia, segura entre hilos, con commit inmediato."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            create_table(self.conn)
+            self.conn.commit()
+        return self.conn
+
+    def record(self, stage, key, error, payload=None, retryable=True):
+        with self.lock:
+            conn = self._connection()
+            attempts, next_at = record(conn, stage, key, error, payload, retryable)
+            conn.commit()
+        when = f"reintento en {next_at - time.time():.0f}s" if next_at else "abandonado"
+        print(f"❌ {stage} {key}: {error} (intento {attempts}, {when}; ver crawl_failures)")
+        return attempts, next_at
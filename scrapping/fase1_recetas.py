@@ -2,14 +2,26 @@
 # fase1_recetas_100k.py
 # Descarga hasta 100.000 recetas desde api.food.com usando collectionId=17
 # Guarda en SQLite en bloques (BATCH_SIZE). Incluye checkpoint para reanudar.
+#
+# Uso:
+#   python fase1_recetas.py                                   # una página a la vez
+#   python fase1_recetas.py --async --concurrency 8 --rate 4  # en paralelo, con rate limit
+#   python fase1_recetas.py --async --url http://127.0.0.1:8765/sectionfront  # contra stub_server.py
 
-import requests
+import argparse
+import asyncio
+import random
 import sqlite3
 import time
 import math
 import json
 import os
-from requests.adapters import HTTPAdapter, Retry
+from concurrent.futures import ThreadPoolExecutor
+
+import archivo
+import crawler
+import fallos
+import huellas
 
 DB_PATH = "foodcom.db"
 BATCH_SIZE = 1000
@@ -18,18 +30,19 @@ RECIPES_PER_PAGE = 10  # confirmado: endpoint devuelve 10 por página
 CHECKPOINT_PATH = "progress.json"
 COLLECTION_ID = 17
 SLEEP_BETWEEN_PAGES = 0.5  # podés ajustar a 0.2 si querés más rápido (más riesgo de baneo)
+API_URL = "https://api.food.com/services/mobile/fdc/search/sectionfront"
 
-# --- sesión con retries ---
-def make_session(retries=3, backoff=0.5, status_forcelist=(500,502,503,504)):
-    s = requests.Session()
-    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=status_forcelist)
-    adapter = HTTPAdapter(max_retries=retry)
-    s.mount("https://", adapter)
-    s.mount("http://", adapter)
-    s.headers.update({"User-Agent": "Mozilla/5.0 (compatible; food-scraper/1.0)"})
-    return s
+# --- modo async (--async) ---
+CONCURRENCY = 8          # páginas en vuelo a la vez
+RATE = 4.0               # pedidos por segundo (crawler.RateLimiter)
+MAX_ATTEMPTS = 6         # intentos por página ante 429/5xx/errores de conexión
+BACKOFF_BASE = 1.0       # segundos; se duplica en cada intento (con jitter)
+BACKOFF_MAX = 60.0
 
-SESSION = make_session()
+SESSION = crawler.make_session(retries=3)  # modo secuencial: urllib3 reintenta los 5xx
+FINGERPRINTS = huellas.Fingerprints(DB_PATH)
+FAILURES = fallos.Failures(DB_PATH)
+ARCHIVE = archivo.Archive("recipes")
 
 # --- DB ---
 def create_tables():
@@ -57,12 +70,9 @@ def create_tables():
     conn.commit()
     conn.close()
 
-def save_batch(batch):
-    if not batch:
-        return
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.executemany("""
+def write_batch(conn, batch):
+    """Escribe filas de recipes dentro de la transacción abierta (no hace commit)."""
+    conn.executemany("""
         INSERT OR REPLACE INTO recipes (
             recipe_id, title, description, image_url, url,
             category, rating, num_ratings,
@@ -70,6 +80,12 @@ def save_batch(batch):
             author_id, author_name, author_url, author_avatar
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, batch)
+
+def save_batch(batch):
+    if not batch:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    write_batch(conn, batch)
     conn.commit()
     conn.close()
 
@@ -89,28 +105,57 @@ def save_checkpoint(last_page, total_saved):
         json.dump(data, f)
 
 # --- fetch ---
-def fetch_recipes(page, collection_id=COLLECTION_ID):
-    url = "https://api.food.com/services/mobile/fdc/search/sectionfront"
+def fetch_recipes(page, collection_id=COLLECTION_ID, url=API_URL):
+    """(resultados, huella). Si la página no cambió desde la corrida anterior, record.unchanged es True."""
     params = {
         "pn": page,
         "recordType": "Recipe",
         "collectionId": collection_id
     }
     try:
-        r = SESSION.get(url, params=params, timeout=15)
+        r, record = FINGERPRINTS.get(SESSION, url, params=params, timeout=15)
+        if record and record.unchanged:
+            return [], record
         if r.status_code != 200:
-            print(f"⚠️  Status {r.status_code} en página {page}")
-            return []
+            FAILURES.record("recipes", page, f"HTTP {r.status_code}", retryable=r.status_code == 429 or r.status_code >= 500)
+            return [], None
+        ARCHIVE.append(page, 0, r.url, r.text)
         data = r.json()
-        return data.get("response", {}).get("results", [])
+        return data.get("response", {}).get("results", []), record
     except Exception as e:
-        print(f"⚠️  Error de conexión en página {page}: {e}")
-        return []
+        FAILURES.record("recipes", page, f"{type(e).__name__}: {e}")
+        return [], None
+
+# --- parseo ---
+def parse_recipe(r):
+    """Fila de la tabla recipes a partir de un resultado del endpoint."""
+    try:
+        recipe_id = int(r.get("recipe_id") or r.get("id") or 0)
+    except:
+        recipe_id = None
+
+    return (
+        recipe_id,
+        r.get("title"),
+        r.get("description"),
+        r.get("recipe_photo_url"),
+        r.get("record_url"),
+        r.get("primary_category_name"),
+        float(r.get("main_rating", 0)) if r.get("main_rating") not in (None, "") else None,
+        int(r.get("main_num_ratings", 0)) if r.get("main_num_ratings") not in (None, "") else 0,
+        int(r.get("recipe_preptime", 0)) if r.get("recipe_preptime") not in (None, "") else None,
+        int(r.get("recipe_cooktime", 0)) if r.get("recipe_cooktime") not in (None, "") else None,
+        int(r.get("recipe_totaltime", 0)) if r.get("recipe_totaltime") not in (None, "") else None,
+        int(r.get("main_userid")) if r.get("main_userid") not in (None, "") else None,
+        r.get("main_username"),
+        r.get("recipe_user_url"),
+        r.get("user_avatar_url"),
+    )
 
 # --- crawler principal ---
-def crawl_recipes():
+def crawl_recipes(url=API_URL, recrawl=False):
     create_tables()
-    checkpoint = load_checkpoint()
+    checkpoint = {} if recrawl else load_checkpoint()
     last_page = int(checkpoint.get("last_page", 0))
     total_saved = int(checkpoint.get("total_saved", 0))
 
@@ -120,44 +165,26 @@ def crawl_recipes():
     print(f"Objetivo: {MAX_RECIPES} recetas -> páginas necesarias: {total_pages}")
 
     batch = []
+    pending = []  # huellas de las páginas en batch: se guardan después de save_batch
     page = last_page + 1 if last_page >= 1 else 1
 
     try:
         while page <= total_pages and total_saved < MAX_RECIPES:
-            recipes = fetch_recipes(page)
-            if not recipes:
+            recipes, record = fetch_recipes(page, url=url)
+            if not recipes and not (record and record.unchanged):
                 print(f"✅ El endpoint no devolvió recetas en la página {page}. Terminando.")
                 break
+            pending.append(record)  # sin cambios: no hay nada que parsear ni escribir
 
             for r in recipes:
-                try:
-                    recipe_id = int(r.get("recipe_id") or r.get("id") or 0)
-                except:
-                    recipe_id = None
-
-                batch.append((
-                    recipe_id,
-                    r.get("title"),
-                    r.get("description"),
-                    r.get("recipe_photo_url"),
-                    r.get("record_url"),
-                    r.get("primary_category_name"),
-                    float(r.get("main_rating", 0)) if r.get("main_rating") not in (None, "") else None,
-                    int(r.get("main_num_ratings", 0)) if r.get("main_num_ratings") not in (None, "") else 0,
-                    int(r.get("recipe_preptime", 0)) if r.get("recipe_preptime") not in (None, "") else None,
-                    int(r.get("recipe_cooktime", 0)) if r.get("recipe_cooktime") not in (None, "") else None,
-                    int(r.get("recipe_totaltime", 0)) if r.get("recipe_totaltime") not in (None, "") else None,
-                    int(r.get("main_userid")) if r.get("main_userid") not in (None, "") else None,
-                    r.get("main_username"),
-                    r.get("recipe_user_url"),
-                    r.get("user_avatar_url"),
-                ))
+                batch.append(parse_recipe(r))
 
                 if total_saved + len(batch) >= MAX_RECIPES:
                     needed = MAX_RECIPES - total_saved
                     if needed > 0:
                         batch = batch[:needed]
                         save_batch(batch)
+                        FINGERPRINTS.save(pending)
                         total_saved += len(batch)
                     save_checkpoint(page, total_saved)
                     print(f"💾 Guardadas {total_saved}/{MAX_RECIPES} recetas (Página {page}/{total_pages})")
@@ -165,9 +192,10 @@ def crawl_recipes():
                     return
 
             if len(batch) >= BATCH_SIZE:
-                save_batch(batch[:BATCH_SIZE])
-                total_saved += BATCH_SIZE
-                batch = batch[BATCH_SIZE:]
+                save_batch(batch)
+                FINGERPRINTS.save(pending)
+                total_saved += len(batch)
+                batch, pending = [], []
                 save_checkpoint(page, total_saved)
                 print(f"💾 Guardadas {total_saved}/{MAX_RECIPES} recetas (Página {page}/{total_pages})")
 
@@ -181,8 +209,9 @@ def crawl_recipes():
             total_saved += len(batch)
             save_checkpoint(page-1, total_saved)
             print(f"💾 Guardadas {total_saved}/{MAX_RECIPES} recetas (final).")
+        FINGERPRINTS.save(pending)
 
-        print(f"🎉 Descarga completa: {total_saved} recetas.")
+        print(f"🎉 Descarga completa: {total_saved} recetas. {FINGERPRINTS.summary()}")
     except KeyboardInterrupt:
         print("⏸ Interrumpido por el usuario. Guardando checkpoint...")
         save_checkpoint(page-1, total_saved)
@@ -190,5 +219,149 @@ def crawl_recipes():
         print(f"❌ Error inesperado: {e}. Guardando checkpoint...")
         save_checkpoint(page-1, total_saved)
 
+# --- crawler async ---
+# Varias páginas en vuelo, limitadas por el RateLimiter de crawler.py, que se
+# frena solo cuando el servidor responde 429/5xx. requests es bloqueante, así
+# que cada pedido corre en un hilo del pool (todos con la misma sesión, sin
+# Retry de urllib3: acá se reintenta con backoff) y asyncio coordina.
+
+class OrderedCheckpoint:
+    """Las páginas terminan en cualquier orden; last_page solo avanza sobre un prefijo sin huecos."""
+
+    def __init__(self, last_page, total_saved):
+        self.last_page = last_page
+        self.total_saved = total_saved
+        self.pending = {}  # página terminada -> cantidad de recetas, esperando a las anteriores
+
+    def complete(self, page, count):
+        self.pending[page] = count
+        while self.last_page + 1 in self.pending:
+            self.last_page += 1
+            self.total_saved += self.pending.pop(self.last_page)
+
+def _get_page(session, limiter, url, page, collection_id):
+    limiter.acquire()
+    params = {"pn": page, "recordType": "Recipe", "collectionId": collection_id}
+    r, record = FINGERPRINTS.get(session, url, params=params, timeout=15)
+    if record and record.unchanged:
+        return 200, [], None, record
+    if r.status_code != 200:
+        return r.status_code, None, r.headers.get("Retry-After"), None
+    ARCHIVE.append(page, 0, r.url, r.text)
+    return 200, r.json().get("response", {}).get("results", []), None, record
+
+async def fetch_recipes_async(page, session, limiter, url=API_URL, collection_id=COLLECTION_ID):
+    """(resultados, huella): [] si no hay más, None si falló todos los intentos; record.unchanged si no cambió.
+
+    Las páginas que fallan quedan en crawl_failures para que las reintente crawler.py.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            status, results, retry_after, record = await asyncio.to_thread(_get_page, session, limiter, url, page, collection_id)
+        except Exception as e:
+            status, results, retry_after, record = None, None, None, None
+            error = f"{type(e).__name__}: {e}"
+            print(f"⚠️  Error de conexión en página {page}: {error}")
+
+        if status == 200:
+            limiter.speed_up()
+            return results, record
+        if status is not None and status != 429 and status < 500:
+            FAILURES.record("recipes", page, f"HTTP {status}", retryable=False)
+            return None, None
+        if status is not None:
+            error = f"HTTP {status}"
+            limiter.slow_down()
+        wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after and retry_after.isdigit():
+            wait = max(wait, int(retry_after))
+        print(f"⏳ Página {page}: {status or 'error'}, reintento {attempt + 1}/{MAX_ATTEMPTS} en {wait:.1f}s "
+              f"(tasa {limiter.rate:.2f}/s)")
+        await asyncio.sleep(wait)
+    FAILURES.record("recipes", page, error)
+    return None, None
+
+async def crawl_recipes_async(concurrency=CONCURRENCY, rate=RATE, url=API_URL, recrawl=False):
+    create_tables()
+    checkpoint = {} if recrawl else load_checkpoint()
+    progress = OrderedCheckpoint(int(checkpoint.get("last_page", 0)), int(checkpoint.get("total_saved", 0)))
+    total_pages = math.ceil(MAX_RECIPES / RECIPES_PER_PAGE)
+
+    print(f"Inicio (async x{concurrency}, {rate}/s): total_saved={progress.total_saved}, last_page={progress.last_page}")
+    print(f"Objetivo: {MAX_RECIPES} recetas -> páginas necesarias: {total_pages}")
+
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    session = crawler.make_session(concurrency)
+    limiter = crawler.RateLimiter(rate)
+    next_page = progress.last_page + 1
+    last_page = total_pages   # baja a la primera página vacía
+    failed = []
+    batch = []
+    pending = []  # huellas de las páginas en batch
+
+    def flush():
+        # se guarda todo lo bajado, así que el checkpoint puede avanzar hasta el prefijo terminado
+        if not batch and not pending:
+            return
+        save_batch(batch)
+        FINGERPRINTS.save(pending)
+        batch.clear()
+        pending.clear()
+        save_checkpoint(progress.last_page, progress.total_saved)
+        print(f"💾 Guardadas {progress.total_saved}/{MAX_RECIPES} recetas (Página {progress.last_page}/{total_pages})")
+
+    async def worker():
+        nonlocal next_page, last_page
+        while next_page <= last_page:
+            page = next_page
+            next_page += 1
+            recipes, record = await fetch_recipes_async(page, session, limiter, url)
+            if recipes is None:
+                failed.append(page)  # no se completa: el checkpoint no la pasa y se reintenta al reanudar
+                continue
+            if record and record.unchanged:
+                pending.append(record)  # igual que la corrida anterior: no hay nada que escribir
+                progress.complete(page, 0)
+                continue
+            if not recipes:
+                if page <= last_page:
+                    print(f"✅ El endpoint no devolvió recetas en la página {page}.")
+                    last_page = page - 1
+                continue
+            if page > last_page:
+                continue  # ya se encontró el final antes de esta página
+            batch.extend(parse_recipe(r) for r in recipes)
+            pending.append(record)
+            progress.complete(page, len(recipes))
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        flush()
+    if failed:
+        print(f"⚠️  {len(failed)} páginas fallaron (ej. {sorted(failed)[:10]}); quedaron en crawl_failures "
+              f"(las reintenta `crawler.py run --stages recipes`, o volvé a correr esta fase).")
+    print(f"🎉 Descarga completa: {progress.total_saved} recetas. {FINGERPRINTS.summary()}")
+
 if __name__ == "__main__":
-    crawl_recipes()
+    parser = argparse.ArgumentParser(description="Descarga recetas de api.food.com")
+    parser.add_argument("--async", dest="modo_async", action="store_true", help="varias páginas en paralelo con rate limit")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=RATE, help="pedidos por segundo")
+    parser.add_argument("--url", default=API_URL, help="endpoint (ej. el de stub_server.py para probar)")
+    parser.add_argument("--recrawl", action="store_true", help="desde la primera página; se saltean las que no cambiaron")
+    parser.add_argument("--no-fingerprints", action="store_true", help="bajar y escribir todo aunque no haya cambiado")
+    parser.add_argument("--no-archive", action="store_true", help="no guardar las respuestas crudas (ver archivo.py)")
+    args = parser.parse_args()
+
+    FINGERPRINTS.enabled = not args.no_fingerprints
+    ARCHIVE.enabled = not args.no_archive
+    if args.modo_async:
+        try:
+            asyncio.run(crawl_recipes_async(args.concurrency, args.rate, args.url, args.recrawl))
+        except KeyboardInterrupt:
+            print("⏸ Interrumpido por el usuario. El checkpoint quedó en la última página sin huecos.")
+    else:
+        crawl_recipes(args.url, args.recrawl)
@@ -1,44 +1,109 @@
+import argparse
 import requests
 import sqlite3
+import tempfile
 import time
 import os
+import sys
+
+import archivo
+import crawler
+import fallos
+import huellas
+
+# duraciones.py está en la raíz: lo comparte con la migración que rellena bases viejas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import duraciones
 
 DB_PATH = "foodcom.db"
 CHECKPOINT_FILE = "checkpoint_detalles.txt"
-FAILED_FILE = "failed_recipes.txt"
+BATCH_SIZE = 200  # recetas por transacción
+FINGERPRINTS = huellas.Fingerprints(DB_PATH)
+FAILURES = fallos.Failures(DB_PATH)
+ARCHIVE = archivo.Archive("details")
+SESSION = crawler.make_session()
+
+def fetch_recipe_details(recipe_id, recipe_url, retries=3):
+    """(json, huella); json es None si falló o si la receta no cambió desde la corrida anterior (record.unchanged).
 
-def fetch_recipe_details(recipe_url, retries=3):
+    Los fallos quedan en crawl_failures para que los reintente crawler.py.
+    """
     url = recipe_url.rstrip("/") + "/as-json"
     headers = {
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
                       "AppleWebKit/537.36 (KHTML, like Gecko) "
                       "Chrome/140.0.0.0 Safari/537.36"
     }
+    error = None
     for attempt in range(retries):
         try:
-            r = requests.get(url, headers=headers, timeout=20)
+            r, record = FINGERPRINTS.get(SESSION, url, headers=headers, timeout=crawler.TIMEOUT)
+            if record and record.unchanged:
+                return None, record
             if r.status_code == 200:
-                return r.json()
+                ARCHIVE.append(recipe_url, 0, url, r.text, ref=recipe_url)
+                return r.json(), record
             else:
-                print(f"⚠️ Error {r.status_code} en {url}")
-                return None
+                FAILURES.record("details", recipe_id, f"HTTP {r.status_code} en {url}", {"url": recipe_url},
+                                retryable=r.status_code == 429 or r.status_code >= 500)
+                return None, None
         except requests.exceptions.RequestException as e:
+            error = e
             print(f"⏳ Error {e}, intento {attempt+1}/{retries}")
             time.sleep(2)
-    return None
+    FAILURES.record("details", recipe_id, f"{type(error).__name__}: {error}", {"url": recipe_url})
+    return None, None
 
-def save_failed(recipe_id):
-    """Guarda el ID de receta fallida en archivo de texto."""
-    with open(FAILED_FILE, "a") as f:
-        f.write(str(recipe_id) + "\n")
+# === Esquema (una sola vez por corrida) ===
+def create_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS details (
+            recipe_id INTEGER PRIMARY KEY,
+            url TEXT,
+            title TEXT,
+            description TEXT,
+            prep_time TEXT,
+            cook_time TEXT,
+            total_time TEXT,
+            author TEXT,
+            image TEXT,
+            category TEXT,
+            keywords TEXT,
+            total_ingredients INTEGER,
+            total_steps INTEGER,
+            total_reviews INTEGER,
+            prep_minutes INTEGER,
+            cook_minutes INTEGER,
+            total_minutes INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS ingredients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER,
+            quantity TEXT,
+            text TEXT,
+            category_texts TEXT
+        );
+        CREATE TABLE IF NOT EXISTS instructions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER,
+            step_num INTEGER,
+            step_text TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_ingredients_recipe ON ingredients(recipe_id);
+        CREATE INDEX IF NOT EXISTS idx_instructions_recipe ON instructions(recipe_id);
+    """)
+    # bases de antes de las columnas en minutos (migraciones.py rellena las filas viejas)
+    duraciones.add_columns(conn)
 
-def save_recipe(recipe_json, recipe_url):
+# === Parseo ===
+def parse_recipe(recipe_json, recipe_url):
+    """(fila de details, filas de ingredients, filas de instructions), o None si no trae id."""
     recipe = recipe_json.get("recipe", {})
     jsonLd = recipe.get("jsonLd", {})
 
     recipe_id = recipe.get("id")
     if not recipe_id:
-        return
+        return None
 
     # === Detalles ===
     title = jsonLd.get("name")
@@ -55,47 +120,13 @@ def save_recipe(recipe_json, recipe_url):
     total_steps = len(recipe.get("directions", []))
     total_reviews = recipe_json.get("reviewFeed", {}).get("total", 0)
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    # === Tabla details ===
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS details (
-            recipe_id INTEGER PRIMARY KEY,
-            url TEXT,
-            title TEXT,
-            description TEXT,
-            prep_time TEXT,
-            cook_time TEXT,
-            total_time TEXT,
-            author TEXT,
-            image TEXT,
-            category TEXT,
-            keywords TEXT,
-            total_ingredients INTEGER,
-            total_steps INTEGER,
-            total_reviews INTEGER
-        )
-    """)
-
-    cur.execute("""
-        INSERT OR REPLACE INTO details 
-        (recipe_id, url, title, description, prep_time, cook_time, total_time, author, image, category, keywords, total_ingredients, total_steps, total_reviews)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (recipe_id, recipe_url, title, description, prepTime, cookTime, totalTime, author, image, category, keywords, total_ingredients, total_steps, total_reviews))
+    # los textos originales quedan en prep_time/cook_time/total_time; los minutos son los que se filtran
+    details = (recipe_id, recipe_url, title, description, prepTime, cookTime, totalTime, author, image,
+               category, keywords, total_ingredients, total_steps, total_reviews,
+               *duraciones.minutes(prepTime, cookTime, totalTime))
 
     # === Ingredientes ===
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS ingredients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            recipe_id INTEGER,
-            quantity TEXT,
-            text TEXT,
-            category_texts TEXT
-        )
-    """)
-    cur.execute("DELETE FROM ingredients WHERE recipe_id = ?", (recipe_id,))
-
+    ingredients = []
     for ing in recipe.get("ingredients", []):
         qty = ing.get("quantity", "").strip()
         text = ing.get("ingredText", "").strip()
@@ -108,33 +139,86 @@ def save_recipe(recipe_json, recipe_url):
                 category_texts.append(replacement)
                 text = text.replace(placeholder, replacement)
 
-        cur.execute(
-            "INSERT INTO ingredients (recipe_id, quantity, text, category_texts) VALUES (?, ?, ?, ?)",
-            (recipe_id, qty, text, ", ".join(category_texts) if category_texts else None)
-        )
-    
-    # === Instrucciones ===
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS instructions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            recipe_id INTEGER,
-            step_num INTEGER,
-            step_text TEXT
-        )
-    """)
-    cur.execute("DELETE FROM instructions WHERE recipe_id = ?", (recipe_id,))
+        ingredients.append((recipe_id, qty, text, ", ".join(category_texts) if category_texts else None))
 
+    # === Instrucciones ===
+    instructions = []
     for step in recipe.get("directions", []):
         step_num = step.get("stepNum")
         step_text = step.get("stepText") or step.get("text")
-        cur.execute("INSERT INTO instructions (recipe_id, step_num, step_text) VALUES (?, ?, ?)",
-                    (recipe_id, step_num, step_text))
+        instructions.append((recipe_id, step_num, step_text))
+
+    return details, ingredients, instructions
 
+# === Escritura ===
+def write_recipes(conn, parsed):
+    """Escribe varias recetas parseadas con executemany, dentro de la transacción abierta (no hace commit)."""
+    ids = [(details[0],) for details, _, _ in parsed]
+    conn.executemany("DELETE FROM ingredients WHERE recipe_id = ?", ids)
+    conn.executemany("DELETE FROM instructions WHERE recipe_id = ?", ids)
+    conn.executemany("""
+        INSERT OR REPLACE INTO details 
+        (recipe_id, url, title, description, prep_time, cook_time, total_time, author, image, category, keywords, total_ingredients, total_steps, total_reviews,
+         prep_minutes, cook_minutes, total_minutes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [details for details, _, _ in parsed])
+    conn.executemany("INSERT INTO ingredients (recipe_id, quantity, text, category_texts) VALUES (?, ?, ?, ?)",
+                     [row for _, ingredients, _ in parsed for row in ingredients])
+    conn.executemany("INSERT INTO instructions (recipe_id, step_num, step_text) VALUES (?, ?, ?)",
+                     [row for _, _, instructions in parsed for row in instructions])
+
+class DetailsWriter:
+    """Junta recetas parseadas y las escribe de a BATCH_SIZE en una sola transacción.
+
+    El checkpoint se guarda recién después del commit, así que si el proceso se
+    corta nunca queda apuntando más allá de lo que está en la base.
+    """
+
+    def __init__(self, db_path=None, batch_size=BATCH_SIZE, checkpoint=True):
+        self.conn = sqlite3.connect(db_path or DB_PATH)
+        create_tables(self.conn)
+        self.conn.commit()
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.buffer = []
+        self.last_rid = None
+        self.records = []  # huellas de lo que está en el buffer
+
+    def add(self, parsed, rid, record=None):
+        if parsed:
+            self.buffer.append(parsed)
+        self.records.append(record)
+        self.last_rid = rid
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def fail(self, rid):
+        self.last_rid = rid  # el fallo ya quedó en crawl_failures (ver fetch_recipe_details)
+
+    def flush(self):
+        if self.buffer:
+            write_recipes(self.conn, self.buffer)
+            self.conn.commit()
+            self.buffer.clear()
+        FINGERPRINTS.save(self.records)
+        self.records.clear()
+        if self.checkpoint and self.last_rid is not None:
+            save_checkpoint(self.last_rid)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def save_recipe(recipe_json, recipe_url):
+    """Guarda una sola receta en su propia transacción."""
+    parsed = parse_recipe(recipe_json, recipe_url)
+    if not parsed:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    write_recipes(conn, [parsed])
     conn.commit()
     conn.close()
 
-    print(f"✅ Guardado receta {recipe_id} | {title} | Ingredientes: {total_ingredients} | Pasos: {total_steps} | Reviews: {total_reviews}")
-
 def load_checkpoint():
     if os.path.exists(CHECKPOINT_FILE):
         with open(CHECKPOINT_FILE, "r") as f:
@@ -145,7 +229,7 @@ def save_checkpoint(recipe_id):
     with open(CHECKPOINT_FILE, "w") as f:
         f.write(str(recipe_id))
 
-def process_all_recipes(limit=None):
+def process_all_recipes(limit=None, recrawl=False):
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     cur.execute("SELECT recipe_id, url FROM recipes ORDER BY recipe_id")
@@ -158,7 +242,7 @@ def process_all_recipes(limit=None):
         rows = rows[:limit]
 
     # cargar checkpoint
-    last_recipe = load_checkpoint()
+    last_recipe = None if recrawl else load_checkpoint()
     if last_recipe:
         start_index = next((i for i, (rid, _) in enumerate(rows) if rid == last_recipe), -1) + 1
         print(f"🔄 Reanudando desde recipe {last_recipe} (índice {start_index})")
@@ -166,21 +250,89 @@ def process_all_recipes(limit=None):
         start_index = 0
         print("🚀 Comenzando desde el inicio")
 
-    for i, (rid, url) in enumerate(rows[start_index:], start=start_index + 1):
-        data = fetch_recipe_details(url)
-        if data:
-            save_recipe(data, url)
-        else:
-            print(f"⚠️ No se pudo obtener la receta {rid}, se omite.")
-            save_failed(rid)  # 👉 guardar en archivo de fallos
+    writer = DetailsWriter()
+    try:
+        for i, (rid, url) in enumerate(rows[start_index:], start=start_index + 1):
+            data, record = fetch_recipe_details(rid, url)
+            parsed = parse_recipe(data, url) if data else None
+            if record and record.unchanged:
+                writer.add(None, rid, record)  # igual que la corrida anterior: no se parsea ni se escribe
+            elif parsed:
+                writer.add(parsed, rid, record)
+                details = parsed[0]
+                print(f"✅ Receta {details[0]} | {details[2]} | Ingredientes: {details[11]} | Pasos: {details[12]} | Reviews: {details[13]}")
+            elif data:
+                writer.add(None, rid, record)
+            else:
+                print(f"⚠️ No se pudo obtener la receta {rid}, se omite.")
+                writer.fail(rid)
+
+            if i % 50 == 0:
+                print(f"--- Progreso: {i}/{total} recetas ---")
+            time.sleep(0.5)
+    finally:
+        writer.close()  # lo que quedó en el buffer + checkpoint
 
-        save_checkpoint(rid)  # checkpoint después de cada receta
+    print(f"🎉 Proceso completo. {FINGERPRINTS.summary()}")
 
-        if i % 50 == 0:
-            print(f"--- Progreso: {i}/{total} recetas ---")
-        time.sleep(0.5)
+# === Benchmark de escritura (sin red) ===
+def fake_recipe_json(recipe_id, n_ingredients=10, n_steps=8):
+    return {
+        "recipe": {
+            "id": recipe_id,
+            "jsonLd": {"name": f"Receta {recipe_id}", "description": "x" * 200, "prepTime": "PT15M",
+                       "cookTime": "PT30M", "totalTime": "PT45M", "author": "chef", "image": "img.jpg",
+                       "recipeCategory": "Dessert", "keywords": "a, b, c"},
+            "ingredients": [{"quantity": "1", "ingredText": f"$0$ número {k}",
+                             "hyperlinkFoodTextList": {"0": {"text": "sugar"}}} for k in range(n_ingredients)],
+            "directions": [{"stepNum": k + 1, "stepText": f"Paso {k + 1}"} for k in range(n_steps)],
+        },
+        "reviewFeed": {"total": 3},
+    }
 
-    print("🎉 Proceso completo.")
+def benchmark(n=2000):
+    """Filas/segundo guardando n recetas de a una (save_recipe) y en lotes (DetailsWriter)."""
+    global DB_PATH
+    recipes = [(fake_recipe_json(i), f"https://www.food.com/recipe/{i}") for i in range(1, n + 1)]
+    rows = sum(1 + len(r["recipe"]["ingredients"]) + len(r["recipe"]["directions"]) for r, _ in recipes)
+    original = DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            DB_PATH = os.path.join(tmp, "una_por_una.db")
+            conn = sqlite3.connect(DB_PATH)
+            create_tables(conn)
+            conn.close()
+            start = time.perf_counter()
+            for data, url in recipes:
+                save_recipe(data, url)
+            single = time.perf_counter() - start
+
+            start = time.perf_counter()
+            writer = DetailsWriter(os.path.join(tmp, "lotes.db"), checkpoint=False)
+            for i, (data, url) in enumerate(recipes):
+                writer.add(parse_recipe(data, url), i)
+            writer.close()
+            batched = time.perf_counter() - start
+        finally:
+            DB_PATH = original
+
+    print(f"📊 {n} recetas ({rows} filas)")
+    print(f"   una transacción por receta: {rows / single:10.0f} filas/s ({single:.2f}s)")
+    print(f"   lotes de {BATCH_SIZE}:           {rows / batched:10.0f} filas/s ({batched:.2f}s)  x{single / batched:.1f}")
 
 if __name__ == "__main__":
-    process_all_recipes(limit=None)
+    parser = argparse.ArgumentParser(description="Descarga detalles, ingredientes e instrucciones de cada receta")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--bench", type=int, metavar="N", help="solo mide la escritura de N recetas sintéticas")
+    parser.add_argument("--recrawl", action="store_true", help="ignora el checkpoint; se saltean las recetas que no cambiaron")
+    parser.add_argument("--no-fingerprints", action="store_true", help="bajar y escribir todo aunque no haya cambiado")
+    parser.add_argument("--no-archive", action="store_true", help="no guardar las respuestas crudas (ver archivo.py)")
+    args = parser.parse_args()
+
+    FINGERPRINTS.enabled = not args.no_fingerprints
+    ARCHIVE.enabled = not args.no_archive
+
+    if args.bench:
+        benchmark(args.bench)
+    else:
+        process_all_recipes(limit=args.limit, recrawl=args.recrawl)
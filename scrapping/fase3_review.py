@@ -1,11 +1,42 @@
+# fase3_review.py
+# Descarga las reviews de cada receta de la tabla recipes.
+#
+# Uso:
+#   python fase3_review.py                          # una receta a la vez (checkpoint.txt)
+#   python fase3_review.py --pipeline --workers 8   # fetchers en paralelo + un solo escritor
+#   python fase3_review.py --pipeline --url "http://127.0.0.1:8765/recipes/{recipe_id}/feed/reviews"
+#
+# En modo --pipeline las recetas terminadas se marcan en la tabla reviews_done
+# en la misma transacción que sus reviews, así que al reanudar se saltean
+# exactamente las que ya están guardadas.
+
+import argparse
+import queue
 import sqlite3
-import requests
+import threading
 import time
 import os
 
+import archivo
+import crawler
+import fallos
+import huellas
+
 DB_PATH = "foodcom.db"
 CHECKPOINT_FILE = "checkpoint.txt"
-FAILED_FILE = "failed_reviews.txt"
+API_URL = "https://api.food.com/external/v1/recipes/{recipe_id}/feed/reviews"
+
+# --- modo --pipeline ---
+WORKERS = 4            # fetchers en paralelo (cada uno respeta la pausa anti-baneo entre páginas)
+QUEUE_SIZE = 200       # recetas descargadas esperando al escritor; si se llena, los fetchers esperan
+BATCH_ROWS = 5000      # reviews por transacción
+BATCH_SECONDS = 5.0    # o commit cada tantos segundos, lo que pase primero
+STATS_EVERY = 10.0     # segundos entre reportes de throughput
+
+FINGERPRINTS = huellas.Fingerprints(DB_PATH)
+FAILURES = fallos.Failures(DB_PATH)
+ARCHIVE = archivo.Archive("reviews")
+SESSION = crawler.make_session(WORKERS)
 
 def create_table():
     conn = sqlite3.connect(DB_PATH)
@@ -25,68 +56,104 @@ def create_table():
     conn.commit()
     conn.close()
 
+def parse_reviews(data, recipe_id):
+    """Filas de la tabla reviews a partir de una página del feed."""
+    return [(
+        str(rev.get("id")),              # id de la review
+        recipe_id,                       # receta
+        rev.get("memberId"),             # id del autor
+        rev.get("memberName"),           # nombre del autor
+        rev.get("rating"),               # rating
+        rev.get("counts", {}).get("like", 0),
+        rev.get("submitted"),            # fecha
+        rev.get("text", "").replace("\n", " ").strip()
+    ) for rev in data.get("data", {}).get("items", [])]
+
+def paginate_reviews(recipe_id, get_page, pause=0.0):
+    """(filas, huella) con todas las páginas de reviews de una receta; filas es None si la primera no cambió.
+
+    get_page(page) -> (json, huella) baja una página (la primera como pedido
+    condicional, con json None si no cambió) y lanza una excepción si falla.
+    Lo usan fetch_reviews y la fase de reviews de crawler.py.
+    """
+    rows, total, record, page = [], None, None, 1
+    while True:
+        data, page_record = get_page(page)
+        if page == 1:
+            record = page_record
+            if record and record.unchanged:
+                return None, record
+        if total is None:
+            total = data.get("total", 0)
+        page_rows = parse_reviews(data, recipe_id)
+        if not page_rows:
+            break
+        rows.extend(page_rows)
+        if len(rows) >= total:
+            break
+        page += 1
+        if pause:
+            time.sleep(pause)  # anti-baneo
+    return rows, record
+
 def fetch_reviews(recipe_id, retries=3):
-    """Descarga todas las reviews de una receta con paginación y reintentos."""
-    url_template = f"https://api.food.com/external/v1/recipes/{recipe_id}/feed/reviews"
-    page = 1
-    all_reviews = []
-    total = None
+    """(reviews, huella) de una receta, con paginación y reintentos. reviews es None si falló.
+
+    La primera página (las más nuevas) va como pedido condicional: si no cambió
+    desde la corrida anterior, la receta no tiene reviews nuevas y se devuelve
+    ([], record) con record.unchanged sin pedir el resto.
+    Los fallos quedan en crawl_failures para que los reintente crawler.py.
+    """
+    url = API_URL.format(recipe_id=recipe_id)
 
+    def get_page(page):
+        params = {"pn": page, "sortBy": "-time"}
+        if page == 1:
+            r, record = FINGERPRINTS.get(SESSION, url, params=params, timeout=crawler.TIMEOUT)
+            if record and record.unchanged:
+                return None, record
+        else:
+            r, record = SESSION.get(url, params=params, timeout=crawler.TIMEOUT), None
+        if r.status_code != 200:
+            raise crawler.FetchError(r.status_code, r.url, r.headers.get("Retry-After"))
+        ARCHIVE.append(recipe_id, page, r.url, r.text)
+        return r.json(), record
+
+    error = None
     for attempt in range(1, retries + 1):
         try:
-            while True:
-                params = {"pn": page, "sortBy": "-time"}
-                r = requests.get(url_template, params=params, timeout=20)
-                if r.status_code != 200:
-                    print(f"❌ Error {r.status_code} en recipe {recipe_id}, page {page}")
-                    return []
-
-                data = r.json()
-                if total is None:
-                    total = data.get("total", 0)
-
-                items = data.get("data", {}).get("items", [])
-                if not items:
-                    break
-
-                for rev in items:
-                    all_reviews.append((
-                        str(rev.get("id")),              # id de la review
-                        recipe_id,                       # receta
-                        rev.get("memberId"),             # id del autor
-                        rev.get("memberName"),           # nombre del autor
-                        rev.get("rating"),               # rating
-                        rev.get("counts", {}).get("like", 0),
-                        rev.get("submitted"),            # fecha
-                        rev.get("text", "").replace("\n", " ").strip()
-                    ))
-
-                if len(all_reviews) >= total:
-                    break
-
-                page += 1
-                time.sleep(0.5)  # anti-baneo
-
-            return all_reviews
-
+            reviews, record = paginate_reviews(recipe_id, get_page, pause=0.5)
+            return (reviews if reviews is not None else []), record
+        except crawler.FetchError as e:
+            FAILURES.record("reviews", recipe_id, str(e), retryable=e.retryable)
+            return None, None
         except Exception as e:
+            error = e
             print(f"⚠️ Error en recipe {recipe_id}, intento {attempt}/{retries}: {e}")
             time.sleep(2)
 
     # Si llega acá, falló en todos los intentos
-    with open(FAILED_FILE, "a") as f:
-        f.write(f"{recipe_id}\n")
-    print(f"❌ No se pudo traer reviews de receta {recipe_id}, guardado en {FAILED_FILE}")
-    return []
+    FAILURES.record("reviews", recipe_id, f"{type(error).__name__}: {error}")
+    return None, None
 
-def save_reviews(batch):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.executemany("""
-        INSERT OR REPLACE INTO reviews 
+def write_reviews(conn, batch):
+    """Escribe filas de reviews dentro de la transacción abierta (no hace commit).
+
+    Upsert en vez de INSERT OR REPLACE: pisar la fila con un UPDATE dispara el
+    trigger que mantiene user_stats (ver migraciones.py); el REPLACE no.
+    """
+    conn.executemany("""
+        INSERT INTO reviews 
         (id, recipe_id, author_id, author, rating, likes, submitted, text)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            recipe_id = excluded.recipe_id, author_id = excluded.author_id, author = excluded.author,
+            rating = excluded.rating, likes = excluded.likes, submitted = excluded.submitted, text = excluded.text
     """, batch)
+
+def save_reviews(batch):
+    conn = sqlite3.connect(DB_PATH)
+    write_reviews(conn, batch)
     conn.commit()
     conn.close()
 
@@ -100,7 +167,7 @@ def save_checkpoint(recipe_id):
     with open(CHECKPOINT_FILE, "w") as f:
         f.write(str(recipe_id))
 
-def main():
+def main(recrawl=False):
     create_table()
 
     # cargar todos los recipe_id
@@ -114,7 +181,7 @@ def main():
     total_saved = 0
 
     # cargar checkpoint
-    last_recipe = load_checkpoint()
+    last_recipe = None if recrawl else load_checkpoint()
     if last_recipe and last_recipe in recipe_ids:
         start_index = recipe_ids.index(last_recipe) + 1
         print(f"🔄 Reanudando desde recipe {last_recipe} (índice {start_index})")
@@ -123,8 +190,10 @@ def main():
         print("🚀 Comenzando desde el inicio")
 
     for i, rid in enumerate(recipe_ids[start_index:], start=start_index + 1):
-        reviews = fetch_reviews(rid)
-        if reviews:
+        reviews, record = fetch_reviews(rid)
+        if record and record.unchanged:
+            print(f"⏭ Receta {rid} sin reviews nuevas")
+        elif reviews:
             save_reviews(reviews)
             total_saved += len(reviews)
             print(f"💾 Guardadas {len(reviews)} reviews para receta {rid} "
@@ -132,14 +201,181 @@ def main():
         else:
             print(f"ℹ️ Receta {rid} no tiene reviews o falló la descarga")
 
-        # guardar checkpoint después de cada receta
+        # guardar huella y checkpoint después de cada receta
+        FINGERPRINTS.save([record])
         save_checkpoint(rid)
 
         print(f"✅ Receta {i}/{total_recipes} procesada. "
               f"Faltan {total_recipes - i} recetas.")
 
     print(f"🎉 Proceso completo: {total_saved} reviews guardadas en total "
-          f"para {total_recipes} recetas.")
+          f"para {total_recipes} recetas. {FINGERPRINTS.summary()}")
+
+# --- pipeline: fetchers -> cola acotada -> un escritor ---
+def create_done_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reviews_done (
+        recipe_id INTEGER PRIMARY KEY,
+        reviews INTEGER,
+        done_at TEXT
+    )
+    """)
+
+class Stats:
+    """Contadores por etapa; report() imprime el throughput desde el último reporte y el acumulado."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = self.last = time.perf_counter()
+        self.counts = {"fetched": 0, "failed": 0, "unchanged": 0, "reviews_fetched": 0, "written": 0, "reviews_written": 0, "commits": 0}
+        self.prev = dict(self.counts)
+        self.fetch_seconds = 0.0
+        self.commit_seconds = 0.0
+
+    def add(self, **counts):
+        with self.lock:
+            for k, v in counts.items():
+                self.counts[k] += v
+
+    def report(self, q, final=False):
+        with self.lock:
+            now = time.perf_counter()
+            c, elapsed = dict(self.counts), now - self.last
+            delta = {k: c[k] - self.prev[k] for k in c}
+            self.prev, self.last = c, now
+            fetch_avg = self.fetch_seconds / max(1, c["fetched"] + c["failed"])
+            commit_avg = self.commit_seconds / max(1, c["commits"])
+        if final:
+            elapsed = now - self.start
+            delta = c
+        print(f"📈 fetch: {delta['fetched'] / elapsed:.1f} recetas/s, {delta['reviews_fetched'] / elapsed:.0f} reviews/s "
+              f"({fetch_avg:.2f}s por receta, {c['failed']} fallidas, {c['unchanged']} sin cambios) | cola: {q.qsize()}/{q.maxsize} | "
+              f"escritor: {delta['reviews_written'] / elapsed:.0f} reviews/s, {c['commits']} commits "
+              f"({commit_avg * 1000:.0f} ms c/u) | total: {c['written']} recetas, {c['reviews_written']} reviews")
+
+def _fetcher(ids, out, stats, stop):
+    while not stop.is_set():
+        try:
+            rid = ids.get_nowait()
+        except queue.Empty:
+            break
+        start = time.perf_counter()
+        reviews, record = fetch_reviews(rid)
+        with stats.lock:
+            stats.fetch_seconds += time.perf_counter() - start
+        if reviews is None:
+            stats.add(failed=1)  # no se marca como hecha: se reintenta en la próxima corrida
+        elif record and record.unchanged:
+            stats.add(unchanged=1)
+            out.put((rid, None, record))
+        else:
+            stats.add(fetched=1, reviews_fetched=len(reviews))
+            out.put((rid, reviews, record))
+    out.put(None)
+
+def _writer(out, n_fetchers, stats, batch_rows=BATCH_ROWS, batch_seconds=BATCH_SECONDS):
+    conn = sqlite3.connect(DB_PATH)
+    rows, done, unchanged, records = [], [], [], []
+    last_commit = time.perf_counter()
+
+    def commit():
+        nonlocal last_commit
+        start = time.perf_counter()
+        write_reviews(conn, rows)
+        conn.executemany("INSERT OR REPLACE INTO reviews_done VALUES (?, ?, datetime('now'))", done)
+        conn.executemany("INSERT OR IGNORE INTO reviews_done VALUES (?, NULL, datetime('now'))", unchanged)
+        conn.commit()
+        FINGERPRINTS.save(records)  # recién ahora: sus reviews ya están en la base
+        with stats.lock:
+            stats.commit_seconds += time.perf_counter() - start
+        stats.add(written=len(done), reviews_written=len(rows), commits=1)
+        rows.clear()
+        done.clear()
+        unchanged.clear()
+        records.clear()
+        last_commit = time.perf_counter()
+
+    finished = 0
+    while finished < n_fetchers:
+        try:
+            item = out.get(timeout=batch_seconds)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            finished += 1
+        elif item:
+            rid, reviews, record = item
+            if reviews is None:
+                unchanged.append((rid,))
+            else:
+                rows.extend(reviews)
+                done.append((rid, len(reviews)))
+            records.append(record)
+        if records and (len(rows) >= batch_rows or time.perf_counter() - last_commit >= batch_seconds):
+            commit()
+    if records:
+        commit()
+    conn.close()
+
+def main_pipeline(workers=WORKERS, queue_size=QUEUE_SIZE, recrawl=False):
+    global SESSION
+    SESSION = crawler.make_session(workers)  # una conexión por fetcher
+    create_table()
+    conn = sqlite3.connect(DB_PATH)
+    create_done_table(conn)
+    conn.commit()
+    recipe_ids = [row[0] for row in conn.execute(f"""
+        SELECT recipe_id FROM recipes
+        {"" if recrawl else "WHERE recipe_id NOT IN (SELECT recipe_id FROM reviews_done)"}
+        ORDER BY recipe_id
+    """)]
+    already = conn.execute("SELECT count(*) FROM reviews_done").fetchone()[0]
+    conn.close()
+    print(f"🚀 Pipeline: {len(recipe_ids)} recetas pendientes ({already} ya terminadas), {workers} fetchers")
+
+    ids = queue.Queue()
+    for rid in recipe_ids:
+        ids.put(rid)
+    out = queue.Queue(maxsize=queue_size)
+    stats = Stats()
+    stop = threading.Event()
+
+    fetchers = [threading.Thread(target=_fetcher, args=(ids, out, stats, stop), name=f"fetcher-{k}", daemon=True)
+                for k in range(workers)]
+    writer = threading.Thread(target=_writer, args=(out, workers, stats), name="writer")
+    for t in fetchers:
+        t.start()
+    writer.start()
+
+    try:
+        while writer.is_alive():
+            writer.join(STATS_EVERY)
+            if writer.is_alive():
+                stats.report(out)
+    except KeyboardInterrupt:
+        # los fetchers terminan la receta en curso; el escritor guarda lo que ya llegó
+        print("⏸ Interrumpido por el usuario. Guardando lo descargado...")
+        stop.set()
+        writer.join()
+    stats.report(out, final=True)
+    print(f"🎉 Pipeline terminado: {stats.counts['written']} recetas, {stats.counts['reviews_written']} reviews guardadas. "
+          f"{FINGERPRINTS.summary()}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Descarga las reviews de cada receta")
+    parser.add_argument("--pipeline", action="store_true", help="fetchers en paralelo y un único escritor en lotes")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--url", default=API_URL, help="plantilla del endpoint con {recipe_id} (ej. stub_server.py)")
+    parser.add_argument("--recrawl", action="store_true", help="vuelve a pasar por todas las recetas; se saltean las que no cambiaron")
+    parser.add_argument("--no-fingerprints", action="store_true", help="bajar y escribir todo aunque no haya cambiado")
+    parser.add_argument("--no-archive", action="store_true", help="no guardar las respuestas crudas (ver archivo.py)")
+    args = parser.parse_args()
+
+    API_URL = args.url
+    FINGERPRINTS.enabled = not args.no_fingerprints
+    ARCHIVE.enabled = not args.no_archive
+    if args.pipeline:
+        main_pipeline(args.workers, args.queue_size, args.recrawl)
+    else:
+        main(args.recrawl)
@@ -1,12 +1,41 @@
-import requests
+# fase4_user.py
+# Resume la actividad de cada autor de reviews en la tabla users.
+#
+# Uso:
+#   python fase4_user.py                                      # todos, paginando el feed completo
+#   python fase4_user.py --incremental --workers 8 --rate 5   # solo lo nuevo desde la corrida anterior
+#
+# En modo --incremental se guarda en users_sync la actividad más nueva vista
+# de cada usuario; la próxima corrida pagina el feed (que viene de la más
+# nueva a la más vieja) solo hasta llegar a ella, suma lo nuevo a los totales
+# y escribe únicamente las filas que cambiaron. Los likes de actividades
+# viejas no se vuelven a contar: para eso está la corrida completa.
+
+import argparse
 import sqlite3
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import archivo
+import crawler
+import fallos
+import huellas
 
 DB_PATH = "foodcom.db"
 BATCH_SIZE = 1000
 CHECKPOINT_FILE = "users_checkpoint.txt"
-FAILED_FILE = "failed_users.txt"
+API_URL = "https://api.food.com/external/v1/members/{user_id}/feed"
+PAGE_SIZE = 20
+
+# --- modo --incremental ---
+WORKERS = 8      # usuarios en paralelo
+RATE = 5.0       # pedidos por segundo entre todos los hilos
+
+FINGERPRINTS = huellas.Fingerprints(DB_PATH)
+FAILURES = fallos.Failures(DB_PATH)
+ARCHIVE = archivo.Archive("users")
+SESSION = crawler.make_session(WORKERS)
 
 def create_users_table():
     conn = sqlite3.connect(DB_PATH)
@@ -29,30 +58,85 @@ def create_users_table():
     conn.commit()
     conn.close()
 
-def fetch_user_feed(user_id, page=1, size=20, retries=3):
-    url = f"https://api.food.com/external/v1/members/{user_id}/feed"
+def create_sync_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users_sync (
+            user_id INTEGER PRIMARY KEY,
+            newest_id TEXT,
+            newest_at TEXT,
+            refreshed_at TEXT
+        )
+    """)
+
+def fetch_user_feed(user_id, page=1, size=PAGE_SIZE, retries=3, limiter=None):
+    """(json, huella). La primera página va como pedido condicional; si no cambió, json es None y record.unchanged.
+
+    limiter es un crawler.RateLimiter compartido: se frena ante 429/5xx.
+    Si fallan todos los intentos, el usuario queda en crawl_failures para que lo reintente crawler.py.
+    """
+    url = API_URL.format(user_id=user_id)
+    error = None
     params = {"pn": page, "size": size, "blockGdpr": "false"}
     headers = {"User-Agent": "Mozilla/5.0"}
 
     for attempt in range(1, retries + 1):
         try:
-            r = requests.get(url, params=params, headers=headers, timeout=20)
+            if limiter:
+                limiter.acquire()
+            if page == 1:
+                r, record = FINGERPRINTS.get(SESSION, url, params=params, headers=headers, timeout=crawler.TIMEOUT)
+                if record and record.unchanged:
+                    return None, record
+            else:
+                r, record = SESSION.get(url, params=params, headers=headers, timeout=crawler.TIMEOUT), None
             if r.status_code == 200:
-                return r.json()
+                if limiter:
+                    limiter.speed_up()
+                ARCHIVE.append(user_id, page, r.url, r.text)
+                return r.json(), record
             else:
+                if limiter and (r.status_code == 429 or r.status_code >= 500):
+                    limiter.slow_down()
+                error = f"HTTP {r.status_code} en la página {page}"
                 print(f"❌ Error {r.status_code} en usuario {user_id}, intento {attempt}")
         except Exception as e:
+            error = f"{type(e).__name__}: {e}"
             print(f"⚠️ Error en usuario {user_id}, intento {attempt}: {e}")
         time.sleep(2)
 
-    # Si no se pudo traer nada en los 3 intentos, guardamos en archivo
-    with open(FAILED_FILE, "a") as f:
-        f.write(f"{user_id}\n")
-    print(f"❌ Usuario {user_id} no se pudo descargar, guardado en {FAILED_FILE}")
-    return None
+    # Si no se pudo traer nada en los 3 intentos, lo reintenta crawler.py
+    FAILURES.record("users", user_id, error)
+    return None, None
+
+def _already_seen(item, since):
+    newest_id, newest_at = since
+    if newest_id is not None and str(item.get("id")) == newest_id:
+        return True
+    submitted = item.get("submitted") or item.get("createdOn")
+    return newest_at is not None and submitted is not None and submitted <= newest_at
+
+def summarize_user(user_id, since=None, limiter=None, fetch_page=None):
+    """Totales de actividad del usuario.
+
+    Con since=(newest_id, newest_at) de la corrida anterior deja de paginar al
+    llegar a una actividad ya vista y los totales son solo de lo nuevo.
+    newest_id/newest_at en el resultado marcan desde dónde seguir la próxima vez.
 
-def summarize_user(user_id):
+    Si la primera página es igual a la de la corrida anterior (ver huellas.py)
+    devuelve {"user_id", "unchanged": True, "record"} sin pedir más páginas.
+    Eso también saltea recontar likes de actividades viejas: para forzarlo,
+    --no-fingerprints.
+
+    Si falla una página después de la primera, complete es False: los totales
+    quedan a medias y no hay que guardarlos, ni el cursor ni la huella.
+
+    fetch_page(page) -> (json, huella) reemplaza la descarga (archivo.py lo usa
+    para re-parsear desde el archivo de respuestas crudas).
+    """
     page = 1
+    pages = 0
+    record = None
+    newest_id, newest_at = since or (None, None)
     total_activities = 0
     total_reviews = 0
     total_photos = 0
@@ -63,9 +147,18 @@ def summarize_user(user_id):
     date_joined = None
     followers = None
     following = None
+    complete = True
 
     while True:
-        data = fetch_user_feed(user_id, page)
+        if fetch_page:
+            data, page_record = fetch_page(page)
+        else:
+            data, page_record = fetch_user_feed(user_id, page, limiter=limiter)
+        pages += 1
+        if page == 1:
+            record = page_record
+            if record and record.unchanged:
+                return {"user_id": user_id, "unchanged": True, "record": record, "pages": pages}
         if not data or "data" not in data:
             # si en la primera página no trae nada, abortamos rápido
             if page == 1:
@@ -82,7 +175,15 @@ def summarize_user(user_id):
                     "total_reviews": 0,
                     "total_photos": 0,
                     "total_likes": 0,
+                    "newest_id": newest_id,
+                    "newest_at": newest_at,
+                    "pages": pages,
+                    "found": False,
+                    "complete": False,
+                    "unchanged": False,
+                    "record": record,
                 }
+            complete = False  # falló una página intermedia (queda en crawl_failures)
             break
 
         # Info del usuario (solo viene en la primera página)
@@ -95,9 +196,16 @@ def summarize_user(user_id):
         items = data["data"].get("items", [])
         if not items:
             break
+        if page == 1:
+            newest_id = str(items[0].get("id"))
+            newest_at = items[0].get("submitted") or items[0].get("createdOn")
 
-        total_activities += len(items)
+        reached = False
         for item in items:
+            if since and _already_seen(item, since):
+                reached = True
+                break
+            total_activities += 1
             if not name:
                 name = item.get("memberName")
                 profile_url = item.get("memberProfileUrl")
@@ -108,10 +216,11 @@ def summarize_user(user_id):
                 total_photos += 1
             total_likes += item.get("counts", {}).get("like", 0)
 
-        if len(items) < 20:
+        if reached or len(items) < PAGE_SIZE:
             break
         page += 1
-        time.sleep(0.3)
+        if not limiter and not fetch_page:
+            time.sleep(0.3)
 
     return {
         "user_id": user_id,
@@ -125,12 +234,18 @@ def summarize_user(user_id):
         "total_reviews": total_reviews,
         "total_photos": total_photos,
         "total_likes": total_likes,
+        "newest_id": newest_id,
+        "newest_at": newest_at,
+        "pages": pages,
+        "found": True,
+        "complete": complete,
+        "unchanged": False,
+        "record": record,
     }
 
-def save_users(batch):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.executemany("""
+def write_users(conn, batch):
+    """Escribe resúmenes de summarize_user en users dentro de la transacción abierta (no hace commit)."""
+    conn.executemany("""
         INSERT OR REPLACE INTO users (
             user_id, name, profile_url, avatar_url, date_joined,
             followers, following, total_activities, total_reviews, total_photos, total_likes
@@ -142,6 +257,10 @@ def save_users(batch):
             u["total_activities"], u["total_reviews"], u["total_photos"], u["total_likes"]
         ) for u in batch
     ])
+
+def save_users(batch):
+    conn = sqlite3.connect(DB_PATH)
+    write_users(conn, batch)
     conn.commit()
     conn.close()
 
@@ -168,17 +287,26 @@ def main():
     print(f"📊 Usuarios a procesar: {total_users}, reanudando en {start_index}")
 
     batch = []
+    records = []  # huellas de los usuarios procesados desde el último save_users
     processed = start_index
 
     for idx, user_id in enumerate(all_user_ids[start_index:], start=start_index):
         print(f"➡️ Procesando usuario {user_id} ({idx+1}/{total_users})")
         summary = summarize_user(user_id)
-        if summary["name"]:  # solo guardamos si existe info
+        if summary["unchanged"]:
+            records.append(summary["record"])
+            print(f"⏭ Usuario {user_id} sin cambios")
+        elif summary["found"] and not summary["complete"]:
+            print(f"⚠️ Usuario {user_id}: el feed quedó a medias, no se guarda (se reintenta desde crawl_failures)")
+        elif summary["name"]:  # solo guardamos si existe info
+            records.append(summary["record"])
             batch.append(summary)
         processed += 1
 
         if len(batch) >= BATCH_SIZE:
             save_users(batch)
+            FINGERPRINTS.save(records)
+            records = []
             save_checkpoint(processed)
             print(f"💾 Guardados {processed}/{total_users} usuarios...")
             batch = []
@@ -187,8 +315,124 @@ def main():
         save_users(batch)
         save_checkpoint(processed)
         print(f"💾 Guardados {processed}/{total_users} usuarios (final).")
+    FINGERPRINTS.save(records)
+
+    print(f"🎉 Proceso completo. {FINGERPRINTS.summary()}")
+
+# --- refresco incremental ---
+USER_COLUMNS = ["user_id", "name", "profile_url", "avatar_url", "date_joined", "followers", "following",
+                "total_activities", "total_reviews", "total_photos", "total_likes"]
+TOTALS = ["total_activities", "total_reviews", "total_photos", "total_likes"]
+
+def refresh_user(user_id, old, sync, limiter):
+    """(fila nueva de users, fila de users_sync, páginas pedidas, huella); None si no hay datos.
+
+    Si el feed no cambió desde la corrida anterior, o si se cortó a mitad de camino, devuelve la
+    fila y la sincronización que ya estaban (en el segundo caso sin huella, para volver a bajarlo).
+    """
+    since = (sync[1], sync[2]) if sync and old else None
+    summary = summarize_user(user_id, since=since, limiter=limiter)
+    if summary["unchanged"]:
+        return old, sync, summary["pages"], summary["record"]
+    if summary["found"] and not summary["complete"]:
+        return old, sync, summary["pages"], None
+    if since is None:
+        if not summary["name"]:
+            return None
+        new = {c: summary[c] for c in USER_COLUMNS}
+    else:
+        if not summary["found"]:  # no se pudo leer ni la primera página: se deja como estaba
+            return None
+        new = dict(old)
+        for col in TOTALS:
+            new[col] += summary[col]
+        for col in ["name", "profile_url", "avatar_url"]:
+            new[col] = summary[col] or old[col]
+        for col in ["date_joined", "followers", "following"]:
+            new[col] = summary[col] if summary[col] is not None else old[col]
+    return new, (user_id, summary["newest_id"], summary["newest_at"]), summary["pages"], summary["record"]
+
+def main_incremental(workers=WORKERS, rate=RATE):
+    global SESSION
+    SESSION = crawler.make_session(workers)  # una conexión por hilo
+    create_users_table()
+    conn = sqlite3.connect(DB_PATH)
+    create_sync_table(conn)
+    conn.commit()
+    conn.row_factory = sqlite3.Row
+    all_user_ids = [row[0] for row in conn.execute("SELECT DISTINCT author_id FROM reviews WHERE author_id IS NOT NULL")]
+    users = {row["user_id"]: dict(row) for row in conn.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users")}
+    syncs = {row[0]: tuple(row) for row in conn.execute("SELECT user_id, newest_id, newest_at FROM users_sync")}
+    conn.row_factory = None
+    print(f"📊 Usuarios a refrescar: {len(all_user_ids)} ({len(syncs)} con sincronización previa), "
+          f"{workers} hilos a {rate} pedidos/s")
 
-    print("🎉 Proceso completo.")
+    limiter = crawler.RateLimiter(rate)
+    changed_users, changed_syncs, records = [], [], []
+    stats = {"done": 0, "pages": 0, "users": 0, "syncs": 0}
+    start = time.perf_counter()
+
+    def flush():
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO users ({', '.join(USER_COLUMNS)})
+            VALUES ({', '.join('?' * len(USER_COLUMNS))})
+        """, [tuple(u[c] for c in USER_COLUMNS) for u in changed_users])
+        conn.executemany("INSERT OR REPLACE INTO users_sync VALUES (?, ?, ?, datetime('now'))", changed_syncs)
+        conn.commit()
+        FINGERPRINTS.save(records)
+        records.clear()
+        stats["users"] += len(changed_users)
+        stats["syncs"] += len(changed_syncs)
+        changed_users.clear()
+        changed_syncs.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(refresh_user, uid, users.get(uid), syncs.get(uid), limiter): uid for uid in all_user_ids}
+        try:
+            for future in as_completed(futures):
+                uid = futures[future]
+                stats["done"] += 1
+                result = future.result()
+                if result is None:
+                    continue
+                new, sync, pages, record = result
+                stats["pages"] += pages
+                records.append(record)
+                if new is not None and new != users.get(uid):
+                    changed_users.append(new)
+                if sync is not None and sync != syncs.get(uid):
+                    changed_syncs.append(sync)
+                if len(records) >= BATCH_SIZE:
+                    flush()
+                if stats["done"] % 1000 == 0:
+                    print(f"➡️ {stats['done']}/{len(all_user_ids)} usuarios, {stats['pages']} páginas, "
+                          f"{stats['users'] + len(changed_users)} cambiados")
+        except KeyboardInterrupt:
+            print("⏸ Interrumpido por el usuario. Guardando lo refrescado...")
+            for f in futures:
+                f.cancel()
+        finally:
+            flush()
+    conn.close()
+
+    print(f"🎉 Refresco incremental: {stats['done']} usuarios, {stats['pages']} páginas en "
+          f"{time.perf_counter() - start:.1f}s; {stats['users']} filas de users y {stats['syncs']} de users_sync escritas. "
+          f"{FINGERPRINTS.summary()}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Resume la actividad de los autores en la tabla users")
+    parser.add_argument("--incremental", action="store_true", help="solo lo nuevo desde la última corrida, en paralelo")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="pedidos por segundo entre todos los hilos")
+    parser.add_argument("--url", default=API_URL, help="plantilla del endpoint con {user_id} (ej. stub_server.py)")
+    parser.add_argument("--no-fingerprints", action="store_true", help="bajar y escribir todo aunque no haya cambiado")
+    parser.add_argument("--no-archive", action="store_true", help="no guardar las respuestas crudas (ver archivo.py)")
+    args = parser.parse_args()
+
+    API_URL = args.url
+    FINGERPRINTS.enabled = not args.no_fingerprints
+    ARCHIVE.enabled = not args.no_archive
+    if args.incremental:
+        main_incremental(args.workers, args.rate)
+    else:
+        main()
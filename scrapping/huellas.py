@@ -0,0 +1,122 @@
+# huellas.py
+# Huellas de las respuestas crudas para re-crawls condicionales.
+#
+# Por cada URL se guarda el sha256 del cuerpo y los ETag / Last-Modified que
+# mandó el servidor. En la próxima corrida el pedido sale con If-None-Match /
+# If-Modified-Since: si responde 304, o si responde 200 con el mismo hash, la
+# respuesta está "sin cambios" y la fase se saltea el parseo y la escritura.
+#
+# Las huellas se guardan recién cuando la fase confirma que escribió los datos
+# (save(records) después de su commit): si el proceso se corta en el medio,
+# la próxima corrida vuelve a bajar esas URLs en vez de darlas por vistas.
+#
+# Lo usan las cuatro fases:
+#   fps = huellas.Fingerprints(DB_PATH)
+#   r, record = fps.get(session, url, params=params)
+#   if record and record.unchanged: ...saltear...
+#   ...guardar datos y commit...
+#   fps.save([record])
+
+import hashlib
+import sqlite3
+import threading
+
+import requests
+
+class Record:
+    """Resultado de un pedido condicional; se pasa a Fingerprints.save una vez guardados los datos."""
+
+    __slots__ = ("url", "sha256", "etag", "last_modified", "unchanged")
+
+    def __init__(self, url, sha256, etag, last_modified, unchanged):
+        self.url = url
+        self.sha256 = sha256
+        self.etag = etag
+        self.last_modified = last_modified
+        self.unchanged = unchanged
+
+class Fingerprints:
+    def __init__(self, db_path, enabled=True):
+        self.db_path = db_path
+        self.enabled = enabled  # False: pedidos normales, sin leer ni guardar huellas (corrida completa forzada)
+        self.conn = None
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "same_hash": 0, "changed": 0}
+
+    def _connection(self):
+        # una sola conexión compartida entre hilos, siempre usada bajo self.lock
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetch_fingerprints (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_at TEXT,
+                    changed_at TEXT
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    def lookup(self, url):
+        with self.lock:
+            return self._connection().execute(
+                "SELECT sha256, etag, last_modified FROM fetch_fingerprints WHERE url = ?", (url,)).fetchone()
+
+    def get(self, session, url, params=None, headers=None, **kwargs):
+        """(response, record). record es None si la respuesta no fue 200/304 o si las huellas están apagadas."""
+        session = session or requests
+        if not self.enabled:
+            return session.get(url, params=params, headers=headers, **kwargs), None
+
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        previous = self.lookup(full_url)
+        headers = dict(headers or {})
+        if previous:
+            if previous[1]:
+                headers["If-None-Match"] = previous[1]
+            if previous[2]:
+                headers["If-Modified-Since"] = previous[2]
+
+        r = session.get(url, params=params, headers=headers, **kwargs)
+        self._count("requests")
+        if r.status_code == 304 and previous:
+            self._count("not_modified")
+            return r, Record(full_url, previous[0], previous[1], previous[2], True)
+        if r.status_code != 200:
+            return r, None
+
+        sha256 = hashlib.sha256(r.content).hexdigest()
+        unchanged = previous is not None and previous[0] == sha256
+        self._count("same_hash" if unchanged else "changed")
+        return r, Record(full_url, sha256, r.headers.get("ETag"), r.headers.get("Last-Modified"), unchanged)
+
+    def save(self, records):
+        """Guarda las huellas de pedidos cuyos datos ya se escribieron (acepta None en la lista)."""
+        rows = [(r.url, r.sha256, r.etag, r.last_modified, r.unchanged) for r in records if r is not None]
+        if not rows or not self.enabled:
+            return
+        with self.lock:
+            conn = self._connection()
+            conn.executemany("""
+                INSERT INTO fetch_fingerprints (url, sha256, etag, last_modified, checked_at, changed_at)
+                VALUES (?1, ?2, ?3, ?4, datetime('now'), datetime('now'))
+                ON CONFLICT(url) DO UPDATE SET
+                    sha256 = excluded.sha256,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    checked_at = excluded.checked_at,
+                    changed_at = CASE WHEN ?5 THEN changed_at ELSE excluded.changed_at END
+            """, rows)
+            conn.commit()
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['requests']} pedidos condicionales: {s['not_modified']} 304, "
+                f"{s['same_hash']} sin cambios (mismo hash), {s['changed']} nuevos o cambiados")
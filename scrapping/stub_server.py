@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# stub_server.py
+# Servidor HTTP local que imita api.food.com para probar los crawlers sin
+# pegarle a la API real. Sirve páginas JSON grabadas (pagina_<pn>.json en
+# --dir) o, con --fake, páginas sintéticas. --error-rate simula 429/503.
+# También responde el feed de reviews (/recipes/<id>/feed/reviews), el de
+# actividad de cada usuario (/members/<id>/feed) y el detalle de cada receta
+# (/recipe/<slug>-<id>/as-json) con datos sintéticos.
+# Con --etags manda ETag y contesta 304 a los pedidos condicionales.
+#
+# Uso:
+#   python stub_server.py --fake 2000 --error-rate 0.05
+#   python fase1_recetas.py --async --url http://127.0.0.1:8765/sectionfront
+#   python fase3_review.py --pipeline --url "http://127.0.0.1:8765/recipes/{recipe_id}/feed/reviews"
+#   python crawler.py run --stub http://127.0.0.1:8765
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PORT = 8765
+RECIPES_PER_PAGE = 10
+
+def fake_page(page, total):
+    """Página con el mismo formato que sectionfront; vacía después de `total` recetas."""
+    first = (page - 1) * RECIPES_PER_PAGE
+    results = []
+    for i in range(first, min(first + RECIPES_PER_PAGE, total)):
+        rid = 100000 + i
+        results.append({
+            "recipe_id": rid,
+            "title": f"Stub recipe {rid}",
+            "description": "Receta de prueba",
+            "recipe_photo_url": f"https://img.example/{rid}.jpg",
+            "record_url": f"https://www.food.com/recipe/stub-{rid}",
+            "primary_category_name": "Stub",
+            "main_rating": 4.5,
+            "main_num_ratings": i % 50,
+            "recipe_preptime": 10,
+            "recipe_cooktime": 20,
+            "recipe_totaltime": 30,
+            "main_userid": i % 97,
+            "main_username": f"chef{i % 97}",
+        })
+    return {"response": {"results": results}}
+
+def fake_reviews(recipe_id, page, per_page=10):
+    """Feed de reviews con el formato de /external/v1/recipes/<id>/feed/reviews (entre 0 y 24 por receta)."""
+    total = recipe_id * 7 % 25
+    first = (page - 1) * per_page
+    items = [{
+        "id": recipe_id * 1000 + i,
+        "memberId": 500 + (recipe_id + i) % 300,
+        "memberName": f"user{(recipe_id + i) % 300}",
+        "rating": 1 + (recipe_id + i) % 5,
+        "counts": {"like": i % 3},
+        "submitted": "2024-01-01T00:00:00Z",
+        "text": f"Review {i} de la receta {recipe_id}",
+    } for i in range(first, min(first + per_page, total))]
+    return {"total": total, "data": {"items": items}}
+
+def fake_details(recipe_id):
+    """Detalle con el formato de /recipe/<slug>/as-json (ingredientes y pasos según el id)."""
+    return {
+        "recipe": {
+            "id": recipe_id,
+            "jsonLd": {"name": f"Stub recipe {recipe_id}", "description": "Receta de prueba",
+                       "prepTime": "PT10M", "cookTime": "PT20M", "totalTime": "PT30M",
+                       "author": f"chef{recipe_id % 97}", "image": f"https://img.example/{recipe_id}.jpg",
+                       "recipeCategory": "Stub", "keywords": "stub, prueba"},
+            "ingredients": [{"quantity": str(k + 1), "ingredText": f"$0$ número {k}",
+                             "hyperlinkFoodTextList": {"0": {"text": ["sugar", "flour", "eggs"][k % 3]}}}
+                            for k in range(3 + recipe_id % 8)],
+            "directions": [{"stepNum": k + 1, "stepText": f"Paso {k + 1}"} for k in range(2 + recipe_id % 5)],
+        },
+        "reviewFeed": {"total": recipe_id * 7 % 25},
+    }
+
+def fake_feed(user_id, page, size, extra=0):
+    """Feed de actividad de un usuario, de la más nueva a la más vieja; `extra` agrega actividades nuevas arriba."""
+    total = user_id % 45 + extra
+    items = []
+    for k in range(total - 1 - (page - 1) * size, max(-1, total - 1 - page * size), -1):
+        items.append({
+            "id": user_id * 1000 + k,
+            "type": "review" if k % 3 else "photo",
+            "submitted": f"2024-01-01T00:00:{k:02d}Z" if k < 60 else f"2024-01-01T00:{k // 60:02d}:{k % 60:02d}Z",
+            "memberName": f"user{user_id}",
+            "memberProfileUrl": f"https://www.food.com/user/{user_id}",
+            "memberAvatar": None,
+            "counts": {"like": k % 4},
+        })
+    data = {"items": items}
+    if page == 1:
+        data["user"] = {"createdOn": "2020-05-01", "followerCount": user_id % 11, "followingCount": user_id % 7}
+    return {"data": data}
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        args = self.server.args
+        if args.delay:
+            time.sleep(args.delay)
+        if random.random() < args.error_rate:
+            status = random.choice([429, 503])
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+
+        url = urlparse(self.path)
+        page = int(parse_qs(url.query).get("pn", ["1"])[0])
+        path = os.path.join(args.dir, f"pagina_{page}.json") if args.dir else None
+        partes = url.path.strip("/").split("/")
+        if len(partes) >= 4 and partes[-4] == "recipes" and partes[-2:] == ["feed", "reviews"]:
+            body = json.dumps(fake_reviews(int(partes[-3]), page)).encode()
+        elif len(partes) >= 3 and partes[-3] == "members" and partes[-1] == "feed":
+            size = int(parse_qs(url.query).get("size", ["20"])[0])
+            body = json.dumps(fake_feed(int(partes[-2]), page, size, args.feed_extra)).encode()
+        elif len(partes) >= 3 and partes[-3] == "recipe" and partes[-1] == "as-json":
+            body = json.dumps(fake_details(int(partes[-2].rsplit("-", 1)[-1]))).encode()
+        elif path and os.path.exists(path):
+            with open(path, "rb") as f:
+                body = f.read()
+        elif args.fake:
+            body = json.dumps(fake_page(page, args.fake)).encode()
+        else:
+            body = json.dumps({"response": {"results": []}}).encode()
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if args.etags and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if args.etags:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local de api.food.com para probar los crawlers")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--dir", help="carpeta con páginas grabadas (pagina_<pn>.json)")
+    parser.add_argument("--fake", type=int, default=0, help="cantidad de recetas sintéticas a servir")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="proporción de respuestas 429/503")
+    parser.add_argument("--feed-extra", type=int, default=0, help="actividades nuevas en el feed de cada usuario")
+    parser.add_argument("--etags", action="store_true", help="manda ETag y responde 304 a If-None-Match")
+    parser.add_argument("--delay", type=float, default=0.0, help="latencia simulada por pedido (segundos)")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.args = args
+    print(f"🧪 Stub escuchando en http://127.0.0.1:{args.port}/sectionfront")
+    server.serve_forever()